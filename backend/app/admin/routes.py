@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from admin import schemas
+from core.security import get_current_user_id, is_admin, _token_header
+from core.slow_queries import slow_query_log
+from database import get_db
+
+router = APIRouter()
+
+async def check_admin(db: AsyncSession, token: str):
+    current_user_id = await get_current_user_id(token, db)
+    if not await is_admin(db, current_user_id):
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+
+@router.get("/slow-queries", response_model=List[schemas.SlowQueryResponse])
+async def get_slow_queries(
+    limit: int = Query(50, ge=1),
+    db: AsyncSession = Depends(get_db),
+    token: str = _token_header
+):
+    await check_admin(db, token)
+    return slow_query_log.recent(limit)
+
+@router.delete("/slow-queries", response_model=dict)
+async def clear_slow_queries(db: AsyncSession = Depends(get_db), token: str = _token_header):
+    await check_admin(db, token)
+    slow_query_log.clear()
+    return {"message": "Slow query log cleared"}
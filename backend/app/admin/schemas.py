@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from typing import Optional, Union, List, Dict
+
+
+class SlowQueryResponse(BaseModel):
+    recorded_at: str
+    duration_ms: float
+    statement: str
+    # Type names of the bound parameters, their values are not kept
+    parameters: Optional[Union[List[str], Dict[str, str]]] = None
+    executemany: bool
+    route: Optional[str] = None
+    plan: Optional[str] = None
@@ -0,0 +1,43 @@
+import requests
+
+BASE_URL = "http://localhost:8001"
+
+def test_admin_a_preprocessing():
+    #Get admin ntoken
+    global admin_token
+    response = requests.post(f"{BASE_URL}/users/login", json={
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    assert response.status_code == 200
+    admin_token = response.json()["access_token"]
+
+def test_admin_b_slow_queries():
+    response = requests.get(f"{BASE_URL}/admin/slow-queries", params={"limit": 10},
+                            headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    assert len(response.json()) <= 10
+    for entry in response.json():
+        assert entry["statement"]
+        assert entry["duration_ms"] >= 0
+    response = requests.delete(f"{BASE_URL}/admin/slow-queries", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+
+def test_admin_c_slow_queries_not_admin():
+    response = requests.post(f"{BASE_URL}/users/", json={
+        "full_name": "User S",
+        "display_name": "userS",
+        "password": "passwordS",
+        "email": "userS@example.com"
+    })
+    assert response.status_code == 200
+    user_s_id = response.json()["id"]
+    response = requests.post(f"{BASE_URL}/users/login", json={
+        "email": "userS@example.com",
+        "password": "passwordS"
+    })
+    user_s_token = response.json()["access_token"]
+    response = requests.get(f"{BASE_URL}/admin/slow-queries", headers={"x-access-token": user_s_token})
+    assert response.status_code == 403
+    response = requests.delete(f"{BASE_URL}/users/{user_s_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
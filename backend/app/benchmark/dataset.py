@@ -0,0 +1,173 @@
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+from time import perf_counter
+from sqlalchemy import select, func, insert, update, text
+from book import models as book_models
+from book.crud import search_vector, recompute_facet_counts
+from book_review import models as review_models, crud as review_crud
+from user import models as user_models
+from core.security import get_password_hash
+
+# Password of every generated user, hashed once and shared so hashing does not dominate the load
+SYNTHETIC_PASSWORD = "password"
+GENRES = ["Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "History", "Biography",
+          "Poetry", "Horror", "Philosophy", "Travel", "Children", "Classics", "Science", "Economics"]
+WORDS = ["gripping", "slow", "moving", "clever", "dense", "charming", "dark", "witty", "uneven", "vivid",
+         "plot", "characters", "ending", "prose", "pacing", "world", "story", "dialogue", "twist", "style"]
+# Real reviews lean positive
+RATING_WEIGHTS = [5, 8, 17, 35, 35]
+# Reviews are spread uniformly over this many days before the generation time
+REVIEW_HISTORY_DAYS = 365
+
+
+def zipf_cum_weights(count: int, exponent: float) -> list:
+    """Returns the cumulative weights of ranks 1..count under a Zipf law, for `random.choices`."""
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def zipf_counts(total: int, count: int, exponent: float, cap: int) -> list:
+    """
+    Splits total between count ranks proportionally to a Zipf law, at most cap each.
+
+    Returns:
+        list: The share of each rank, most popular first. The sum is lower than total only
+        when the cap does not leave room for it.
+    """
+    weights = [1 / (rank ** exponent) for rank in range(1, count + 1)]
+    scale = total / sum(weights)
+    counts = [min(cap, int(weight * scale)) for weight in weights]
+    missing = total - sum(counts)
+    # Hand out the rounding remainder from the most popular rank down
+    while missing > 0:
+        room = False
+        for rank in range(count):
+            if missing == 0:
+                break
+            if counts[rank] < cap:
+                counts[rank] += 1
+                missing -= 1
+                room = True
+        if not room:
+            break
+    return counts
+
+
+def sample_users(rng: random.Random, users: list, cum_weights: list, count: int) -> set:
+    """Draws count distinct users, the popular ones more often."""
+    if count > len(users) // 4:
+        # Nearly every user reviews such a book, skewed sampling would only collide
+        return set(rng.sample(users, count))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(rng.choices(users, cum_weights=cum_weights, k=count - len(chosen)))
+    return chosen
+
+
+async def next_id(conn, model) -> int:
+    return ((await conn.execute(select(func.max(model.id)))).scalar() or 0) + 1
+
+
+async def load_rows(conn, table, columns: list, rows: list):
+    """Bulk loads rows, with COPY on Postgres and a multi-row INSERT elsewhere."""
+    if conn.dialect.name == "postgresql":
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(table.name, records=rows, columns=columns)
+    else:
+        await conn.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+
+async def reset_sequence(conn, table):
+    # Rows loaded with explicit ids do not advance the Postgres id sequence
+    if conn.dialect.name == "postgresql":
+        await conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), (SELECT MAX(id) FROM {table.name}))"))
+
+
+async def generate_dataset(conn, users: int, books: int, reviews: int, seed: int = 0, admins: int = 1,
+                           book_exponent: float = 1.1, user_exponent: float = 1.0, batch_size: int = 100000) -> dict:
+    """
+    Generates users, books and reviews with Zipf distributed review counts and bulk loads them.
+
+    Given the same seed and counts the generated rows are the same, offset by the ids already
+    in the tables and, for the review timestamps, by the time of generation. Popular books and
+    prolific reviewers get random ids rather than the lowest.
+
+    Args:
+        conn (AsyncConnection): A connection in a transaction, committed by the caller.
+        users (int): The number of users, all with the password SYNTHETIC_PASSWORD.
+        books (int): The number of books.
+        reviews (int): The number of reviews, at most one per user and book.
+        seed (int): The seed of the random generator.
+        admins (int): The number of generated users given the admin role.
+        book_exponent (float): The Zipf exponent of the reviews per book, higher is more skewed.
+        user_exponent (float): The Zipf exponent of the reviews per user.
+        batch_size (int): The number of rows per COPY or INSERT.
+
+    Returns:
+        dict: The number of rows generated per table.
+    """
+    rng = random.Random(seed)
+    started = perf_counter()
+    user_table, role_table = user_models.User.__table__, user_models.UserRole.__table__
+    book_table, review_table = book_models.Book.__table__, review_models.Review.__table__
+    first_user, first_book = await next_id(conn, user_models.User), await next_id(conn, book_models.Book)
+    first_review, first_role = await next_id(conn, review_models.Review), await next_id(conn, user_models.UserRole)
+
+    async def load_batches(table, columns, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                await load_rows(conn, table, columns, batch)
+                batch = []
+        if batch:
+            await load_rows(conn, table, columns, batch)
+        await reset_sequence(conn, table)
+        print(f"Loaded {table.name} in {perf_counter() - started:.1f}s")
+
+    password = get_password_hash(SYNTHETIC_PASSWORD)
+    user_ids = list(range(first_user, first_user + users))
+    await load_batches(user_table, ["id", "full_name", "display_name", "password", "email", "invalid_attempt",
+                                    "account_status"],
+                       ((user_id, f"Synthetic User {user_id}", f"reader{user_id}", password,
+                         f"reader{user_id}@synthetic.example.com", 0, True) for user_id in user_ids))
+    await load_batches(role_table, ["id", "user_id", "role"],
+                       ((first_role + number, user_id, "admin") for number, user_id in enumerate(user_ids[:admins])))
+
+    book_ids = list(range(first_book, first_book + books))
+    await load_batches(book_table, ["id", "title", "author", "genre", "year_published", "summary", "book_url"],
+                       ((book_id, f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {book_id}",
+                         f"Author {rng.randrange(max(books // 5, 1))}", rng.choice(GENRES),
+                         rng.randint(1900, 2024), f"A {rng.choice(WORDS)} {rng.choice(WORDS)} about a "
+                         f"{rng.choice(WORDS)} {rng.choice(WORDS)}.", f"https://example.com/books/{book_id}")
+                        for book_id in book_ids))
+    if conn.dialect.name == "postgresql":
+        await conn.execute(update(book_models.Book).where(book_models.Book.id >= first_book)
+                           .values(search_vector=search_vector(book_models.Book)))
+
+    # Rank books and users by popularity in a random order of ids
+    books_by_rank, users_by_rank = book_ids[:], user_ids[:]
+    rng.shuffle(books_by_rank)
+    rng.shuffle(users_by_rank)
+    user_weights = zipf_cum_weights(users, user_exponent)
+    review_counts = zipf_counts(reviews, books, book_exponent, users)
+
+    generated_at = datetime.utcnow()
+    history_seconds = REVIEW_HISTORY_DAYS * 86400
+
+    def review_rows():
+        review_id = first_review
+        for book_id, count in zip(books_by_rank, review_counts):
+            for user_id in sample_users(rng, users_by_rank, user_weights, count):
+                yield (review_id, book_id, user_id, f"{rng.choice(WORDS).title()} {rng.choice(WORDS)}, "
+                       f"{rng.choice(WORDS)} {rng.choice(WORDS)}.", rng.choices((1, 2, 3, 4, 5), RATING_WEIGHTS)[0],
+                       generated_at - timedelta(seconds=rng.random() * history_seconds))
+                review_id += 1
+
+    await load_batches(review_table, ["id", "book_id", "user_id", "review_text", "rating", "created_at"],
+                       review_rows())
+    await review_crud.recompute_rating_stats(conn)
+    await recompute_facet_counts(conn)
+    print(f"Rebuilt rating stats and facet counts in {perf_counter() - started:.1f}s")
+    return {"users": users, "admins": min(admins, users), "books": books, "reviews": sum(review_counts)}
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import random
+from collections import defaultdict
+from time import perf_counter
+import httpx
+from benchmark.scenarios import SCENARIOS, MIX_WEIGHTS, prepare
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    """Returns the percentile of sorted latencies in seconds, in milliseconds."""
+    return round(latencies[int(fraction * (len(latencies) - 1))] * 1000, 2) if latencies else 0.0
+
+
+class LatencyRecorder:
+    """Collects the latency and outcome of every request, by endpoint label."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, label: str, seconds: float, ok: bool):
+        self.latencies[label].append(seconds)
+        if not ok:
+            self.errors[label] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        """
+        Returns the throughput and latency percentiles of each endpoint and of all requests.
+
+        Args:
+            elapsed (float): The wall clock duration of the run, in seconds.
+        """
+        endpoints = {}
+        for label, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            endpoints[label] = {
+                "requests": len(latencies),
+                "errors": self.errors[label],
+                "rps": round(len(latencies) / elapsed, 2),
+                "p50": percentile(latencies, 0.5),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+            }
+        total = sum(endpoint["requests"] for endpoint in endpoints.values())
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "requests": total,
+            "errors": sum(self.errors.values()),
+            "rps": round(total / elapsed, 2),
+            "endpoints": endpoints,
+        }
+
+
+def recording_client(client, recorder: LatencyRecorder):
+    """
+    Returns the `call(label, method, url, **kwargs)` the scenarios send their requests with.
+
+    A request failing in transport is recorded as an error and gives None instead of raising,
+    so one failed request does not abort the run.
+    """
+    async def call(label, method, url, **kwargs):
+        started = perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            recorder.record(label, perf_counter() - started, False)
+            return None
+        recorder.record(label, perf_counter() - started, response.status_code < 400)
+        return response
+
+    return call
+
+
+async def run_benchmark(app, scenario: str = "mix", concurrency: int = 16, duration: float = 30.0,
+                        books: int = 500, seed: int = 0) -> dict:
+    """
+    Drives the ASGI app in process with concurrent virtual users running the scenarios.
+
+    The app's lifespan runs around the benchmark, so it uses the database of DATABASE_URL.
+    The benchmark creates its own accounts and books there, point it at a scratch database.
+
+    Args:
+        app: The ASGI application.
+        scenario (str): The name of one of the SCENARIOS, or "mix" for the weighted MIX_WEIGHTS.
+        concurrency (int): The number of virtual users sending requests at the same time.
+        duration (float): How long to run, in seconds.
+        books (int): The minimum number of books in the catalog.
+        seed (int): The seed of the scenario choices, so runs are comparable.
+
+    Returns:
+        dict: The summary of the run, see `LatencyRecorder.summary`.
+    """
+    recorder = LatencyRecorder()
+    if scenario == "mix":
+        names, weights = list(MIX_WEIGHTS), list(MIX_WEIGHTS.values())
+    else:
+        names, weights = [scenario], [1]
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            context = await prepare(client, books, concurrency)
+
+            call = recording_client(client, recorder)
+            async def virtual_user(worker: int, deadline: float):
+                rng = random.Random(seed * 1000 + worker)
+                while perf_counter() < deadline:
+                    await SCENARIOS[rng.choices(names, weights)[0]](call, context, rng, worker)
+
+            started = perf_counter()
+            deadline = started + duration
+            await asyncio.gather(*(virtual_user(worker, deadline) for worker in range(concurrency)))
+            elapsed = perf_counter() - started
+    summary = recorder.summary(elapsed)
+    summary.update(scenario=scenario, concurrency=concurrency)
+    return summary
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares a run with a baseline run of the same scenario.
+
+    Args:
+        summary (dict): The summary of the run.
+        baseline (dict): The stored summary of the baseline run.
+        tolerance (float): The accepted relative change, e.g. 0.1 for 10%.
+
+    Returns:
+        list: A description of every regression: an endpoint whose p95 latency grew or whose
+        throughput dropped by more than the tolerance, or which now returns errors.
+    """
+    regressions = []
+    for label, base in baseline["endpoints"].items():
+        current = summary["endpoints"].get(label)
+        if current is None:
+            regressions.append(f"{label}: not exercised by this run")
+            continue
+        if base["p95"] and current["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {current['p95']} ms, baseline {base['p95']} ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: {current['rps']} req/s, baseline {base['rps']} req/s")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{label}: {current['errors']} errors, baseline {base['errors']}")
+    return regressions
+
+
+def format_report(summary: dict, baseline: dict = None) -> str:
+    """Renders the summary as a table, with the change of p95 against the baseline if given."""
+    lines = [f"{'endpoint':<32} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+             f"{'p99 ms':>8}" + (f" {'p95 vs baseline':>16}" if baseline else "")]
+    for label, endpoint in summary["endpoints"].items():
+        line = (f"{label:<32} {endpoint['requests']:>8} {endpoint['errors']:>6} {endpoint['rps']:>9} "
+                f"{endpoint['p50']:>8} {endpoint['p95']:>8} {endpoint['p99']:>8}")
+        base = (baseline or {}).get("endpoints", {}).get(label)
+        if base and base["p95"]:
+            line += f" {(endpoint['p95'] / base['p95'] - 1) * 100:>+15.1f}%"
+        lines.append(line)
+    lines.append(f"{summary['requests']} requests, {summary['errors']} errors in {summary['elapsed_seconds']} s, "
+                 f"{summary['rps']} req/s")
+    return "\n".join(lines)
+
+
+def load_baseline(path: str) -> dict:
+    with open(path) as file_obj:
+        return json.load(file_obj)
+
+
+def save_summary(summary: dict, path: str):
+    with open(path, "w") as file_obj:
+        json.dump(summary, file_obj, indent=2)
@@ -0,0 +1,134 @@
+import random
+from typing import NamedTuple, List
+from sqlalchemy import select, func
+from book import models as book_models, bulk as book_bulk
+from user import crud as user_crud
+from user.schemas import UserCreate
+from database import SessionLocal
+from core.pagination import NEXT_CURSOR_HEADER
+
+BENCHMARK_PASSWORD = "benchmark-password"
+ADMIN_EMAIL = "benchmark-admin@example.com"
+
+
+def reviewer_email(number: int) -> str:
+    return f"benchmark-reviewer-{number}@example.com"
+
+
+class BenchmarkContext(NamedTuple):
+    """The accounts and books the scenarios work with, set up by `prepare`."""
+    admin_token: str
+    book_ids: List[int]
+    reviewer_emails: List[str]
+    reviewer_tokens: List[str]
+
+
+async def ensure_user(db, email: str, display_name: str, admin: bool = False):
+    if await user_crud.get_user_from_email(db, email) is not None:
+        return
+    db_user = await user_crud.create_user(db, UserCreate(
+        full_name=display_name, display_name=display_name, password=BENCHMARK_PASSWORD, email=email))
+    if admin:
+        await user_crud.add_user_role(db, db_user.id, "admin")
+
+
+async def seed_books(db, count: int):
+    """Imports generated books until the catalog holds at least count books."""
+    existing = (await db.execute(select(func.count(book_models.Book.id)))).scalar()
+
+    async def records():
+        for number in range(existing, count):
+            yield number + 1, {"title": f"Benchmark Book {number}", "author": f"Author {number % 500}",
+                               "genre": f"Genre {number % 20}", "year_published": 1900 + number % 125,
+                               "summary": f"Summary of benchmark book {number}"}
+
+    if existing < count:
+        await book_bulk.import_books(db, records())
+
+
+async def prepare(client, books: int, reviewers: int) -> BenchmarkContext:
+    """
+    Creates the benchmark admin, reviewers and books when missing, and logs them in.
+
+    Args:
+        client (httpx.AsyncClient): The client bound to the app.
+        books (int): The minimum number of books in the catalog.
+        reviewers (int): The number of reviewer accounts posting reviews.
+    """
+    emails = [reviewer_email(number) for number in range(reviewers)]
+    async with SessionLocal() as db:
+        await ensure_user(db, ADMIN_EMAIL, "benchmark-admin", admin=True)
+        for number, email in enumerate(emails):
+            await ensure_user(db, email, f"benchmark-reviewer-{number}")
+        await seed_books(db, books)
+        book_ids = list((await db.execute(select(book_models.Book.id).order_by(book_models.Book.id))).scalars())
+
+    async def login(email):
+        response = await client.post("/users/login", json={"email": email, "password": BENCHMARK_PASSWORD})
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    return BenchmarkContext(await login(ADMIN_EMAIL), book_ids, emails, [await login(email) for email in emails])
+
+
+# Each scenario is one user flow. `call(label, method, url, **kwargs)` sends a request,
+# records its latency under the label and returns the response, None when it failed in transport.
+
+async def browse(call, context: BenchmarkContext, rng: random.Random, worker: int):
+    """Opens the catalog and follows the cursor through the next pages."""
+    params = {"limit": 24}
+    for _ in range(rng.randint(1, 4)):
+        response = await call("GET /books/", "GET", "/books/", params=params)
+        cursor = response.headers.get(NEXT_CURSOR_HEADER) if response is not None else None
+        if not cursor:
+            return
+        params = {"limit": 24, "cursor": cursor}
+
+
+async def view_book(call, context: BenchmarkContext, rng: random.Random, worker: int):
+    """Opens a book page, which loads the book and its reviews."""
+    book_id = rng.choice(context.book_ids)
+    await call("GET /books/{book_id}", "GET", f"/books/{book_id}")
+    await call("GET /reviews/book/{book_id}", "GET", f"/reviews/book/{book_id}")
+
+
+async def login(call, context: BenchmarkContext, rng: random.Random, worker: int):
+    email = rng.choice(context.reviewer_emails)
+    await call("POST /users/login", "POST", "/users/login", json={"email": email, "password": BENCHMARK_PASSWORD})
+
+
+async def post_review(call, context: BenchmarkContext, rng: random.Random, worker: int):
+    """Posts a review and deletes it again, so the scenario can be repeated on any book."""
+    token = context.reviewer_tokens[worker % len(context.reviewer_tokens)]
+    book_id = rng.choice(context.book_ids)
+    response = await call("POST /reviews/", "POST", "/reviews/", headers={"x-access-token": token},
+                          json={"book_id": book_id, "review_text": "Benchmark review", "rating": rng.randint(1, 5)})
+    if response is not None and response.status_code == 200:
+        await call("DELETE /reviews/{review_id}", "DELETE", f"/reviews/{response.json()['id']}",
+                   headers={"x-access-token": token})
+
+
+async def admin_book_crud(call, context: BenchmarkContext, rng: random.Random, worker: int):
+    """Creates, updates, reads and deletes a book as the admin."""
+    headers = {"x-access-token": context.admin_token}
+    book = {"title": "Benchmark CRUD Book", "author": "Benchmark", "genre": "Benchmark", "year_published": 2024,
+            "summary": "Created by the benchmark", "book_url": "http://example.com/benchmark"}
+    response = await call("POST /books/", "POST", "/books/", headers=headers, json=book)
+    if response is None or response.status_code != 200:
+        return
+    book_id = response.json()["id"]
+    await call("PUT /books/{book_id}", "PUT", f"/books/{book_id}", headers=headers, json={**book, "year_published": 2025})
+    await call("GET /books/{book_id}", "GET", f"/books/{book_id}")
+    await call("DELETE /books/{book_id}", "DELETE", f"/books/{book_id}", headers=headers)
+
+
+SCENARIOS = {
+    "browse": browse,
+    "view_book": view_book,
+    "login": login,
+    "post_review": post_review,
+    "admin_book_crud": admin_book_crud,
+}
+
+# Share of each scenario in the default mix, read heavy like the real traffic
+MIX_WEIGHTS = {"browse": 40, "view_book": 40, "login": 5, "post_review": 10, "admin_book_crud": 5}
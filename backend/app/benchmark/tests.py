@@ -0,0 +1,65 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import httpx
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def endpoint(p95, rps, errors=0):
+    return {"requests": 100, "errors": errors, "rps": rps, "p50": p95 / 2, "p95": p95, "p99": p95 * 2}
+
+def test_benchmark_a_compare():
+    # Imported in the tests, the runner needs DATABASE_URL, which the API tests do not
+    from benchmark.runner import compare
+    baseline = {"endpoints": {"GET /books/": endpoint(10, 100), "GET /books/{book_id}": endpoint(5, 200)}}
+    # Within the tolerance
+    summary = {"endpoints": {"GET /books/": endpoint(11, 95), "GET /books/{book_id}": endpoint(5, 200)}}
+    assert compare(summary, baseline, 0.2) == []
+    summary = {"endpoints": {"GET /books/": endpoint(13, 70, errors=1)}}
+    regressions = compare(summary, baseline, 0.2)
+    assert len(regressions) == 4
+    assert "GET /books/{book_id}: not exercised by this run" in regressions
+
+def test_benchmark_b_transport_error():
+    from benchmark.runner import LatencyRecorder, recording_client
+
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    async def run():
+        recorder = LatencyRecorder()
+        async with httpx.AsyncClient(transport=httpx.MockTransport(refuse), base_url="http://benchmark") as client:
+            call = recording_client(client, recorder)
+            # A failed request is counted as an error instead of aborting the run
+            assert await call("GET /books/", "GET", "/books/") is None
+        return recorder.summary(1.0)
+
+    summary = asyncio.run(run())
+    assert summary["errors"] == 1
+    assert summary["endpoints"]["GET /books/"]["requests"] == 1
+
+def test_benchmark_c_regression_gate(tmp_path):
+    env = {**os.environ,
+           "DATABASE_URL": f"sqlite+aiosqlite:///{tmp_path / 'benchmark.db'}",
+           "STORAGE_BACKEND": "local",
+           "LOCAL_STORAGE_DIR": str(tmp_path / "media"),
+           "STORAGE_INDEX_FILE": ""}
+    command = [sys.executable, "manage.py", "benchmark", "--scenario", "view_book", "--duration", "1",
+               "--concurrency", "2", "--books", "10"]
+    output = tmp_path / "baseline.json"
+    result = subprocess.run(command + ["--output", str(output)], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    summary = json.loads(output.read_text())
+    assert summary["requests"] > 0 and summary["errors"] == 0
+
+    # A baseline ten times faster makes the run a regression
+    for base in summary["endpoints"].values():
+        base["rps"] *= 10
+    output.write_text(json.dumps(summary))
+    result = subprocess.run(command + ["--baseline", str(output)], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 1, result.stderr
+    assert "REGRESSION" in result.stdout
@@ -0,0 +1,175 @@
+import csv
+import json
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from book import models, schemas
+from book.crud import search_vector, add_facet_counts
+from book.leaderboards import leaderboards
+from book_review import models as review_models
+from core.response_cache import response_cache, BOOK_LIST_TAG
+
+# Formats accepted by the bulk import, by content type
+IMPORT_CONTENT_TYPES = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+# Per row errors reported back, beyond this only the count is kept
+MAX_REPORTED_ERRORS = 1000
+
+
+async def iter_lines(chunks):
+    """
+    Splits a stream of byte chunks into decoded text lines.
+
+    Args:
+        chunks: An async iterator of bytes, such as a request body stream.
+
+    Yields:
+        str: Each line without its line terminator.
+    """
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8-sig", errors="replace")
+    if pending:
+        yield pending.rstrip(b"\r").decode("utf-8-sig", errors="replace")
+
+
+class LineFeed:
+    """
+    Feeds buffered lines to a csv.reader, noting when the reader asks for more than were buffered,
+    which it only does while a quoted field is still open.
+    """
+
+    def __init__(self, lines: list):
+        self.lines = iter(lines)
+        self.starved = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.lines)
+        except StopIteration:
+            self.starved = True
+            raise
+
+
+async def iter_records(lines, fmt: str):
+    """
+    Parses CSV (with a header row) or NDJSON lines into records.
+
+    Yields:
+        tuple: The line number the record starts on, and either the record dict or the
+        parse error message.
+    """
+    header = None
+    pending, start = [], 1
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"Invalid JSON: {e}"
+                continue
+            yield line_number, record if isinstance(record, dict) else "Expected a JSON object"
+            continue
+        # csv decides where the record ends; a quoted field may span several lines
+        pending.append(line + "\n")
+        feed = LineFeed(pending)
+        reader = csv.reader(feed)
+        values = next(reader, [])
+        if feed.starved:
+            continue
+        record_start, start, pending = start, start + reader.line_num, []
+        if not values or (len(values) == 1 and not values[0].strip()):
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield record_start, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Empty cells count as missing so required columns are reported
+        yield record_start, {name: value for name, value in zip(header, values) if value != ""}
+    if pending:
+        yield start, "Unterminated quoted field"
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+async def insert_book_batch(db: AsyncSession, books: list) -> list:
+    """
+    Inserts validated books with one multi-row INSERT ... RETURNING and sets up their
+    rating aggregates, facet counts and search vectors, in the caller's transaction.
+
+    Returns:
+        list: The ids of the new books, in input order.
+    """
+    result = await db.execute(
+        insert(models.Book).returning(models.Book.id, sort_by_parameter_order=True),
+        [book.dict() for book in books]
+    )
+    ids = list(result.scalars())
+    await db.execute(insert(review_models.BookRatingStats), [{"book_id": book_id} for book_id in ids])
+    await add_facet_counts(db, [book.dict() for book in books])
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(
+            update(models.Book).where(models.Book.id.in_(ids)).values(search_vector=search_vector(models.Book))
+        )
+    return ids
+
+
+async def import_books(db: AsyncSession, records, batch_size: int = 1000) -> dict:
+    """
+    Validates streamed book records against BookCreate and inserts them in batches.
+
+    Each batch is committed on its own, so valid rows before a failure are kept.
+
+    Args:
+        db (AsyncSession): The database session.
+        records: An async iterator of (line number, record or error) as produced by `iter_records`.
+        batch_size (int): The number of rows per INSERT statement and transaction.
+
+    Returns:
+        dict: The imported and failed row counts and the per row errors.
+    """
+    summary = {"imported": 0, "failed": 0, "errors": []}
+
+    def fail(line_number, message):
+        summary["failed"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line_number, "error": message})
+
+    async def write_batch(batch):
+        ids = await insert_book_batch(db, batch)
+        await db.commit()
+        for book_id, book in zip(ids, batch):
+            leaderboards.set_book(book_id, book.genre)
+        summary["imported"] += len(batch)
+
+    batch = []
+    async for line_number, record in records:
+        if isinstance(record, str):
+            fail(line_number, record)
+            continue
+        try:
+            batch.append(schemas.BookCreate(**record))
+        except ValidationError as e:
+            fail(line_number, format_validation_error(e))
+            continue
+        if len(batch) >= batch_size:
+            await write_batch(batch)
+            batch = []
+    if batch:
+        await write_batch(batch)
+    if summary["imported"]:
+        response_cache.invalidate(BOOK_LIST_TAG)
+    return summary
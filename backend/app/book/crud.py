@@ -1,42 +1,360 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import func, text, case, or_, literal, literal_column, update, delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from collections import Counter
+from sqlalchemy.orm import selectinload
+from types import SimpleNamespace
+import re
 from book import models, schemas
 from fastapi import HTTPException
 from book_review import models as review_models
+from book.similarity import similarity_index
+from book.leaderboards import leaderboards
+from core.batch import id_in
+from core.pagination import encode_cursor, decode_cursor, keyset_filter, order_by_clause
+from core.response_cache import response_cache, book_tag, book_reviews_tag, BOOK_LIST_TAG
+
+# Sort keys accepted by GET /books/, each ending with the id as a unique tie breaker
+BOOK_SORT_COLUMNS = {
+    "id": [models.Book.id],
+    "title": [models.Book.title, models.Book.id],
+    "year_published": [models.Book.year_published, models.Book.id],
+}
+
+# Book columns that place a book in the facet rollups
+FACET_FIELDS = ["genre", "author", "year_published"]
+# Filters each facet ignores, so its other values stay selectable
+FACET_OWN_FILTERS = {"genre": ["genre"], "author": ["author"], "decade": ["year_min", "year_max"]}
+
+# Columns of the book list projections: the response fields and the rating aggregate
+BOOK_FIELDS = ["id", "title", "author", "genre", "year_published", "summary", "book_url", "cover_variants"]
+RATING_STATS_FIELDS = ["review_count", "rating_sum"] + [f"rating_{rating}" for rating in review_models.RATING_VALUES]
+
+# Text search configuration and per field weights (A ranks highest) of the search document
+SEARCH_CONFIG = "english"
+SEARCH_WEIGHTS = (("title", "A"), ("author", "B"), ("genre", "C"), ("summary", "D"))
+# Scores of the same weights for the LIKE fallback used outside Postgres
+LIKE_WEIGHT_SCORES = {"A": 8, "B": 4, "C": 2, "D": 1}
+
+def search_vector(book_db):
+    """
+    Builds the weighted tsvector expression of a book.
+
+    Given a Book instance the expression embeds its current field values; given the Book
+    class itself it refers to the columns, for set based updates.
+    """
+    vector = None
+    for field, weight in SEARCH_WEIGHTS:
+        # The weight is inlined as setweight() takes a "char" argument
+        part = func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(getattr(book_db, field), "")),
+                              literal_column(f"'{weight}'"))
+        vector = part if vector is None else vector.op("||")(part)
+    return vector
+
+async def backfill_search_vectors(db: AsyncSession, batch_size: int = 10000, only_missing: bool = True) -> int:
+    """
+    Fills the search vector of the books from their fields, one id range per transaction, for
+    the books written before the column existed or after SEARCH_WEIGHTS changed. Does nothing
+    outside Postgres, where search does not use the column.
+
+    Returns:
+        int: The number of books updated.
+    """
+    if db.bind.dialect.name != "postgresql":
+        return 0
+    book = models.Book
+    last_id = (await db.execute(select(func.max(book.id)))).scalar() or 0
+    updated = 0
+    for start in range(0, last_id, batch_size):
+        stmt = (update(book)
+                .where(book.id > start, book.id <= start + batch_size)
+                .values(search_vector=search_vector(book))
+                .execution_options(synchronize_session=False))
+        if only_missing:
+            stmt = stmt.where(book.search_vector.is_(None))
+        result = await db.execute(stmt)
+        await db.commit()
+        updated += result.rowcount
+    return updated
+
+def book_list_query():
+    """Selects the columns of BookResponse, without loading Book entities."""
+    stats = review_models.BookRatingStats
+    columns = [getattr(models.Book, field) for field in BOOK_FIELDS] + \
+        [getattr(stats, field) for field in RATING_STATS_FIELDS]
+    return select(*columns).outerjoin(stats, stats.book_id == models.Book.id)
+
+def book_row_to_dict(row) -> dict:
+    """Builds the BookResponse shaped dict of a row selected by `book_list_query`."""
+    book = {field: getattr(row, field) for field in BOOK_FIELDS}
+    book["rating_stats"] = None
+    if row.review_count is not None:
+        book["rating_stats"] = {
+            "review_count": row.review_count,
+            "average_rating": review_models.average_rating(row.rating_sum, row.review_count),
+            "histogram": {str(rating): getattr(row, f"rating_{rating}") for rating in review_models.RATING_VALUES},
+        }
+    return book
+
+def catalog_conditions(model, genre: str = None, author: str = None, year_min: int = None,
+                       year_max: int = None) -> list:
+    """
+    Builds the catalog filter conditions on a model with genre, author and year_published
+    columns, the books or their facet rollup.
+    """
+    conditions = []
+    if genre is not None:
+        conditions.append(model.genre == genre)
+    if author is not None:
+        conditions.append(model.author == author)
+    if year_min is not None:
+        conditions.append(model.year_published >= year_min)
+    if year_max is not None:
+        conditions.append(model.year_published <= year_max)
+    return conditions
+
+def decade_of(year: int) -> int:
+    """Returns the decade of a year, truncating toward zero like the integer division of the databases."""
+    return int(year / 10) * 10
+
+def facet_rollups() -> dict:
+    """
+    Returns the facet rollups, each with the columns of its key: genres by year, and authors by
+    genre and decade. The keys are given as Book column expressions by rollup column name.
+    """
+    book = models.Book
+    return {
+        models.BookGenreYearCount: {"genre": book.genre, "year_published": book.year_published},
+        models.BookAuthorCount: {"author": book.author, "genre": book.genre,
+                                 "decade": (book.year_published // 10) * 10},
+    }
+
+def facet_keys(books) -> dict:
+    """
+    Counts book dicts per key of each facet rollup, skipping books with a facet field missing.
+
+    Returns:
+        dict: A Counter of key tuples (in `facet_rollups` column order) by rollup model.
+    """
+    counts = {rollup: Counter() for rollup in facet_rollups()}
+    for book in books:
+        if any(book.get(field) is None for field in FACET_FIELDS):
+            continue
+        values = {**book, "decade": decade_of(book["year_published"])}
+        for rollup, columns in facet_rollups().items():
+            counts[rollup][tuple(values[name] for name in columns)] += 1
+    return counts
+
+async def add_facet_counts(db: AsyncSession, books):
+    """
+    Adds books to the facet rollups, in the caller's transaction.
+
+    Args:
+        db (AsyncSession): The database session.
+        books: The book dicts added, with their genre, author and year_published.
+    """
+    dialect = db.bind.dialect.name
+    for rollup, counts in facet_keys(books).items():
+        names = list(facet_rollups()[rollup])
+        rows = [dict(zip(names, key), book_count=count) for key, count in counts.items()]
+        if not rows:
+            continue
+        if dialect in ("postgresql", "sqlite"):
+            stmt = (postgresql if dialect == "postgresql" else sqlite).insert(rollup)
+            stmt = stmt.on_conflict_do_update(index_elements=names,
+                                              set_={"book_count": rollup.book_count + stmt.excluded.book_count})
+            await db.execute(stmt, rows)
+            continue
+        for row in rows:
+            result = await db.execute(
+                update(rollup).where(*[getattr(rollup, name) == row[name] for name in names])
+                .values(book_count=rollup.book_count + row["book_count"])
+            )
+            if result.rowcount == 0:
+                await db.execute(insert(rollup).values(row))
+
+async def remove_facet_counts(db: AsyncSession, books):
+    """Removes book dicts, with their values as stored, from the facet rollups in the caller's transaction."""
+    for rollup, counts in facet_keys(books).items():
+        names = list(facet_rollups()[rollup])
+        for key, count in counts.items():
+            await db.execute(
+                update(rollup).where(*[getattr(rollup, name) == value for name, value in zip(names, key)])
+                .values(book_count=rollup.book_count - count)
+            )
+
+async def stored_facet_values(db: AsyncSession, book_id: int):
+    """
+    Returns the facet fields of a book as stored, as a dict, None when the book does not exist.
+
+    The book row stays locked until the caller's transaction ends, so a concurrent edit of the
+    same book waits and then reads the values this one writes, keeping the rollups consistent.
+    """
+    book = models.Book
+    result = await db.execute(
+        select(*[getattr(book, field) for field in FACET_FIELDS]).where(book.id == book_id).with_for_update()
+    )
+    row = result.first()
+    return None if row is None else dict(row._mapping)
+
+async def recompute_facet_counts(db) -> int:
+    """
+    Rebuilds the facet rollups from the books table.
+
+    Returns:
+        int: The number of facet keys, over both rollups.
+    """
+    book = models.Book
+    keys = 0
+    for rollup, columns in facet_rollups().items():
+        query = (select(*columns.values(), func.count(book.id))
+                 .where(*[getattr(book, field).isnot(None) for field in FACET_FIELDS])
+                 .group_by(*columns.values()))
+        await db.execute(delete(rollup))
+        result = await db.execute(insert(rollup).from_select(list(columns) + ["book_count"], query))
+        keys += result.rowcount
+    return keys
+
+async def ensure_facet_counts(db) -> bool:
+    """Builds the facet rollups when one is empty but books exist, e.g. on a database predating it."""
+    if (await db.execute(select(models.Book.id).limit(1))).first() is None:
+        return False
+    for rollup in facet_rollups():
+        if (await db.execute(select(rollup.book_count).limit(1))).first() is None:
+            await recompute_facet_counts(db)
+            return True
+    return False
+
+def facet_source(filters: dict, facet: str = None):
+    """
+    Picks what counts the books matching the catalog filters, grouped by a facet or, without one,
+    in total. Every combination is exact:
+
+    - Without an author filter or facet, the genre and year rollup answers the genre, year and
+      decade filters.
+    - Otherwise the author rollup answers when the year filters fall on decade boundaries
+      (`year_min` 1990, `year_max` 1999), as the decade facet values do.
+    - Other year ranges combined with authors are counted from the matching books, through the
+      author index when an author is selected.
+
+    Returns:
+        tuple: The count expression, the grouping expression of each facet and the filter conditions.
+    """
+    if facet != "author" and filters["author"] is None:
+        rollup = models.BookGenreYearCount
+        return (func.sum(rollup.book_count),
+                {"genre": rollup.genre, "decade": (rollup.year_published // 10) * 10},
+                catalog_conditions(rollup, **filters))
+    year_min, year_max = filters["year_min"], filters["year_max"]
+    if (year_min is None or year_min % 10 == 0) and (year_max is None or year_max % 10 == 9):
+        rollup = models.BookAuthorCount
+        conditions = catalog_conditions(rollup, genre=filters["genre"], author=filters["author"])
+        if year_min is not None:
+            conditions.append(rollup.decade >= year_min)
+        if year_max is not None:
+            conditions.append(rollup.decade <= year_max)
+        return (func.sum(rollup.book_count),
+                {"genre": rollup.genre, "author": rollup.author, "decade": rollup.decade},
+                conditions)
+    book = models.Book
+    return (func.count(book.id),
+            {"genre": book.genre, "author": book.author, "decade": (book.year_published // 10) * 10},
+            catalog_conditions(book, **filters))
+
+async def get_facets(db: AsyncSession, limit: int = 20, genre: str = None, author: str = None,
+                     year_min: int = None, year_max: int = None) -> dict:
+    """
+    Counts the books per genre, author and decade from the facet rollups, see `facet_source`.
+
+    The counts of each facet apply every filter but its own, so they show how many books
+    selecting another value would give; `total` applies them all.
+
+    Returns:
+        dict: The total and, per facet, up to limit values with their counts, most books first.
+    """
+    filters = {"genre": genre, "author": author, "year_min": year_min, "year_max": year_max}
+    facets = {}
+    count, _, conditions = facet_source(filters)
+    result = await db.execute(select(func.coalesce(count, 0)).where(*conditions))
+    facets["total"] = result.scalar()
+    for name, own_filters in FACET_OWN_FILTERS.items():
+        other_filters = {key: None if key in own_filters else filter_value for key, filter_value in filters.items()}
+        count, values, conditions = facet_source(other_filters, name)
+        value = values[name]
+        result = await db.execute(
+            select(value.label("value"), count.label("count"))
+            .where(*conditions)
+            .group_by(value).having(count > 0)
+            .order_by(count.desc(), value).limit(limit)
+        )
+        facets[name] = [{"value": row.value, "count": row.count} for row in result]
+    return facets
 
 async def create_book(db: AsyncSession, book: schemas.BookCreate, current_user_id: int):
     new_book = models.Book(**book.dict())
+    if db.bind.dialect.name == "postgresql":
+        new_book.search_vector = search_vector(new_book)
     db.add(new_book)
+    await db.flush()
+    # Start the rating aggregate at zero so review writes only ever update it
+    db.add(review_models.BookRatingStats(book_id=new_book.id))
+    await add_facet_counts(db, [book.dict()])
     await db.commit()
+    response_cache.invalidate(BOOK_LIST_TAG)
     await db.refresh(new_book)
+    leaderboards.set_book(new_book.id, new_book.genre)
     return new_book
 
 async def update_book(db: AsyncSession, book_id: int, book: schemas.BookUpdate, current_user_id: int):
-    # Verify the book exists
-    result = await db.execute(select(models.Book).filter(models.Book.id == book_id))
+    values = book.dict(exclude_unset=True)
+    if db.bind.dialect.name == "postgresql":
+        # Fields left out of the update keep their current column value
+        fields = {field: values.get(field, getattr(models.Book, field)) for field, _ in SEARCH_WEIGHTS}
+        values["search_vector"] = search_vector(SimpleNamespace(**fields))
+    moves_facets = any(field in values for field in FACET_FIELDS)
+    if moves_facets:
+        stored = await stored_facet_values(db, book_id)
+        if stored is not None:
+            await remove_facet_counts(db, [stored])
+    # Update and return the book in one statement, its rating aggregate is loaded by primary key
+    result = await db.execute(
+        update(models.Book).where(models.Book.id == book_id).values(values)
+        .returning(models.Book).options(selectinload(models.Book.rating_stats))
+    )
     book_db = result.scalars().first()
     if not book_db:
         raise HTTPException(status_code=404, detail="Book not found")
-    # Update the book details
-    for key, value in book.dict(exclude_unset=True).items():
-        setattr(book_db, key, value)
+    # Serialized before the commit expires the loaded attributes
+    updated_book = schemas.BookResponse.from_orm(book_db)
+    if moves_facets:
+        await add_facet_counts(db, [updated_book.dict()])
     await db.commit()
-    await db.refresh(book_db)
-    return book_db
+    response_cache.invalidate(book_tag(book_id), BOOK_LIST_TAG)
+    if "genre" in values:
+        leaderboards.set_book(book_id, updated_book.genre)
+    return updated_book
 
 async def delete_book(db: AsyncSession, book_id: int, current_user_id: int):
-    # Verify the book exists
-    result = await db.execute(select(models.Book).filter(models.Book.id == book_id))
+    # Verify the book exists, locking it so its facet values cannot change before it is removed
+    result = await db.execute(select(models.Book).filter(models.Book.id == book_id).with_for_update(of=models.Book))
     book_db = result.scalars().first()
     if not book_db:
         raise HTTPException(status_code=404, detail="Book not found")
-    # Delete all reviews associated with the book
+    await remove_facet_counts(db, [{field: getattr(book_db, field) for field in FACET_FIELDS}])
+    # Delete all reviews associated with the book along with their rating aggregate
     await db.execute(
         review_models.Review.__table__.delete().where(review_models.Review.book_id == book_id)
     )
+    await db.execute(
+        review_models.BookRatingStats.__table__.delete().where(review_models.BookRatingStats.book_id == book_id)
+    )
     # Delete book
     await db.delete(book_db)
     await db.commit()
+    response_cache.invalidate(book_tag(book_id), book_reviews_tag(book_id), BOOK_LIST_TAG)
+    similarity_index.remove_book(book_id)
+    leaderboards.remove_book(book_id)
     return {"message": "Book deleted successfully"}
 
 async def get_book(db: AsyncSession, book_id: int):
@@ -46,6 +364,137 @@ async def get_book(db: AsyncSession, book_id: int):
         raise HTTPException(status_code=404, detail="Book not found")
     return book_db
 
-async def get_books(db: AsyncSession, skip: int = 0, limit: int = 100):
-    result = await db.execute(select(models.Book).offset(skip).limit(limit))
-    return result.scalars().all()
+async def get_books(db: AsyncSession, skip: int = 0, limit: int = 100, sort: str = "id",
+                    order: str = "asc", cursor: str = None, genre: str = None, author: str = None,
+                    year_min: int = None, year_max: int = None):
+    """
+    Returns a page of books in a stable order, as BookResponse shaped dicts, along with
+    the cursor of the next page.
+
+    When a cursor is given the page is located with a keyset condition on the sort key,
+    so every page costs the same index range scan; `skip` is only honoured without a cursor.
+    The genre, author and year range filters are combined with AND.
+    """
+    columns = BOOK_SORT_COLUMNS[sort]
+    query = (book_list_query()
+             .filter(*catalog_conditions(models.Book, genre, author, year_min, year_max))
+             .order_by(*order_by_clause(columns, order)))
+    if cursor:
+        query = query.filter(keyset_filter(columns, decode_cursor(cursor, sort, order), order))
+    elif skip:
+        query = query.offset(skip)
+    # Fetch one extra row to know whether another page exists
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, order, [getattr(last, column.key) for column in columns])
+    return [book_row_to_dict(row) for row in rows], next_cursor
+
+async def get_similar_books(db: AsyncSession, book_id: int, limit: int = 10) -> list:
+    """
+    Returns the books most similar to a book according to the reviews, as SimilarBookResponse
+    shaped dicts, best first. Books without reviews in common with others have none.
+    """
+    neighbours = similarity_index.similar(book_id, limit)
+    # The book itself is fetched along to tell a missing book from one without neighbours
+    result = await db.execute(
+        book_list_query().filter(id_in(models.Book.id, [book_id] + [neighbour for neighbour, _ in neighbours],
+                                       db.bind.dialect.name))
+    )
+    books = {row.id: book_row_to_dict(row) for row in result}
+    if book_id not in books:
+        raise HTTPException(status_code=404, detail="Book not found")
+    # Books deleted since the last index update are skipped
+    return [{**books[neighbour], "similarity": score} for neighbour, score in neighbours if neighbour in books]
+
+async def get_books_by_ids(db: AsyncSession, ids: list) -> dict:
+    """
+    Looks up books by id in one query.
+
+    Returns:
+        dict: The found books as BookResponse shaped dicts, in the order of ids, and the ids
+        without a book, as a BookBatchResponse.
+    """
+    result = await db.execute(book_list_query().filter(id_in(models.Book.id, ids, db.bind.dialect.name)))
+    books = {row.id: book_row_to_dict(row) for row in result}
+    return {"books": [books[book_id] for book_id in ids if book_id in books],
+            "missing": [book_id for book_id in ids if book_id not in books]}
+
+async def get_ranked_books(db: AsyncSession, ranked: list) -> list:
+    """
+    Returns the books of a leaderboard, a list of (book id, score) pairs, as RankedBookResponse
+    shaped dicts in the same order. Books deleted since the last update are skipped.
+    """
+    if not ranked:
+        return []
+    result = await db.execute(
+        book_list_query().filter(id_in(models.Book.id, [book_id for book_id, _ in ranked], db.bind.dialect.name))
+    )
+    books = {row.id: book_row_to_dict(row) for row in result}
+    return [{**books[book_id], "score": score} for book_id, score in ranked if book_id in books]
+
+async def get_top_books(db: AsyncSession, genre: str = None, limit: int = 10) -> list:
+    """Returns the top rated books, overall or of a genre, by their Bayesian average rating."""
+    return await get_ranked_books(db, leaderboards.top(genre, limit))
+
+async def get_trending_books(db: AsyncSession, genre: str = None, limit: int = 10) -> list:
+    """Returns the trending books, overall or of a genre, by their time decayed count of recent reviews."""
+    return await get_ranked_books(db, leaderboards.trending_books(genre, limit))
+
+async def count_books(db: AsyncSession, mode: str = "exact", genre: str = None, author: str = None,
+                      year_min: int = None, year_max: int = None) -> int:
+    """
+    Counts the books matching the catalog filters.
+
+    An approximate count of the whole catalog uses the planner statistics on Postgres, and an
+    approximate filtered count is read like the facet totals, see `facet_source`.
+    """
+    filters = {"genre": genre, "author": author, "year_min": year_min, "year_max": year_max}
+    filtered = any(value is not None for value in filters.values())
+    if mode == "approximate" and filtered:
+        count, _, conditions = facet_source(filters)
+        result = await db.execute(select(func.coalesce(count, 0)).where(*conditions))
+        return result.scalar()
+    if mode == "approximate" and db.bind.dialect.name == "postgresql":
+        result = await db.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'books'::regclass"))
+        estimate = result.scalar()
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if estimate is not None and estimate >= 0:
+            return estimate
+    result = await db.execute(select(func.count()).select_from(models.Book)
+                              .where(*catalog_conditions(models.Book, **filters)))
+    return result.scalar()
+
+async def search_books(db: AsyncSession, q: str, skip: int = 0, limit: int = 20):
+    """
+    Returns the books matching every term of the query, best matches first, as BookResponse
+    shaped dicts.
+
+    Each term is matched as a prefix. On Postgres the query runs against the GIN indexed
+    search vector and is ranked with ts_rank_cd; other databases fall back to a weighted
+    LIKE scan so the endpoint behaves the same in local setups.
+    """
+    terms = re.findall(r"\w+", q.lower())
+    if not terms:
+        return []
+    if db.bind.dialect.name == "postgresql":
+        ts_query = func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+        rank = func.ts_rank_cd(models.Book.search_vector, ts_query)
+        query = book_list_query().filter(models.Book.search_vector.op("@@")(ts_query))
+    else:
+        rank = literal(0)
+        query = book_list_query()
+        for term in terms:
+            term_matches = []
+            for field, weight in SEARCH_WEIGHTS:
+                column = getattr(models.Book, field)
+                matches = or_(column.ilike(f"{term}%"), column.ilike(f"% {term}%"))
+                term_matches.append(matches)
+                rank = rank + case((matches, LIKE_WEIGHT_SCORES[weight]), else_=0)
+            query = query.filter(or_(*term_matches))
+    query = query.order_by(rank.desc(), models.Book.id).offset(skip).limit(limit)
+    result = await db.execute(query)
+    return [book_row_to_dict(row) for row in result]
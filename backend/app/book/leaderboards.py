@@ -0,0 +1,333 @@
+import asyncio
+import logging
+import math
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from time import monotonic, perf_counter, time
+from sqlalchemy import func
+from sqlalchemy.future import select
+from book import models
+from book_review import models as review_models
+from database import read_session
+from core.config import LEADERBOARD_PRIOR_REVIEWS, TRENDING_HALF_LIFE_HOURS, TRENDING_WINDOW_DAYS, \
+    LEADERBOARD_REBUILD_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Prior mean of the Bayesian average before any review exists, the middle of the rating scale
+DEFAULT_PRIOR_MEAN = 3.0
+
+
+def timestamp(created_at: datetime) -> float:
+    """Converts a review timestamp, naive UTC as stored, to seconds since the epoch."""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.timestamp()
+
+
+class RankedList:
+    """
+    Items ordered by decreasing score, ties by increasing item.
+
+    The (-score, item) keys are kept sorted in blocks of about BLOCK_SIZE, so an update shifts
+    one block rather than the whole list, and reading the first n items costs O(n) however many
+    items there are.
+    """
+
+    BLOCK_SIZE = 512
+
+    def __init__(self, scores: dict = None):
+        self.keys = {}
+        self.blocks = []
+        # Last key of each block, to find the block a key belongs to
+        self.maxes = []
+        if scores:
+            ordered = sorted([(-score, item) for item, score in scores.items()])
+            self.keys = {key[1]: key for key in ordered}
+            self.blocks = [ordered[start:start + self.BLOCK_SIZE] for start in range(0, len(ordered), self.BLOCK_SIZE)]
+            self.maxes = [block[-1] for block in self.blocks]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set(self, item, score: float):
+        self.remove(item)
+        key = (-score, item)
+        self.keys[item] = key
+        if not self.blocks:
+            self.blocks.append([key])
+            self.maxes.append(key)
+            return
+        index = min(bisect_left(self.maxes, key), len(self.blocks) - 1)
+        block = self.blocks[index]
+        insort(block, key)
+        self.maxes[index] = block[-1]
+        if len(block) > 2 * self.BLOCK_SIZE:
+            self.blocks[index:index + 1] = [block[:self.BLOCK_SIZE], block[self.BLOCK_SIZE:]]
+            self.maxes[index:index + 1] = [block[self.BLOCK_SIZE - 1], block[-1]]
+
+    def remove(self, item):
+        key = self.keys.pop(item, None)
+        if key is None:
+            return
+        index = bisect_left(self.maxes, key)
+        block = self.blocks[index]
+        del block[bisect_left(block, key)]
+        if block:
+            self.maxes[index] = block[-1]
+        else:
+            del self.blocks[index]
+            del self.maxes[index]
+
+    def first(self, limit: int) -> list:
+        """Returns up to limit (item, score) pairs, highest score first."""
+        items = []
+        for block in self.blocks:
+            for score, item in block[:limit - len(items)]:
+                items.append((item, -score))
+            if len(items) >= limit:
+                break
+        return items
+
+
+class Leaderboards:
+    """
+    The top rated and trending books, overall and per genre, kept in memory.
+
+    Top rated books are ranked by their Bayesian average: the mean of their ratings and of
+    prior_reviews virtual reviews at the mean rating of all books, so a book with a handful of
+    perfect ratings does not outrank one with hundreds of excellent ones.
+
+    Trending books are ranked by their review velocity: every review in the window counts with a
+    weight halving every half_life_seconds. The weights are stored relative to a fixed epoch,
+    exp(decay * (reviewed_at - epoch)), so the passing of time scales every score alike and the
+    order never needs a rescan; only the returned scores are decayed to the current time.
+
+    The rankings are built from the book rating aggregates and the recent reviews at startup and
+    then periodically, and updated in between by the book and review write paths of this
+    process. Writes served by other worker processes show up at the next rebuild.
+    """
+
+    def __init__(self, prior_reviews: float, half_life_seconds: float, window_seconds: float, rebuild_seconds: float):
+        self.prior_reviews = prior_reviews
+        self.decay = math.log(2) / half_life_seconds
+        self.window_seconds = window_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.prior_mean = DEFAULT_PRIOR_MEAN
+        self.epoch = time()
+        self.window_start = self.epoch - window_seconds
+        # book id -> [genre, review count, rating sum, trending weight, trending reviews]
+        self.books = {}
+        # genre (None for every book) -> ranked list
+        self.top_rated = {None: RankedList()}
+        self.trending = {None: RankedList()}
+        # Updates recorded while a rebuild is loading, replayed on the rebuilt rankings
+        self.replay = None
+
+    def bayesian_average(self, review_count: int, rating_sum: int) -> float:
+        return (self.prior_mean * self.prior_reviews + rating_sum) / (self.prior_reviews + review_count)
+
+    def top(self, genre: str = None, limit: int = 10) -> list:
+        """Returns up to limit (book id, Bayesian average) pairs of the top rated books, best first."""
+        ranking = self.top_rated.get(genre)
+        return [(book_id, round(score, 2)) for book_id, score in ranking.first(limit)] if ranking else []
+
+    def trending_books(self, genre: str = None, limit: int = 10) -> list:
+        """Returns up to limit (book id, decayed review count) pairs of the trending books, hottest first."""
+        ranking = self.trending.get(genre)
+        if not ranking:
+            return []
+        scale = math.exp(-self.decay * (time() - self.epoch))
+        return [(book_id, round(weight * scale, 2)) for book_id, weight in ranking.first(limit)]
+
+    def set_book(self, book_id: int, genre: str = None):
+        """Records a created book, or a book's new genre."""
+        self._record("set_book", book_id, genre)
+        entry = self.books.get(book_id)
+        if entry is None:
+            self.books[book_id] = [genre, 0, 0, 0.0, 0]
+            return
+        if entry[0] == genre:
+            return
+        self._unrank(book_id, entry)
+        entry[0] = genre
+        self._rank(book_id, entry)
+
+    def remove_book(self, book_id: int):
+        """Records a deleted book."""
+        self._record("remove_book", book_id)
+        entry = self.books.pop(book_id, None)
+        if entry is not None:
+            self._unrank(book_id, entry)
+
+    def set_rating(self, book_id: int, review_count: int, rating_sum: int):
+        """Records a book's new rating aggregate, after a review was written, re-rated or deleted."""
+        self._record("set_rating", book_id, review_count, rating_sum)
+        entry = self._entry(book_id)
+        entry[1], entry[2] = review_count, rating_sum
+        self._rank_top(book_id, entry)
+
+    def add_review(self, book_id: int, review_id: int, reviewed_at: float):
+        """Records a review written at the reviewed_at timestamp."""
+        self._record("add_review", book_id, review_id, reviewed_at)
+        self._add_weight(self._entry(book_id), book_id, reviewed_at, 1)
+
+    def remove_review(self, book_id: int, review_id: int, reviewed_at: float = None):
+        """Records a deleted review, written at the reviewed_at timestamp if known."""
+        self._record("remove_review", book_id, review_id, reviewed_at)
+        entry = self.books.get(book_id)
+        # Reviews without a timestamp or older than the window were never counted
+        if entry is not None and reviewed_at is not None and reviewed_at >= self.window_start:
+            self._add_weight(entry, book_id, reviewed_at, -1)
+
+    def _record(self, method: str, *args):
+        if self.replay is not None:
+            self.replay.append((method, args))
+
+    def _entry(self, book_id: int) -> list:
+        # A book created by another worker process, ranked only overall until the next rebuild
+        return self.books.setdefault(book_id, [None, 0, 0, 0.0, 0])
+
+    def _add_weight(self, entry: list, book_id: int, reviewed_at: float, sign: int):
+        entry[3] += sign * math.exp(self.decay * (reviewed_at - self.epoch))
+        entry[4] += sign
+        if entry[4] <= 0:
+            entry[3], entry[4] = 0.0, 0
+        self._rank_trending(book_id, entry)
+
+    def _rank(self, book_id: int, entry: list):
+        self._rank_top(book_id, entry)
+        self._rank_trending(book_id, entry)
+
+    def _rank_top(self, book_id: int, entry: list):
+        score = self.bayesian_average(entry[1], entry[2]) if entry[1] > 0 else None
+        self._place(self.top_rated, entry[0], book_id, score)
+
+    def _rank_trending(self, book_id: int, entry: list):
+        self._place(self.trending, entry[0], book_id, entry[3] if entry[4] > 0 else None)
+
+    @staticmethod
+    def _place(rankings: dict, genre: str, book_id: int, score: float = None):
+        # Sets the book's score, or removes it without one, overall and in its genre
+        for key in (None, genre) if genre is not None else (None,):
+            ranking = rankings.get(key)
+            if ranking is None:
+                if score is None:
+                    continue
+                ranking = rankings[key] = RankedList()
+            if score is None:
+                ranking.remove(book_id)
+            else:
+                ranking.set(book_id, score)
+
+    def _unrank(self, book_id: int, entry: list):
+        for rankings in (self.top_rated, self.trending):
+            self._place(rankings, entry[0], book_id)
+
+    def build(self, books: list, reviews: list, now: float):
+        """
+        Builds the rankings from scratch.
+
+        Args:
+            books (list): One (book id, genre, review count, rating sum) row per book.
+            reviews (list): One (review id, book id, created_at) row per review of the window.
+            now (float): The time the rows were read at, the new epoch of the trending weights.
+        """
+        entries = {book_id: [genre, review_count, rating_sum, 0.0, 0]
+                   for book_id, genre, review_count, rating_sum in books}
+        total_count = sum(entry[1] for entry in entries.values())
+        prior_mean = sum(entry[2] for entry in entries.values()) / total_count if total_count else DEFAULT_PRIOR_MEAN
+        # Ages are taken between naive UTC datetimes, cheaper than a timestamp per review
+        epoch = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        decay = self.decay
+        for _, book_id, created_at in reviews:
+            entry = entries.get(book_id)
+            if entry is not None:
+                entry[3] += math.exp(decay * (created_at - epoch).total_seconds())
+                entry[4] += 1
+        prior = prior_mean * self.prior_reviews
+        top_scores = {book_id: (prior + entry[2]) / (self.prior_reviews + entry[1])
+                      for book_id, entry in entries.items() if entry[1] > 0}
+        trending_scores = {book_id: entry[3] for book_id, entry in entries.items() if entry[4] > 0}
+        return entries, prior_mean, (self.by_genre(entries, top_scores), self.by_genre(entries, trending_scores))
+
+    @staticmethod
+    def by_genre(entries: dict, scores: dict) -> dict:
+        """Builds the overall and per genre rankings of book scores."""
+        genres = {None: scores}
+        for book_id, score in scores.items():
+            genre = entries[book_id][0]
+            if genre is not None:
+                genres.setdefault(genre, {})[book_id] = score
+        return {genre: RankedList(genre_scores) for genre, genre_scores in genres.items()}
+
+    def apply_replay(self, replay: list, counted: set):
+        """
+        Applies the updates recorded while a rebuild was loading to the rebuilt rankings.
+
+        Rating aggregates are absolute and simply set again, but a review the load already
+        counted must not be added twice, nor a review it never counted be removed.
+
+        Args:
+            replay (list): The recorded (method, args) updates, oldest first.
+            counted (set): The ids of the reviews of the window the load counted.
+        """
+        for method, args in replay:
+            if method == "add_review":
+                if args[1] in counted:
+                    continue
+                counted.add(args[1])
+            elif method == "remove_review":
+                if args[1] not in counted:
+                    continue
+                counted.discard(args[1])
+            getattr(self, method)(*args)
+
+    async def rebuild(self):
+        """Reloads the rankings from the database, keeping the updates made in the meantime."""
+        loop = asyncio.get_running_loop()
+        self.replay = []
+        try:
+            now = time()
+            window_start = now - self.window_seconds
+            stats = review_models.BookRatingStats
+            review = review_models.Review
+            async with read_session() as db:
+                books = (await db.execute(
+                    select(models.Book.id, models.Book.genre, func.coalesce(stats.review_count, 0),
+                           func.coalesce(stats.rating_sum, 0))
+                    .outerjoin(stats, stats.book_id == models.Book.id)
+                )).all()
+                reviews = (await db.execute(
+                    select(review.id, review.book_id, review.created_at).where(
+                        review.created_at >= datetime.fromtimestamp(window_start, timezone.utc).replace(tzinfo=None))
+                )).all()
+            entries, prior_mean, (top_rated, trending) = await loop.run_in_executor(
+                None, self.build, books, reviews, now)
+            self.books, self.prior_mean, self.epoch, self.window_start = entries, prior_mean, now, window_start
+            self.top_rated, self.trending = top_rated, trending
+            replay, self.replay = self.replay, None
+            self.apply_replay(replay, {row[0] for row in reviews} if replay else set())
+            return len(books), len(reviews)
+        finally:
+            self.replay = None
+
+    async def run(self):
+        """Builds the rankings at startup, then rebuilds them periodically."""
+        while True:
+            try:
+                started = perf_counter()
+                books, reviews = await self.rebuild()
+                logger.info("Built the leaderboards from %d books and %d recent reviews in %.1fs",
+                            books, reviews, perf_counter() - started)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to build the leaderboards")
+            if not self.rebuild_seconds:
+                return
+            await asyncio.sleep(self.rebuild_seconds)
+
+
+leaderboards = Leaderboards(LEADERBOARD_PRIOR_REVIEWS, TRENDING_HALF_LIFE_HOURS * 3600,
+                            TRENDING_WINDOW_DAYS * 86400, LEADERBOARD_REBUILD_SECONDS)
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, Index, Text, JSON
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from database import Base
 
 class Book(Base):
@@ -11,3 +13,36 @@ class Book(Base):
     year_published = Column(Integer)
     summary = Column(String)
     book_url = Column(String)
+    # URLs of the resized cover images by size and format, as returned by the cover upload
+    cover_variants = Column(JSON)
+    # Weighted full-text document maintained by book.crud, only populated on Postgres
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite")))
+    # Rating aggregate kept up to date by the review write paths, loaded with the book
+    rating_stats = relationship("BookRatingStats", uselist=False, viewonly=True, lazy="joined")
+
+    # Composite indexes backing the keyset pagination sort orders of GET /books/
+    __table_args__ = (
+        Index("ix_books_title_id", "title", "id"),
+        Index("ix_books_year_published_id", "year_published", "id"),
+        Index("ix_books_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
+# Number of books per genre and year, the rollup GET /books/facets counts genres, decades and
+# totals from. Its size is bounded by the genres and years, not by the books.
+# Kept up to date by the book write paths in the same transaction as the book
+class BookGenreYearCount(Base):
+    __tablename__ = "book_genre_year_counts"
+
+    genre = Column(String, primary_key=True)
+    year_published = Column(Integer, primary_key=True)
+    book_count = Column(Integer, nullable=False, default=0)
+
+# Number of books per author, genre and decade, the rollup of the author facet and of the
+# counts filtered by author, maintained alongside BookGenreYearCount
+class BookAuthorCount(Base):
+    __tablename__ = "book_author_counts"
+
+    author = Column(String, primary_key=True)
+    genre = Column(String, primary_key=True)
+    decade = Column(Integer, primary_key=True)
+    book_count = Column(Integer, nullable=False, default=0)
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
-from book import schemas, crud
+from typing import List, Literal, Optional
+from book import schemas, crud, bulk
 from core.security import get_current_user_id, is_admin, _token_header
-from database import get_db
+from core.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+from core.serialization import FastJSONResponse
+from core.config import SIMILAR_BOOKS_K
+from core.batch import batch_ids
+from core.response_cache import response_cache, cache_key, conditional_response, book_tag, BOOK_LIST_TAG
+from database import get_db, get_read_db, get_shared_read_db
 
 router = APIRouter()
 
@@ -18,6 +23,25 @@ async def create_book(
         raise HTTPException(status_code=403, detail="Not authorized to perform this action")
     return await crud.create_book(db, book, current_user_id)
 
+@router.post("/import", response_model=schemas.BookImportResponse)
+async def import_books(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db),
+    token: str = _token_header
+):
+    current_user_id = await get_current_user_id(token, db)
+    if not await is_admin(db, current_user_id):
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    fmt = format or bulk.IMPORT_CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson, or set the format")
+    # The request body is parsed as it arrives instead of being buffered
+    records = bulk.iter_records(bulk.iter_lines(request.stream()), fmt)
+    return await bulk.import_books(db, records, batch_size)
+
 @router.put("/{book_id}", response_model=schemas.BookResponse)
 async def update_book(
     book_id: int, 
@@ -41,10 +65,108 @@ async def delete_book(
         raise HTTPException(status_code=403, detail="Not authorized to perform this action")
     return await crud.delete_book(db, book_id, current_user_id)
 
+@router.get("/search", response_model=List[schemas.BookResponse])
+async def search_books(
+    q: str = Query(..., min_length=1, max_length=200),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return FastJSONResponse(await crud.search_books(db, q, skip, limit))
+
+@router.get("/facets", response_model=schemas.BookFacetsResponse)
+async def get_facets(
+    request: Request,
+    genre: Optional[str] = None,
+    author: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_shared_read_db)
+):
+    cached = response_cache.get(cache_key(request))
+    if cached is None:
+        since = response_cache.generation
+        facets = await crud.get_facets(db, limit, genre, author, year_min, year_max)
+        cached = response_cache.store(cache_key(request), facets, [BOOK_LIST_TAG], since=since)
+    return conditional_response(request, cached)
+
+@router.get("/batch", response_model=schemas.BookBatchResponse)
+async def get_books_by_ids(
+    request: Request,
+    ids: List[int] = Depends(batch_ids),
+    db: AsyncSession = Depends(get_shared_read_db)
+):
+    cached = response_cache.get(cache_key(request))
+    if cached is None:
+        since = response_cache.generation
+        books = await crud.get_books_by_ids(db, ids)
+        # Stale when one of the books changes, or when a missing id gets created with the book list
+        tags = [BOOK_LIST_TAG] + [book_tag(book_id) for book_id in ids]
+        cached = response_cache.store(cache_key(request), books, tags, since=since)
+    return conditional_response(request, cached)
+
+@router.get("/top", response_model=List[schemas.RankedBookResponse])
+async def get_top_books(
+    genre: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return FastJSONResponse(await crud.get_top_books(db, genre, limit))
+
+@router.get("/trending", response_model=List[schemas.RankedBookResponse])
+async def get_trending_books(
+    genre: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return FastJSONResponse(await crud.get_trending_books(db, genre, limit))
+
+@router.get("/{book_id}/similar", response_model=List[schemas.SimilarBookResponse])
+async def get_similar_books(
+    book_id: int,
+    limit: int = Query(10, ge=1, le=SIMILAR_BOOKS_K),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return FastJSONResponse(await crud.get_similar_books(db, book_id, limit))
+
 @router.get("/{book_id}", response_model=schemas.BookResponse)
-async def get_book(book_id: int, db: AsyncSession = Depends(get_db)):
-    return await crud.get_book(db, book_id)
+async def get_book(book_id: int, request: Request, db: AsyncSession = Depends(get_shared_read_db)):
+    cached = response_cache.get(cache_key(request))
+    if cached is None:
+        since = response_cache.generation
+        book = await crud.get_book(db, book_id)
+        cached = response_cache.store(cache_key(request), schemas.BookResponse.from_orm(book), [book_tag(book_id)],
+                                      since=since)
+    return conditional_response(request, cached)
 
 @router.get("/", response_model=List[schemas.BookResponse])
-async def get_books(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    return await crud.get_books(db, skip, limit)
+async def get_books(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    sort: Literal["id", "title", "year_published"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    cursor: Optional[str] = None,
+    total: Optional[Literal["exact", "approximate"]] = None,
+    genre: Optional[str] = None,
+    author: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    db: AsyncSession = Depends(get_shared_read_db)
+):
+    cached = response_cache.get(cache_key(request))
+    if cached is None:
+        since = response_cache.generation
+        books, next_cursor = await crud.get_books(db, skip, limit, sort, order, cursor,
+                                                  genre, author, year_min, year_max)
+        headers = {}
+        if next_cursor:
+            headers[NEXT_CURSOR_HEADER] = next_cursor
+        if total:
+            headers[TOTAL_COUNT_HEADER] = str(await crud.count_books(db, total, genre, author,
+                                                                     year_min, year_max))
+        # A page changes when one of its books changes or when books are added or removed
+        tags = [BOOK_LIST_TAG] + [book_tag(book["id"]) for book in books]
+        cached = response_cache.store(cache_key(request), books, tags, headers, since=since)
+    return conditional_response(request, cached)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, List, Union
 
 class BookBase(BaseModel):
     title: str
@@ -8,6 +8,8 @@ class BookBase(BaseModel):
     year_published: int
     summary: Optional[str] = None
     book_url: Optional[str] = None
+    # {"thumbnail": {"avif": url, "webp": url, "jpeg": url}, "medium": {...}}
+    cover_variants: Optional[Dict[str, Dict[str, str]]] = None
 
 class BookCreate(BookBase):
     pass
@@ -15,8 +17,48 @@ class BookCreate(BookBase):
 class BookUpdate(BookBase):
     pass
 
+class RatingStatsResponse(BaseModel):
+    review_count: int
+    average_rating: float
+    histogram: Dict[str, int]
+
+    class Config:
+        orm_mode = True
+        from_attributes = True
+
 class BookResponse(BookBase):
     id: int
+    rating_stats: Optional[RatingStatsResponse] = None
 
     class Config:
         orm_mode = True
+        from_attributes = True
+
+class SimilarBookResponse(BookResponse):
+    similarity: float
+
+class RankedBookResponse(BookResponse):
+    score: float
+
+class BookBatchResponse(BaseModel):
+    books: List[BookResponse]
+    missing: List[int]
+
+class BookImportError(BaseModel):
+    line: int
+    error: str
+
+class BookImportResponse(BaseModel):
+    imported: int
+    failed: int
+    errors: List[BookImportError]
+
+class FacetValue(BaseModel):
+    value: Union[int, str]
+    count: int
+
+class BookFacetsResponse(BaseModel):
+    total: int
+    genre: List[FacetValue]
+    author: List[FacetValue]
+    decade: List[FacetValue]
@@ -0,0 +1,293 @@
+import asyncio
+import logging
+from time import monotonic, perf_counter
+import numpy as np
+from scipy import sparse
+from sqlalchemy.future import select
+from book_review import models as review_models
+from database import read_session
+from core.config import SIMILAR_BOOKS_K, SIMILARITY_REFRESH_SECONDS, SIMILARITY_REBUILD_SECONDS, \
+    SIMILARITY_BLOCK_MB, SIMILARITY_MAX_USER_RATINGS
+
+logger = logging.getLogger(__name__)
+
+# Reviews fetched from the server-side cursor at a time while loading the rating matrix
+LOAD_BATCH_SIZE = 100000
+
+
+async def load_ratings(batch_size: int = LOAD_BATCH_SIZE) -> np.ndarray:
+    """
+    Reads every rating through a server-side cursor, on a read replica when available.
+
+    Returns:
+        np.ndarray: One (book_id, user_id, rating) int32 row per review.
+    """
+    review = review_models.Review
+    query = (select(review.book_id, review.user_id, review.rating)
+             .where(review.rating.isnot(None))
+             .execution_options(yield_per=batch_size))
+    chunks = []
+    async with read_session() as db:
+        result = await db.stream(query)
+        async for partition in result.partitions():
+            chunks.append(np.array(partition, dtype=np.int32).reshape(-1, 3))
+    return np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int32)
+
+
+def rating_matrix(triples: np.ndarray, shape: tuple = None) -> sparse.csr_matrix:
+    """Builds the book x user rating matrix, indexed by the ids themselves."""
+    if shape is None:
+        shape = (int(triples[:, 0].max(initial=0)) + 1, int(triples[:, 1].max(initial=0)) + 1)
+    matrix = sparse.csr_matrix((triples[:, 2].astype(np.float32), (triples[:, 0], triples[:, 1])), shape=shape)
+    matrix.sort_indices()
+    return matrix
+
+
+def adjusted_cosine_vectors(ratings: sparse.csr_matrix, max_user_ratings: int = None) -> sparse.csr_matrix:
+    """
+    Centers every rating on the mean rating of its user and scales each book vector to unit
+    length, so the dot product of two books is their adjusted cosine similarity.
+
+    The cost of the similarities grows with the square of the number of ratings per user,
+    so users with more than max_user_ratings ratings are left out.
+    """
+    users = ratings.shape[1]
+    counts = np.bincount(ratings.indices, minlength=users)
+    sums = np.bincount(ratings.indices, weights=ratings.data, minlength=users)
+    means = np.divide(sums, counts, out=np.zeros(users), where=counts > 0)
+    data = ratings.data - means[ratings.indices]
+    if max_user_ratings:
+        data[counts[ratings.indices] > max_user_ratings] = 0
+    rows = np.repeat(np.arange(ratings.shape[0]), np.diff(ratings.indptr))
+    norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=ratings.shape[0]))
+    data = np.divide(data, norms[rows], out=np.zeros_like(data), where=norms[rows] > 0)
+    vectors = sparse.csr_matrix((data.astype(np.float32), ratings.indices.copy(), ratings.indptr.copy()),
+                                shape=ratings.shape)
+    # Ratings equal to their user's mean and the skipped users add nothing to any similarity
+    vectors.eliminate_zeros()
+    return vectors
+
+
+def similarity_block(vectors: sparse.csr_matrix, vectors_t: sparse.csr_matrix, rows: np.ndarray) -> np.ndarray:
+    """
+    Computes the similarity of the given books to every book.
+
+    Returns:
+        np.ndarray: A dense (len(rows), books) array where a book's similarity to itself and
+        the non positive similarities are zero.
+    """
+    sims = (vectors[rows] @ vectors_t).toarray()
+    sims[np.arange(len(rows)), rows] = 0
+    np.maximum(sims, 0, out=sims)
+    return sims
+
+
+def top_k(sims: np.ndarray, k: int):
+    """Returns the ids and similarities of the k most similar books of each row, best first."""
+    ids = np.zeros((sims.shape[0], k), dtype=np.int32)
+    scores = np.zeros((sims.shape[0], k), dtype=np.float32)
+    count = min(k, sims.shape[1])
+    if count == 0:
+        return ids, scores
+    candidates = np.argpartition(sims, sims.shape[1] - count, axis=1)[:, -count:]
+    candidate_scores = np.take_along_axis(sims, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    ids[:, :count] = np.take_along_axis(candidates, order, axis=1)
+    scores[:, :count] = np.take_along_axis(candidate_scores, order, axis=1)
+    return ids, scores
+
+
+def sparse_top_k(product: sparse.csr_matrix, rows: np.ndarray, k: int):
+    """
+    Returns the ids and similarities of the k most similar books of each row of a sparse
+    similarity block, best first, skipping each book itself and the non positive similarities.
+
+    Only the pairs of books with reviewers in common are stored, so the cost follows their
+    number rather than the square of the number of books.
+    """
+    row_ids = np.repeat(np.arange(product.shape[0]), np.diff(product.indptr))
+    keep = (product.data > 0) & (product.indices != rows[row_ids])
+    row_ids, columns = row_ids[keep], product.indices[keep]
+    data = np.minimum(product.data[keep], 1)
+    # One sort orders by row, then by decreasing similarity within the row
+    order = np.argsort(row_ids + (1 - data) * 0.5, kind="stable")
+    row_ids, columns, data = row_ids[order], columns[order], data[order]
+    rank = np.arange(len(row_ids)) - np.searchsorted(row_ids, row_ids)
+    keep = rank < k
+    ids = np.zeros((product.shape[0], k), dtype=np.int32)
+    scores = np.zeros((product.shape[0], k), dtype=np.float32)
+    ids[row_ids[keep], rank[keep]] = columns[keep]
+    scores[row_ids[keep], rank[keep]] = data[keep]
+    return ids, scores
+
+
+class SimilarityIndex:
+    """
+    Item-item collaborative filtering over the reviews: the k books with the highest adjusted
+    cosine similarity to each book, from the sparse book x user rating matrix.
+
+    The index is built from the database at startup and then periodically. In between, review
+    writes are recorded and applied in batches: the changed books get their neighbours
+    recomputed and their new similarities merged into the other books' lists. Books whose
+    similarity only shifted through a reviewer's mean rating are corrected by the next rebuild,
+    as are the writes made by other worker processes.
+
+    Lookups read a (neighbours, scores) pair of arrays that updates replace as a whole, so they
+    never see a half applied update.
+    """
+
+    def __init__(self, k: int, refresh_seconds: float, rebuild_seconds: float, block_bytes: int,
+                 max_user_ratings: int = None):
+        self.k = k
+        self.max_user_ratings = max_user_ratings
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.block_bytes = block_bytes
+        self.ratings = None
+        self.table = (np.zeros((0, k), dtype=np.int32), np.zeros((0, k), dtype=np.float32))
+        self.pending = {}
+        self.changed = None
+        self.built_at = None
+
+    def similar(self, book_id: int, limit: int = None) -> list:
+        """Returns up to limit (book id, similarity) pairs of the most similar books, best first."""
+        neighbours, scores = self.table
+        if book_id < 0 or book_id >= len(neighbours):
+            return []
+        return [(int(neighbour), round(float(score), 4))
+                for neighbour, score in zip(neighbours[book_id, :limit], scores[book_id, :limit]) if score > 0]
+
+    def record_rating(self, book_id: int, user_id: int, rating: int = None):
+        """Records a review written, re-rated (rating) or deleted (None), applied at the next refresh."""
+        self.pending[(book_id, user_id)] = rating
+        self._signal()
+
+    def remove_book(self, book_id: int):
+        """Records a deleted book, whose ratings are dropped at the next refresh."""
+        self.pending[(book_id, None)] = None
+        self._signal()
+
+    def _signal(self):
+        if self.changed is not None:
+            self.changed.set()
+
+    def block_rows(self, books: int) -> int:
+        # A row of a block holds up to one similarity per book, about 16 bytes each between
+        # the sparse product and its dense copy
+        return max(1, self.block_bytes // max(books * 16, 1))
+
+    def rebuild(self, triples: np.ndarray):
+        """Builds the index from scratch from (book_id, user_id, rating) rows."""
+        ratings = rating_matrix(triples)
+        vectors = adjusted_cosine_vectors(ratings, self.max_user_ratings)
+        vectors_t = vectors.T.tocsr()
+        books = ratings.shape[0]
+        neighbours = np.zeros((books, self.k), dtype=np.int32)
+        scores = np.zeros((books, self.k), dtype=np.float32)
+        # Books without reviews keep empty lists
+        rated = np.flatnonzero(np.diff(ratings.indptr))
+        step = self.block_rows(books)
+        for start in range(0, len(rated), step):
+            rows = rated[start:start + step]
+            neighbours[rows], scores[rows] = sparse_top_k(vectors[rows] @ vectors_t, rows, self.k)
+        self.ratings = ratings
+        self.table = (neighbours, scores)
+        self.built_at = monotonic()
+
+    def apply(self, changes: dict):
+        """
+        Applies recorded review changes to the rating matrix and updates the neighbours of
+        the changed books, and their place in the other books' lists.
+        """
+        ratings = self.ratings
+        books = max([ratings.shape[0]] + [book_id + 1 for book_id, _ in changes])
+        users = max([ratings.shape[1]] + [user_id + 1 for _, user_id in changes if user_id is not None])
+        if (books, users) != ratings.shape:
+            ratings.resize((books, users))
+        added = []
+        for (book_id, user_id), rating in changes.items():
+            start, end = ratings.indptr[book_id], ratings.indptr[book_id + 1]
+            if user_id is None:
+                ratings.data[start:end] = 0
+                continue
+            position = start + np.searchsorted(ratings.indices[start:end], user_id)
+            if position < end and ratings.indices[position] == user_id:
+                ratings.data[position] = rating or 0
+            elif rating:
+                added.append((book_id, user_id, rating))
+        if added:
+            ratings = ratings + rating_matrix(np.array(added, dtype=np.int32), ratings.shape)
+        ratings.eliminate_zeros()
+        ratings.sort_indices()
+
+        vectors = adjusted_cosine_vectors(ratings, self.max_user_ratings)
+        vectors_t = vectors.T.tocsr()
+        old_neighbours, old_scores = self.table
+        neighbours = np.zeros((books, self.k), dtype=np.int32)
+        scores = np.zeros((books, self.k), dtype=np.float32)
+        neighbours[:len(old_neighbours)], scores[:len(old_scores)] = old_neighbours, old_scores
+        dirty = np.array(sorted({book_id for book_id, _ in changes}), dtype=np.int64)
+        fresh = np.zeros(books, dtype=bool)
+        fresh[dirty] = True
+        touched = np.zeros(books, dtype=bool)
+        step = self.block_rows(books)
+        for start in range(0, len(dirty), step):
+            rows = dirty[start:start + step]
+            sims = similarity_block(vectors, vectors_t, rows)
+            neighbours[rows], scores[rows] = top_k(sims, self.k)
+            # Similarity is symmetric: the row of a changed book is also its column
+            for book_id, column in zip(rows, sims):
+                holders, slots = np.nonzero(neighbours == book_id)
+                keep = ~fresh[holders]
+                holders, slots = holders[keep], slots[keep]
+                scores[holders, slots] = column[holders]
+                weakest = scores.argmin(axis=1)
+                better = column > scores[np.arange(books), weakest]
+                better[holders] = False
+                better[fresh] = False
+                rows_in = np.flatnonzero(better)
+                neighbours[rows_in, weakest[rows_in]] = book_id
+                scores[rows_in, weakest[rows_in]] = column[rows_in]
+                touched[holders] = True
+                touched[rows_in] = True
+        rows = np.flatnonzero(touched)
+        order = np.argsort(-scores[rows], axis=1, kind="stable")
+        neighbours[rows] = np.take_along_axis(neighbours[rows], order, axis=1)
+        scores[rows] = np.take_along_axis(scores[rows], order, axis=1)
+        self.ratings = ratings
+        self.table = (neighbours, scores)
+
+    async def run(self):
+        """Builds the index, then applies the recorded changes and rebuilds it periodically."""
+        self.changed = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        next_rebuild = monotonic()
+        while True:
+            self.changed.clear()
+            try:
+                if monotonic() >= next_rebuild:
+                    started = perf_counter()
+                    triples = await load_ratings()
+                    await loop.run_in_executor(None, self.rebuild, triples)
+                    logger.info("Built the similar books index from %d ratings in %.1fs",
+                                len(triples), perf_counter() - started)
+                    next_rebuild = monotonic() + self.rebuild_seconds if self.rebuild_seconds else float("inf")
+                if self.pending and self.ratings is not None:
+                    changes, self.pending = self.pending, {}
+                    await loop.run_in_executor(None, self.apply, changes)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # The changes are lost, the next rebuild picks them up from the database
+                logger.exception("Failed to update the similar books index")
+            timeout = next_rebuild - monotonic() if next_rebuild != float("inf") else None
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout=max(timeout, 0) if timeout is not None else None)
+            except asyncio.TimeoutError:
+                continue
+            # Let a burst of review writes accumulate into one update
+            await asyncio.sleep(self.refresh_seconds)
+
+
+similarity_index = SimilarityIndex(SIMILAR_BOOKS_K, SIMILARITY_REFRESH_SECONDS, SIMILARITY_REBUILD_SECONDS,
+                                   SIMILARITY_BLOCK_MB * 1024 * 1024, SIMILARITY_MAX_USER_RATINGS)
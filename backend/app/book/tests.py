@@ -1,3 +1,4 @@
+import time
 import requests
 
 BASE_URL = "http://localhost:8001"
@@ -106,3 +107,419 @@ def test_book_i_delete_book_success():
 def test_book_j_delete_user():
     response = requests.delete(f"{BASE_URL}/users/{user_a_id}", headers={"x-access-token": admin_token})
     assert response.status_code == 200
+
+def test_book_k_cursor_pagination():
+    created_ids = []
+    for index in range(3):
+        response = requests.post(f"{BASE_URL}/books/", json={
+            "title": f"Paged Book {index}",
+            "author": "Paged Author",
+            "genre": "Paged Genre",
+            "year_published": 2000 + index,
+            "summary": "Paged Summary",
+            "book_url": "http://example.com/paged_book"
+        }, headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+        created_ids.append(response.json()["id"])
+
+    response = requests.get(f"{BASE_URL}/books/", params={"sort": "id", "order": "desc", "limit": 2, "total": "exact"})
+    assert response.status_code == 200
+    assert [book["id"] for book in response.json()] == created_ids[::-1][:2]
+    assert int(response.headers["X-Total-Count"]) >= 3
+    next_cursor = response.headers["X-Next-Cursor"]
+
+    response = requests.get(f"{BASE_URL}/books/", params={"sort": "id", "order": "desc", "limit": 2, "cursor": next_cursor})
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == created_ids[0]
+
+    # A cursor is only valid for the ordering it was issued for
+    response = requests.get(f"{BASE_URL}/books/", params={"sort": "title", "cursor": next_cursor})
+    assert response.status_code == 400
+
+    for created_id in created_ids:
+        response = requests.delete(f"{BASE_URL}/books/{created_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+
+def test_book_l_invalid_cursor():
+    response = requests.get(f"{BASE_URL}/books/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_book_m_search_books():
+    response = requests.post(f"{BASE_URL}/books/", json={
+        "title": "Searchable Nebula Chronicles",
+        "author": "Orbital Writer",
+        "genre": "Science Fiction",
+        "year_published": 2024,
+        "summary": "A voyage past the nebula",
+        "book_url": "http://example.com/searchable_book"
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    searchable_id = response.json()["id"]
+
+    # Prefix terms match across title and author
+    response = requests.get(f"{BASE_URL}/books/search", params={"q": "nebul orbit"})
+    assert response.status_code == 200
+    assert searchable_id in [book["id"] for book in response.json()]
+
+    response = requests.get(f"{BASE_URL}/books/search", params={"q": "nebula zzzunmatched"})
+    assert response.status_code == 200
+    assert searchable_id not in [book["id"] for book in response.json()]
+
+    response = requests.delete(f"{BASE_URL}/books/{searchable_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+
+def test_book_n_conditional_get():
+    response = requests.post(f"{BASE_URL}/books/", json={
+        "title": "Cached Book",
+        "author": "Cached Author",
+        "genre": "Cached Genre",
+        "year_published": 2024,
+        "summary": "Cached Summary",
+        "book_url": "http://example.com/cached_book"
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    cached_book_id = response.json()["id"]
+
+    response = requests.get(f"{BASE_URL}/books/{cached_book_id}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response = requests.get(f"{BASE_URL}/books/{cached_book_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # A write to the book invalidates the cached response
+    response = requests.put(f"{BASE_URL}/books/{cached_book_id}", json={
+        "title": "Cached Book Renamed",
+        "author": "Cached Author",
+        "genre": "Cached Genre",
+        "year_published": 2024,
+        "summary": "Cached Summary",
+        "book_url": "http://example.com/cached_book"
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    response = requests.get(f"{BASE_URL}/books/{cached_book_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Cached Book Renamed"
+    assert response.headers["ETag"] != etag
+
+    response = requests.delete(f"{BASE_URL}/books/{cached_book_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    response = requests.get(f"{BASE_URL}/books/{cached_book_id}")
+    assert response.status_code == 404
+
+def test_book_o_bulk_import():
+    csv_body = (
+        "title,author,genre,year_published,summary\n"
+        "Imported One,Importer,Bulk,2001,\"First, with a comma\"\n"
+        "Imported Two,Importer,Bulk,not-a-year,Second\n"
+        "Imported Three,Importer,Bulk,2003,\"Third\non two lines\"\n"
+        "Imported 12\" Single,Importer,Bulk,2005,A quote in an unquoted field\n"
+        "Imported Five,Importer,Bulk,not-a-year,Fifth\n"
+    )
+    response = requests.post(f"{BASE_URL}/books/import", data=csv_body.encode(),
+                             headers={"x-access-token": admin_token, "Content-Type": "text/csv"})
+    assert response.status_code == 200
+    assert response.json()["imported"] == 3
+    assert response.json()["failed"] == 2
+    assert [error["line"] for error in response.json()["errors"]] == [3, 7]
+
+    ndjson_body = '{"title": "Imported Four", "author": "Importer", "genre": "Bulk", "year_published": 2004}\n{"title": "Missing fields"}\n'
+    response = requests.post(f"{BASE_URL}/books/import", params={"format": "ndjson"}, data=ndjson_body.encode(),
+                             headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    assert response.json()["imported"] == 1
+    assert response.json()["errors"][0]["line"] == 2
+
+    response = requests.get(f"{BASE_URL}/books/search", params={"q": "imported importer"})
+    for book in response.json():
+        response = requests.delete(f"{BASE_URL}/books/{book['id']}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+
+def test_book_p_metrics():
+    response = requests.get(f"{BASE_URL}/books/", params={"limit": 1})
+    assert response.status_code == 200
+    response = requests.get(f"{BASE_URL}/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/books/",status="200"}' in response.text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/books/",le="+Inf"}' in response.text
+    assert 'db_queries_total{method="GET",route="/books/"}' in response.text
+    assert "http_requests_in_flight 1" in response.text
+
+def test_book_q_query_budget(query_budget):
+    book_data = {"title": "Budget Book", "author": "Author", "genre": "Genre", "year_published": 2020,
+                 "summary": "Summary", "book_url": "http://example.com/budget"}
+    response = requests.post(f"{BASE_URL}/books/", json=book_data, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    budget_book_id = response.json()["id"]
+    book_response = requests.get(f"{BASE_URL}/books/{budget_book_id}")
+    list_response = requests.get(f"{BASE_URL}/books/", params={"limit": 10})
+    requests.delete(f"{BASE_URL}/books/{budget_book_id}", headers={"x-access-token": admin_token})
+    assert book_response.status_code == 200
+    query_budget(book_response, 1)
+    query_budget(list_response, 1)
+
+
+def test_book_r_facets():
+    book_ids = []
+    for author, year in (("Facet Author A", 1994), ("Facet Author A", 2003), ("Facet Author B", 2005)):
+        response = requests.post(f"{BASE_URL}/books/", json={
+            "title": "Faceted Book",
+            "author": author,
+            "genre": "Facet Genre",
+            "year_published": year,
+            "summary": "Faceted Summary",
+            "book_url": "http://example.com/faceted_book"
+        }, headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+        book_ids.append(response.json()["id"])
+
+    response = requests.get(f"{BASE_URL}/books/", params={"genre": "Facet Genre", "year_min": 2000})
+    assert [book["id"] for book in response.json()] == book_ids[1:]
+    response = requests.get(f"{BASE_URL}/books/", params={"author": "Facet Author A", "year_max": 1999})
+    assert [book["id"] for book in response.json()] == book_ids[:1]
+    # The total counts the filtered books, not the whole catalog
+    for total in ("exact", "approximate"):
+        response = requests.get(f"{BASE_URL}/books/", params={"genre": "Facet Genre", "year_min": 2000,
+                                                              "total": total})
+        assert response.headers["X-Total-Count"] == "2"
+
+    response = requests.get(f"{BASE_URL}/books/facets", params={"genre": "Facet Genre"})
+    assert response.status_code == 200
+    facets = response.json()
+    assert facets["total"] == 3
+    assert facets["author"] == [{"value": "Facet Author A", "count": 2}, {"value": "Facet Author B", "count": 1}]
+    assert facets["decade"] == [{"value": 2000, "count": 2}, {"value": 1990, "count": 1}]
+    # A facet ignores its own filter, so the other values stay selectable
+    facets = requests.get(f"{BASE_URL}/books/facets",
+                          params={"genre": "Facet Genre", "author": "Facet Author B"}).json()
+    assert facets["total"] == 1
+    assert [value["count"] for value in facets["author"]] == [2, 1]
+    assert facets["genre"] == [{"value": "Facet Genre", "count": 1}]
+    # Authors combined with years are exact whether or not the years fall on decade boundaries
+    for year_min, total in ((1990, 2), (1995, 1), (2000, 1)):
+        facets = requests.get(f"{BASE_URL}/books/facets",
+                              params={"author": "Facet Author A", "year_min": year_min}).json()
+        assert facets["total"] == total
+    for year_max in (1995, 1999):
+        facets = requests.get(f"{BASE_URL}/books/facets", params={"genre": "Facet Genre", "year_max": year_max}).json()
+        assert facets["author"] == [{"value": "Facet Author A", "count": 1}]
+
+    # Moving a book to another author and removing one keep the counts current
+    response = requests.put(f"{BASE_URL}/books/{book_ids[0]}", json={
+        "title": "Faceted Book",
+        "author": "Facet Author B",
+        "genre": "Facet Genre",
+        "year_published": 1994,
+        "summary": "Faceted Summary",
+        "book_url": "http://example.com/faceted_book"
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    response = requests.delete(f"{BASE_URL}/books/{book_ids[1]}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    facets = requests.get(f"{BASE_URL}/books/facets", params={"genre": "Facet Genre"}).json()
+    assert facets["author"] == [{"value": "Facet Author B", "count": 2}]
+
+    for book_id in (book_ids[0], book_ids[2]):
+        response = requests.delete(f"{BASE_URL}/books/{book_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+    assert requests.get(f"{BASE_URL}/books/facets", params={"genre": "Facet Genre"}).json()["total"] == 0
+
+
+def test_book_s_similar_books():
+    book_ids = []
+    for title in ("Similar X", "Similar Y", "Similar Z"):
+        response = requests.post(f"{BASE_URL}/books/", json={
+            "title": title,
+            "author": "Similar Author",
+            "genre": "Similar Genre",
+            "year_published": 2024,
+            "summary": "Similar Summary",
+            "book_url": "http://example.com/similar_book"
+        }, headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+        book_ids.append(response.json()["id"])
+    # Readers who liked X also liked Y, and all disliked Z
+    user_ids = []
+    for name, ratings in (("SimA", (5, 5, 1)), ("SimB", (4, 5, 2)), ("SimC", (5, 4, 1))):
+        response = requests.post(f"{BASE_URL}/users/", json={
+            "full_name": f"User {name}",
+            "display_name": f"user{name}",
+            "password": f"password{name}",
+            "email": f"user{name}@example.com"
+        })
+        assert response.status_code == 200
+        user_ids.append(response.json()["id"])
+        token = requests.post(f"{BASE_URL}/users/login", json={
+            "email": f"user{name}@example.com",
+            "password": f"password{name}"
+        }).json()["access_token"]
+        for book_id, rating in zip(book_ids, ratings):
+            response = requests.post(f"{BASE_URL}/reviews/", json={
+                "book_id": book_id, "review_text": "Similarity", "rating": rating
+            }, headers={"x-access-token": token})
+            assert response.status_code == 200
+
+    # The index is updated in the background shortly after the reviews
+    similar = []
+    for _ in range(50):
+        response = requests.get(f"{BASE_URL}/books/{book_ids[0]}/similar")
+        assert response.status_code == 200
+        similar = response.json()
+        if similar:
+            break
+        time.sleep(0.2)
+    assert [book["id"] for book in similar] == [book_ids[1]]
+    assert 0 < similar[0]["similarity"] <= 1
+    assert similar[0]["title"] == "Similar Y"
+
+    response = requests.get(f"{BASE_URL}/books/999999999/similar")
+    assert response.status_code == 404
+
+    for book_id in book_ids:
+        response = requests.delete(f"{BASE_URL}/books/{book_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+    for user_id in user_ids:
+        response = requests.delete(f"{BASE_URL}/users/{user_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+
+
+def test_book_t_leaderboards():
+    book_ids = []
+    for title in ("Leader A", "Leader B"):
+        response = requests.post(f"{BASE_URL}/books/", json={
+            "title": title,
+            "author": "Leader Author",
+            "genre": "Leaderboard Genre",
+            "year_published": 2024,
+            "summary": "Leader Summary",
+            "book_url": "http://example.com/leader_book"
+        }, headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+        book_ids.append(response.json()["id"])
+    # A gets two perfect ratings, B a single good one
+    user_ids = []
+    for name, ratings in (("LeadA", (5, 4)), ("LeadB", (5, None))):
+        response = requests.post(f"{BASE_URL}/users/", json={
+            "full_name": f"User {name}",
+            "display_name": f"user{name}",
+            "password": f"password{name}",
+            "email": f"user{name}@example.com"
+        })
+        assert response.status_code == 200
+        user_ids.append(response.json()["id"])
+        token = requests.post(f"{BASE_URL}/users/login", json={
+            "email": f"user{name}@example.com",
+            "password": f"password{name}"
+        }).json()["access_token"]
+        for book_id, rating in zip(book_ids, ratings):
+            if rating is not None:
+                response = requests.post(f"{BASE_URL}/reviews/", json={
+                    "book_id": book_id, "review_text": "Leaderboard", "rating": rating
+                }, headers={"x-access-token": token})
+                assert response.status_code == 200
+
+    params = {"genre": "Leaderboard Genre"}
+    top = requests.get(f"{BASE_URL}/books/top", params=params)
+    assert top.status_code == 200
+    assert [book["id"] for book in top.json()] == book_ids
+    assert top.json()[0]["title"] == "Leader A"
+    assert top.json()[0]["score"] > top.json()[1]["score"]
+    trending = requests.get(f"{BASE_URL}/books/trending", params=params)
+    assert trending.status_code == 200
+    assert [book["id"] for book in trending.json()] == book_ids
+    assert 1 < trending.json()[0]["score"] <= 2
+    assert requests.get(f"{BASE_URL}/books/top", params={**params, "limit": 1}).json()[0]["id"] == book_ids[0]
+    assert requests.get(f"{BASE_URL}/books/top", params={"genre": "No Such Genre"}).json() == []
+    assert requests.get(f"{BASE_URL}/books/trending", params={"limit": 0}).status_code == 422
+
+    for book_id in book_ids:
+        response = requests.delete(f"{BASE_URL}/books/{book_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+    for user_id in user_ids:
+        response = requests.delete(f"{BASE_URL}/users/{user_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+    assert requests.get(f"{BASE_URL}/books/top", params=params).json() == []
+    assert requests.get(f"{BASE_URL}/books/trending", params=params).json() == []
+
+
+def test_book_u_batch_lookup():
+    book_ids = []
+    for title in ("Batch A", "Batch B"):
+        response = requests.post(f"{BASE_URL}/books/", json={
+            "title": title,
+            "author": "Batch Author",
+            "genre": "Batch Genre",
+            "year_published": 2024,
+            "summary": "Batch Summary",
+            "book_url": "http://example.com/batch_book"
+        }, headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+        book_ids.append(response.json()["id"])
+    ids = ",".join(map(str, [book_ids[1], 999999999, book_ids[0]]))
+
+    response = requests.get(f"{BASE_URL}/books/batch", params={"ids": ids})
+    assert response.status_code == 200
+    body = response.json()
+    assert [book["title"] for book in body["books"]] == ["Batch B", "Batch A"]
+    assert body["books"][0]["rating_stats"]["review_count"] == 0
+    assert body["missing"] == [999999999]
+
+    # The cached lookup is dropped when one of its books changes
+    response = requests.put(f"{BASE_URL}/books/{book_ids[0]}", json={
+        "title": "Batch A Revised",
+        "author": "Batch Author",
+        "genre": "Batch Genre",
+        "year_published": 2024
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    body = requests.get(f"{BASE_URL}/books/batch", params={"ids": ids}).json()
+    assert [book["title"] for book in body["books"]] == ["Batch B", "Batch A Revised"]
+    assert requests.get(f"{BASE_URL}/books/batch", params={"ids": "a,b"}).status_code == 422
+    # Ids outside the integer column range are refused instead of failing in the driver
+    for out_of_range in (f"{book_ids[0]},{2 ** 31}", "-1", "0"):
+        response = requests.get(f"{BASE_URL}/books/batch", params={"ids": out_of_range})
+        assert response.status_code == 422
+
+    for book_id in book_ids:
+        response = requests.delete(f"{BASE_URL}/books/{book_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+    body = requests.get(f"{BASE_URL}/books/batch", params={"ids": ids}).json()
+    assert body == {"books": [], "missing": [book_ids[1], 999999999, book_ids[0]]}
+
+
+def test_book_v_cover_variants():
+    variants = {
+        "thumbnail": {"webp": "http://example.com/c.png.thumbnail.webp", "jpeg": "http://example.com/c.png.thumbnail.jpg"},
+        "medium": {"webp": "http://example.com/c.png.medium.webp", "jpeg": "http://example.com/c.png.medium.jpg"},
+    }
+    response = requests.post(f"{BASE_URL}/books/", json={
+        "title": "Cover Book",
+        "author": "Cover Author",
+        "genre": "Cover Genre",
+        "year_published": 2024,
+        "book_url": "http://example.com/c.png",
+        "cover_variants": variants
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    assert response.json()["cover_variants"] == variants
+    cover_book_id = response.json()["id"]
+
+    response = requests.get(f"{BASE_URL}/books/{cover_book_id}")
+    assert response.json()["cover_variants"] == variants
+    books = requests.get(f"{BASE_URL}/books/", params={"genre": "Cover Genre"}).json()
+    assert [book["cover_variants"] for book in books] == [variants]
+
+    # Replacing the image without new variants clears them
+    response = requests.put(f"{BASE_URL}/books/{cover_book_id}", json={
+        "title": "Cover Book",
+        "author": "Cover Author",
+        "genre": "Cover Genre",
+        "year_published": 2024,
+        "book_url": "http://example.com/other.png",
+        "cover_variants": None
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    assert response.json()["cover_variants"] is None
+
+    response = requests.delete(f"{BASE_URL}/books/{cover_book_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
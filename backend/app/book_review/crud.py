@@ -1,19 +1,37 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_
+from sqlalchemy import and_, update, delete, insert, func, case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from collections import Counter
 from book_review import models, schemas
 from book import models as book_models
 from user import models as user_models
 from core.security import is_admin
+from core.response_cache import response_cache, book_tag, book_reviews_tag
+from book.similarity import similarity_index
+from book.leaderboards import leaderboards, timestamp
+from core.pagination import encode_cursor, decode_cursor, keyset_filter, order_by_clause
 from fastapi import HTTPException
 
-async def check_book_exists(db: AsyncSession, book_id: int):
-    """Check if the book with the given ID exists in the database."""
-    result = await db.execute(select(book_models.Book).filter(book_models.Book.id == book_id))
-    book = result.scalars().first()
-    if not book:
-        raise HTTPException(status_code=404, detail="Book not found")
-    return book
+# Columns of the one review per user and book constraint
+REVIEW_UNIQUE_COLUMNS = ["book_id", "user_id"]
+# Columns of a rating aggregate row, as selected by rating_stats_query
+RATING_STATS_COLUMNS = ["book_id", "review_count", "rating_sum"] + [f"rating_{rating}" for rating in models.RATING_VALUES]
+# The constraints an inserted review can violate, with the error each one means
+REVIEW_CONSTRAINT_ERRORS = {
+    "uq_reviews_book_id_user_id": (403, "You have already reviewed this book"),
+    "reviews_book_id_fkey": (404, "Book not found"),
+    "reviews_user_id_fkey": (404, "User not found"),
+}
+
+# Sort keys of the review lists with their columns, ending with the id as a unique tie breaker,
+# and direction. Ids follow insertion order, the newest reviews have the highest ids
+REVIEW_SORTS = {
+    "newest": ([models.Review.id], "desc"),
+    "highest": ([models.Review.rating, models.Review.id], "desc"),
+    "lowest": ([models.Review.rating, models.Review.id], "asc"),
+}
 
 async def check_review_exists_and_belongs_to_user(db: AsyncSession, review_id: int, user_id: int):
     """Check if the review exists and belongs to the given user."""
@@ -30,31 +48,144 @@ async def check_review_exists_and_belongs_to_user(db: AsyncSession, review_id: i
         raise HTTPException(status_code=403, detail="Review not found or you're not authorized to update it")
     return review_db
 
-async def check_already_reviewed(db: AsyncSession, book_id: int, user_id: int):
-    """Check if the the user already reviewed the book"""
+def insert_review(db: AsyncSession, values: dict):
+    """
+    Builds the INSERT of a review that skips it, instead of failing, when the user already
+    reviewed the book, and returns the new row.
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(models.Review).on_conflict_do_nothing(index_elements=REVIEW_UNIQUE_COLUMNS)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(models.Review).on_conflict_do_nothing(index_elements=REVIEW_UNIQUE_COLUMNS)
+    else:
+        stmt = insert(models.Review)
+    return stmt.values(values).returning(*models.Review.__table__.c)
+
+async def apply_rating_change(db: AsyncSession, book_id: int, added_rating: int = None, removed_rating: int = None):
+    """
+    Adjusts the rating aggregate of a book for a review being added, removed or re-rated.
+
+    The update runs in the caller's transaction so the aggregate commits together with the review.
+    Books created before the aggregate existed have no row yet; it is seeded from their reviews,
+    this change included, unless a concurrent write seeded it first, which the delta then adjusts.
+
+    Returns:
+        tuple: The new review count and rating sum of the book, None when nothing changed.
+    """
+    deltas = Counter()
+    for rating, sign in ((added_rating, 1), (removed_rating, -1)):
+        if rating is None:
+            continue
+        deltas["review_count"] += sign
+        deltas["rating_sum"] += sign * rating
+        if rating in models.RATING_VALUES:
+            deltas[f"rating_{rating}"] += sign
+    stats = models.BookRatingStats
+    values = {key: getattr(stats, key) + delta for key, delta in deltas.items() if delta}
+    if not values:
+        return None
     result = await db.execute(
-        select(models.Review).filter(
-            and_(
-                models.Review.book_id == book_id,
-                models.Review.user_id == user_id
-            )
-        )
+        update(stats).where(stats.book_id == book_id).values(values).returning(stats.review_count, stats.rating_sum)
     )
-    existing_review = result.scalars().first()
-    if existing_review:
-        raise HTTPException(status_code=403, detail="You have already reviewed this book")
+    row = result.first()
+    if row is None:
+        await db.flush()
+        # ON CONFLICT DO NOTHING waits for a concurrent seed of the same book instead of failing
+        dialect = db.bind.dialect.name
+        if dialect == "postgresql":
+            seed = postgresql.insert(stats).on_conflict_do_nothing(index_elements=["book_id"])
+        elif dialect == "sqlite":
+            seed = sqlite.insert(stats).on_conflict_do_nothing(index_elements=["book_id"])
+        else:
+            seed = insert(stats)
+        result = await db.execute(seed.from_select(RATING_STATS_COLUMNS, rating_stats_query(book_id)))
+        if result.rowcount:
+            result = await db.execute(select(stats.review_count, stats.rating_sum).where(stats.book_id == book_id))
+        else:
+            result = await db.execute(
+                update(stats).where(stats.book_id == book_id).values(values)
+                .returning(stats.review_count, stats.rating_sum)
+            )
+        row = result.first()
+        # Without a book to aggregate, the book does not exist (SQLite does not enforce foreign keys)
+        if row is None:
+            raise HTTPException(status_code=404, detail="Book not found")
+    return tuple(row)
+
+def rating_stats_query(book_id: int = None):
+    """Selects the rating aggregate rows of the books, in RATING_STATS_COLUMNS order, from the reviews table."""
+    review = models.Review
+    book = book_models.Book
+    histogram = [func.coalesce(func.sum(case((review.rating == rating, 1), else_=0)), 0)
+                 for rating in models.RATING_VALUES]
+    query = (select(book.id, func.count(review.id), func.coalesce(func.sum(review.rating), 0), *histogram)
+             .select_from(book)
+             .outerjoin(review, review.book_id == book.id)
+             .group_by(book.id))
+    if book_id is not None:
+        query = query.filter(book.id == book_id)
+    return query
+
+async def recompute_rating_stats(db: AsyncSession, book_id: int = None) -> int:
+    """
+    Rebuilds the rating aggregates from the reviews table, for one book or for every book.
+
+    Returns:
+        int: The number of books whose aggregate was rebuilt.
+    """
+    stats = models.BookRatingStats
+    clear = delete(stats)
+    if book_id is not None:
+        clear = clear.where(stats.book_id == book_id)
+    await db.execute(clear)
+    result = await db.execute(insert(stats).from_select(RATING_STATS_COLUMNS, rating_stats_query(book_id)))
+    return result.rowcount
+
+def constraint_name(error: IntegrityError):
+    """
+    Returns the name of the constraint an IntegrityError violated, as reported by asyncpg or
+    psycopg, or None when the driver does not report it, as SQLite does.
+    """
+    # The asyncpg error is the cause of the adapted DBAPI error SQLAlchemy wraps
+    for source in (error.orig, getattr(error.orig, "__cause__", None)):
+        name = getattr(source, "constraint_name", None) or \
+            getattr(getattr(source, "diag", None), "constraint_name", None)
+        if name:
+            return name
+    return None
 
 async def create_review(db: AsyncSession, review: schemas.ReviewCreate, current_user_id: int):
-    # Check if the book exists
-    await check_book_exists(db, review.book_id)
-    # Check if the user has already reviewed this book
-    await check_already_reviewed(db, review.book_id, current_user_id)
-    # Create a new review
-    new_review = models.Review(**review.dict(), user_id=current_user_id)
-    db.add(new_review)
+    # Insert the review unless the user already reviewed the book, in one statement
+    try:
+        result = await db.execute(insert_review(db, {**review.dict(), "user_id": current_user_id}))
+        new_review = result.mappings().first()
+    except IntegrityError as e:
+        await db.rollback()
+        name = constraint_name(e)
+        if name is None and "unique" in str(e.orig).lower():
+            name = "uq_reviews_book_id_user_id"
+        if name is None and "foreign key" in str(e.orig).lower():
+            # SQLite does not name the failed foreign key, look for the missing row instead
+            if await db.get(book_models.Book, review.book_id) is None:
+                name = "reviews_book_id_fkey"
+            elif await db.get(user_models.User, current_user_id) is None:
+                name = "reviews_user_id_fkey"
+        if name not in REVIEW_CONSTRAINT_ERRORS:
+            raise
+        status_code, detail = REVIEW_CONSTRAINT_ERRORS[name]
+        raise HTTPException(status_code=status_code, detail=detail)
+    if new_review is None:
+        raise HTTPException(status_code=403, detail="You have already reviewed this book")
+    rating_stats = await apply_rating_change(db, review.book_id, added_rating=review.rating)
     await db.commit()
-    await db.refresh(new_review)
-    return new_review
+    # The book's rating stats and review list both changed
+    response_cache.invalidate(book_tag(review.book_id), book_reviews_tag(review.book_id))
+    similarity_index.record_rating(review.book_id, current_user_id, review.rating)
+    if rating_stats is not None:
+        leaderboards.set_rating(review.book_id, *rating_stats)
+    leaderboards.add_review(review.book_id, new_review["id"], timestamp(new_review["created_at"]))
+    return dict(new_review)
 
 async def update_review(db: AsyncSession, review_id: int, review: schemas.ReviewUpdate, current_user_id: int):
     # Check if the review exists and belongs to the current user
@@ -62,10 +193,17 @@ async def update_review(db: AsyncSession, review_id: int, review: schemas.Review
     # # Check if the book exists
     # await check_book_exists(db, review.book_id)
     # Update the review
+    previous_rating = review_db.rating
     for key, value in review.dict(exclude_unset=True).items():
         setattr(review_db, key, value)
+    rating_stats = await apply_rating_change(db, review_db.book_id, added_rating=review_db.rating,
+                                             removed_rating=previous_rating)
     await db.commit()
     await db.refresh(review_db)
+    response_cache.invalidate(book_tag(review_db.book_id), book_reviews_tag(review_db.book_id))
+    similarity_index.record_rating(review_db.book_id, review_db.user_id, review_db.rating)
+    if rating_stats is not None:
+        leaderboards.set_rating(review_db.book_id, *rating_stats)
     return review_db
 
 async def delete_review(db: AsyncSession, review_id: int, current_user_id: int):
@@ -78,36 +216,75 @@ async def delete_review(db: AsyncSession, review_id: int, current_user_id: int):
     if review_db.user_id != current_user_id and not await is_admin(db, current_user_id):
         raise HTTPException(status_code=403, detail="Not authorized to perform this action")
     # Delete review
+    book_id, user_id, created_at = review_db.book_id, review_db.user_id, review_db.created_at
     await db.delete(review_db)
+    rating_stats = await apply_rating_change(db, book_id, removed_rating=review_db.rating)
     await db.commit()
+    response_cache.invalidate(book_tag(book_id), book_reviews_tag(book_id))
+    similarity_index.record_rating(book_id, user_id)
+    if rating_stats is not None:
+        leaderboards.set_rating(book_id, *rating_stats)
+    leaderboards.remove_review(book_id, review_id, timestamp(created_at) if created_at else None)
     return {"message": "Review deleted successfully"}
 
-async def get_reviews_by_book(db: AsyncSession, book_id: int):
-    # Retrieve reviews for the book
-    result = await db.execute(
-        select(models.Review, user_models.User).join(user_models.User).filter(
-            models.Review.book_id == book_id
-        )
-    )
-    reviews = result.all()
-    # Process reviews to handle deactivated users
-    reviews_list = []
-    for review, user in reviews:
-        review_data = schemas.BookUserReviewResponse(
-            book_id=review.book_id,
-            id=review.id,
-            display_name=user.display_name if user.account_status else "Unknown user",
-            user_id= user.id,
-            review_text=review.review_text,
-            rating=review.rating
-        )
-        # review_data.display_name = user.display_name if user.account_status else "Unknown user"
-        reviews_list.append(review_data)
-    return reviews_list
-
-async def get_reviews_by_user(db: AsyncSession, user_id: int):
-    query = (select(models.Review, book_models.Book.title)
-             .join(book_models.Book, book_models.Book.id == models.Review.book_id)
-             .filter(models.Review.user_id == user_id))
-    result = await db.execute(query)
-    return [{"book_id": row.Review.book_id, "book_title": row.title, "review_text": row.Review.review_text, "rating": row.Review.rating} for row in result]
+def paginate_reviews(query, sort: str, limit: int, cursor: str = None, rating: int = None):
+    """Orders a review query by the sort key and restricts it to the requested page and rating."""
+    columns, order = REVIEW_SORTS[sort]
+    if rating is not None:
+        query = query.filter(models.Review.rating == rating)
+    if cursor:
+        query = query.filter(keyset_filter(columns, decode_cursor(cursor, sort, order), order))
+    # Fetch one extra row to know whether another page exists
+    return query.order_by(*order_by_clause(columns, order)).limit(limit + 1)
+
+def split_page(rows: list, sort: str, limit: int):
+    """Returns the rows of the page and the cursor of the next page, None on the last page."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    columns, order = REVIEW_SORTS[sort]
+    return rows, encode_cursor(sort, order, [getattr(rows[-1], column.key) for column in columns])
+
+async def get_reviews_by_book(db: AsyncSession, book_id: int, sort: str = "newest", limit: int = 20,
+                              cursor: str = None, rating: int = None, user_id: int = None):
+    """
+    Returns a page of the reviews of a book, as dicts, along with the cursor of the next page.
+
+    Only the columns shown are selected, and every page is located with a keyset condition
+    on the sort key, so each request reads at most limit + 1 rows.
+    """
+    review, user = models.Review, user_models.User
+    query = (select(review.id, review.book_id, review.user_id, review.review_text, review.rating,
+                    user.display_name, user.account_status)
+             .join(user, user.id == review.user_id)
+             .filter(review.book_id == book_id))
+    if user_id is not None:
+        query = query.filter(review.user_id == user_id)
+    result = await db.execute(paginate_reviews(query, sort, limit, cursor, rating))
+    rows, next_cursor = split_page(result.all(), sort, limit)
+    # BookUserReviewResponse shaped dicts, with deactivated users shown as unknown
+    reviews = [
+        {
+            "book_id": row.book_id,
+            "id": row.id,
+            "display_name": row.display_name if row.account_status else "Unknown user",
+            "user_id": row.user_id,
+            "review_text": row.review_text,
+            "rating": row.rating,
+        }
+        for row in rows
+    ]
+    return reviews, next_cursor
+
+async def get_reviews_by_user(db: AsyncSession, user_id: int, sort: str = "newest", limit: int = 20,
+                              cursor: str = None, rating: int = None):
+    """Returns a page of the reviews written by a user, as dicts, along with the cursor of the next page."""
+    review = models.Review
+    query = (select(review.id, review.book_id, review.review_text, review.rating, book_models.Book.title)
+             .join(book_models.Book, book_models.Book.id == review.book_id)
+             .filter(review.user_id == user_id))
+    result = await db.execute(paginate_reviews(query, sort, limit, cursor, rating))
+    rows, next_cursor = split_page(result.all(), sort, limit)
+    reviews = [{"book_id": row.book_id, "book_title": row.title, "review_text": row.review_text, "rating": row.rating}
+               for row in rows]
+    return reviews, next_cursor
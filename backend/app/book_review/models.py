@@ -1,11 +1,54 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint, Index
 from database import Base
 
+# Ratings accepted for a review, one histogram bucket per value
+RATING_VALUES = (1, 2, 3, 4, 5)
+
+def average_rating(rating_sum: int, review_count: int) -> float:
+    return round(rating_sum / review_count, 2) if review_count else 0.0
+
 class Review(Base):
     __tablename__ = "reviews"
 
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey("books.id"), index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # Named as Postgres names them by default, so create_review can tell which one failed
+    book_id = Column(Integer, ForeignKey("books.id", name="reviews_book_id_fkey"))
+    user_id = Column(Integer, ForeignKey("users.id", name="reviews_user_id_fkey"))
     review_text = Column(String)
     rating = Column(Integer)
+    # UTC time the review was written, null for the reviews written before it was recorded
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # One review per user and book, also the conflict target of create_review
+        UniqueConstraint("book_id", "user_id", name="uq_reviews_book_id_user_id"),
+        # One index per list sort, so a page is an index range scan for the newest and
+        # rating orders, with or without the rating filter
+        Index("ix_reviews_book_id_id", "book_id", "id"),
+        Index("ix_reviews_book_id_rating_id", "book_id", "rating", "id"),
+        Index("ix_reviews_user_id_id", "user_id", "id"),
+        Index("ix_reviews_user_id_rating_id", "user_id", "rating", "id"),
+        # The recent reviews the trending leaderboard is rebuilt from
+        Index("ix_reviews_created_at", "created_at"),
+    )
+
+class BookRatingStats(Base):
+    __tablename__ = "book_rating_stats"
+
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    rating_1 = Column(Integer, nullable=False, default=0)
+    rating_2 = Column(Integer, nullable=False, default=0)
+    rating_3 = Column(Integer, nullable=False, default=0)
+    rating_4 = Column(Integer, nullable=False, default=0)
+    rating_5 = Column(Integer, nullable=False, default=0)
+
+    @property
+    def average_rating(self) -> float:
+        return average_rating(self.rating_sum, self.review_count)
+
+    @property
+    def histogram(self) -> dict:
+        return {str(rating): getattr(self, f"rating_{rating}") for rating in RATING_VALUES}
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Literal, Optional
 from book_review import schemas, crud
 from core.security import get_current_user_id,_token_header
-from database import get_db
+from core.response_cache import response_cache, cache_key, conditional_response, book_reviews_tag, user_tag
+from core.pagination import NEXT_CURSOR_HEADER
+from core.serialization import FastJSONResponse
+from database import get_db, get_read_db, get_shared_read_db
 
 router = APIRouter()
 
@@ -36,9 +39,34 @@ async def delete_review(
     return await crud.delete_review(db, review_id, current_user_id)
 
 @router.get("/book/{book_id}", response_model=List[schemas.BookUserReviewResponse])
-async def get_reviews_by_book(book_id: int, db: AsyncSession = Depends(get_db)):
-    return await crud.get_reviews_by_book(db, book_id)
+async def get_reviews_by_book(
+    book_id: int,
+    request: Request,
+    sort: Literal["newest", "highest", "lowest"] = "newest",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    rating: Optional[int] = Query(None, ge=1, le=5),
+    user_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_shared_read_db)
+):
+    cached = response_cache.get(cache_key(request))
+    if cached is None:
+        since = response_cache.generation
+        reviews, next_cursor = await crud.get_reviews_by_book(db, book_id, sort, limit, cursor, rating, user_id)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+        # The display names shown depend on the reviewers' accounts too
+        tags = [book_reviews_tag(book_id)] + [user_tag(review["user_id"]) for review in reviews]
+        cached = response_cache.store(cache_key(request), reviews, tags, headers, since=since)
+    return conditional_response(request, cached)
 
 @router.get("/user/{user_id}", response_model=List[schemas.UserReviewResponse])
-async def get_reviews_by_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    return await crud.get_reviews_by_user(db, user_id)
+async def get_reviews_by_user(
+    user_id: int,
+    sort: Literal["newest", "highest", "lowest"] = "newest",
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    rating: Optional[int] = Query(None, ge=1, le=5),
+    db: AsyncSession = Depends(get_read_db)
+):
+    reviews, next_cursor = await crud.get_reviews_by_user(db, user_id, sort, limit, cursor, rating)
+    return FastJSONResponse(reviews, headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class ReviewBase(BaseModel):
     book_id: int
@@ -6,11 +6,11 @@ class ReviewBase(BaseModel):
     rating: int
 
 class ReviewCreate(ReviewBase):
-    pass
+    rating: int = Field(..., ge=1, le=5)
 
 class ReviewUpdate(BaseModel):
     review_text: str
-    rating: int
+    rating: int = Field(..., ge=1, le=5)
 
 class ReviewResponse(ReviewBase):
     id: int
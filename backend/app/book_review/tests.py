@@ -111,3 +111,137 @@ def test_book_review_j_delete_book_and_user():
 
     response = requests.delete(f"{BASE_URL}/users/{user_a_id}", headers={"x-access-token": admin_token})
     assert response.status_code == 200
+
+def test_book_review_k_rating_stats():
+    response = requests.post(f"{BASE_URL}/users/", json={
+        "full_name": "User S",
+        "display_name": "userS",
+        "password": "passwordS",
+        "email": "userS@example.com"
+    })
+    assert response.status_code == 200
+    user_s_id = response.json()["id"]
+    response = requests.post(f"{BASE_URL}/users/login", json={
+        "email": "userS@example.com",
+        "password": "passwordS"
+    })
+    user_s_token = response.json()["access_token"]
+    response = requests.post(f"{BASE_URL}/books/", json={
+        "title": "Rated Book",
+        "author": "Rated Author",
+        "genre": "Rated Genre",
+        "year_published": 2024,
+        "summary": "Rated Summary",
+        "book_url": "http://example.com/rated_book"
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    rated_book_id = response.json()["id"]
+    assert response.json()["rating_stats"]["review_count"] == 0
+
+    # Ratings outside 1 to 5 are rejected
+    response = requests.post(f"{BASE_URL}/reviews/", json={
+        "book_id": rated_book_id, "review_text": "Too high", "rating": 6
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 422
+
+    response = requests.post(f"{BASE_URL}/reviews/", json={
+        "book_id": rated_book_id, "review_text": "Admin review", "rating": 5
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    response = requests.post(f"{BASE_URL}/reviews/", json={
+        "book_id": rated_book_id, "review_text": "User review", "rating": 2
+    }, headers={"x-access-token": user_s_token})
+    assert response.status_code == 200
+    user_review_id = response.json()["id"]
+    stats = requests.get(f"{BASE_URL}/books/{rated_book_id}").json()["rating_stats"]
+    assert stats["review_count"] == 2
+    assert stats["average_rating"] == 3.5
+    assert stats["histogram"]["2"] == 1 and stats["histogram"]["5"] == 1
+
+    response = requests.put(f"{BASE_URL}/reviews/{user_review_id}", json={
+        "review_text": "Changed my mind", "rating": 4
+    }, headers={"x-access-token": user_s_token})
+    assert response.status_code == 200
+    stats = requests.get(f"{BASE_URL}/books/{rated_book_id}").json()["rating_stats"]
+    assert stats["average_rating"] == 4.5
+    assert stats["histogram"]["2"] == 0 and stats["histogram"]["4"] == 1
+
+    response = requests.delete(f"{BASE_URL}/reviews/{user_review_id}", headers={"x-access-token": user_s_token})
+    assert response.status_code == 200
+    stats = requests.get(f"{BASE_URL}/books/{rated_book_id}").json()["rating_stats"]
+    assert stats["review_count"] == 1
+    assert stats["average_rating"] == 5.0
+
+    response = requests.delete(f"{BASE_URL}/books/{rated_book_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    response = requests.delete(f"{BASE_URL}/users/{user_s_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+
+
+def test_book_review_l_pagination():
+    users = []
+    for name in ("P1", "P2", "P3"):
+        response = requests.post(f"{BASE_URL}/users/", json={
+            "full_name": f"User {name}",
+            "display_name": f"user{name}",
+            "password": f"password{name}",
+            "email": f"user{name}@example.com"
+        })
+        assert response.status_code == 200
+        response_login = requests.post(f"{BASE_URL}/users/login", json={
+            "email": f"user{name}@example.com",
+            "password": f"password{name}"
+        })
+        users.append((response.json()["id"], response_login.json()["access_token"]))
+    response = requests.post(f"{BASE_URL}/books/", json={
+        "title": "Paged Book",
+        "author": "Paged Author",
+        "genre": "Paged Genre",
+        "year_published": 2024,
+        "summary": "Paged Summary",
+        "book_url": "http://example.com/paged_book"
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    paged_book_id = response.json()["id"]
+    review_ids = []
+    for (user_id, token), rating in zip(users, (3, 5, 1)):
+        response = requests.post(f"{BASE_URL}/reviews/", json={
+            "book_id": paged_book_id, "review_text": f"Rated {rating}", "rating": rating
+        }, headers={"x-access-token": token})
+        assert response.status_code == 200
+        review_ids.append(response.json()["id"])
+
+    # Newest first, two per page
+    response = requests.get(f"{BASE_URL}/reviews/book/{paged_book_id}", params={"limit": 2})
+    assert [review["id"] for review in response.json()] == review_ids[:0:-1]
+    cursor = response.headers["X-Next-Cursor"]
+    response = requests.get(f"{BASE_URL}/reviews/book/{paged_book_id}", params={"limit": 2, "cursor": cursor})
+    assert [review["id"] for review in response.json()] == review_ids[:1]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = requests.get(f"{BASE_URL}/reviews/book/{paged_book_id}", params={"sort": "highest"})
+    assert [review["rating"] for review in response.json()] == [5, 3, 1]
+    response = requests.get(f"{BASE_URL}/reviews/book/{paged_book_id}", params={"sort": "lowest", "limit": 1})
+    assert [review["rating"] for review in response.json()] == [1]
+    # A cursor only continues the sort it was issued for
+    response = requests.get(f"{BASE_URL}/reviews/book/{paged_book_id}",
+                            params={"sort": "highest", "cursor": response.headers["X-Next-Cursor"]})
+    assert response.status_code == 400
+
+    response = requests.get(f"{BASE_URL}/reviews/book/{paged_book_id}", params={"rating": 5})
+    assert [review["id"] for review in response.json()] == [review_ids[1]]
+    response = requests.get(f"{BASE_URL}/reviews/book/{paged_book_id}", params={"user_id": users[2][0]})
+    assert [review["id"] for review in response.json()] == [review_ids[2]]
+    response = requests.get(f"{BASE_URL}/reviews/book/{paged_book_id}", params={"rating": 6})
+    assert response.status_code == 422
+
+    response = requests.get(f"{BASE_URL}/reviews/user/{users[0][0]}", params={"limit": 1, "rating": 3})
+    assert response.status_code == 200
+    assert response.json()[0]["book_title"] == "Paged Book"
+    assert "X-Next-Cursor" not in response.headers
+
+    response = requests.delete(f"{BASE_URL}/books/{paged_book_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    for user_id, _ in users:
+        response = requests.delete(f"{BASE_URL}/users/{user_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
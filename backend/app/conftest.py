@@ -0,0 +1,47 @@
+import pytest
+import requests
+from urllib.parse import urlsplit
+from core.query_stats import QUERY_COUNT_HEADER
+
+BASE_URL = "http://localhost:8001"
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Asserts the number of SQL statements a response cost, as reported by a server started
+    with QUERY_STATS_ENABLED=true. Tests using it are skipped against other servers.
+
+    Example:
+        def test_get_book(query_budget):
+            response = requests.get(f"{BASE_URL}/books/1")
+            query_budget(response, 2)
+    """
+    def check(response, max_queries: int):
+        if QUERY_COUNT_HEADER not in response.headers:
+            pytest.skip(f"The server does not report {QUERY_COUNT_HEADER}, start it with QUERY_STATS_ENABLED=true")
+        queries = int(response.headers[QUERY_COUNT_HEADER])
+        assert queries <= max_queries, \
+            f"{response.request.method} {response.request.path_url} ran {queries} SQL statements, budget {max_queries}"
+    return check
+
+
+@pytest.fixture
+def local_storage():
+    """
+    Skips the test unless the server stores uploads with STORAGE_BACKEND=local, and returns a
+    function giving the URL a stored file is served from by the server under test.
+
+    Example:
+        def test_upload(local_storage):
+            ...
+            cover = requests.get(local_storage(response.json()["file_url"]))
+    """
+    # The direct upload route only exists for the local storage, a bad token is rejected there
+    if requests.put(f"{BASE_URL}/users/uploads/probe", data=b"").status_code == 404:
+        pytest.skip("The server does not use the local storage, start it with STORAGE_BACKEND=local")
+
+    def served_url(file_url: str) -> str:
+        # LOCAL_STORAGE_BASE_URL may name another host, the files are served under /media either way
+        return f"{BASE_URL}{urlsplit(file_url).path}"
+    return served_url
@@ -0,0 +1,42 @@
+from typing import List
+from fastapi import HTTPException, Query
+from sqlalchemy import Integer, any_, literal
+from sqlalchemy.dialects import postgresql
+from core.config import BATCH_MAX_IDS
+
+# Ids are positive and fit the 32 bit integer columns they are bound against
+MAX_ID = 2 ** 31 - 1
+
+
+def batch_ids(ids: str = Query(..., description=f"Comma separated ids, at most {BATCH_MAX_IDS}")) -> List[int]:
+    """
+    Parses the comma separated ids of a batch lookup, in order and without repeats.
+
+    Raises:
+        HTTPException: 422 when an id is not an integer between 1 and MAX_ID, or there are none or
+        too many.
+    """
+    try:
+        parsed = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be comma separated integers")
+    if any(not 1 <= value <= MAX_ID for value in parsed):
+        raise HTTPException(status_code=422, detail=f"ids must be between 1 and {MAX_ID}")
+    unique = list(dict.fromkeys(parsed))
+    if not unique:
+        raise HTTPException(status_code=422, detail="ids must not be empty")
+    if len(unique) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=422, detail=f"At most {BATCH_MAX_IDS} ids can be looked up at once")
+    return unique
+
+
+def id_in(column, ids: list, dialect: str):
+    """
+    Matches the rows whose column is one of ids.
+
+    On Postgres the ids are bound as one array, `column = ANY(:ids)`, so the statement and its
+    prepared plan are the same however many ids there are; elsewhere it is an IN list.
+    """
+    if dialect == "postgresql":
+        return column == any_(literal(ids, postgresql.ARRAY(Integer)))
+    return column.in_(ids)
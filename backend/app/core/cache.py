@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from time import monotonic
+
+
+class TTLCache:
+    """
+    A size bounded LRU mapping whose entries expire after a fixed time to live.
+
+    The cache is local to the process and not thread safe; it is meant to be used from the event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """Returns the cached value for the key, or the default when it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        """Stores the value, evicting the least recently used entries beyond the size bound."""
+        self._entries[key] = (monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drops the entry of the key, if any."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drops every entry."""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the size and hit/miss counters of the cache."""
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
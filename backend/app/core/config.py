@@ -10,3 +10,73 @@ SECRET_KEY: str = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM: str = "HS256"
 ACCESS_TOKEN_EXPIRE_SECONDS: int = 3600
 
+# Principal cache used by the authentication helpers
+PRINCIPAL_CACHE_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS: float = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+# Worker pool used for password hashing and verification ("thread" or "process")
+PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# Storage of uploaded files: "s3" or "local" (a directory served by the API under /media)
+STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "s3")
+STORAGE_BUCKET: str = os.getenv("STORAGE_BUCKET", "bookreviewapp")
+LOCAL_STORAGE_DIR: str = os.getenv("LOCAL_STORAGE_DIR", "media")
+LOCAL_STORAGE_BASE_URL: str = os.getenv("LOCAL_STORAGE_BASE_URL", "http://localhost:8000/media")
+STORAGE_IO_WORKERS: int = int(os.getenv("STORAGE_IO_WORKERS", "8"))
+STORAGE_IO_MAX_PENDING: int = int(os.getenv("STORAGE_IO_MAX_PENDING", "64"))
+# Local file listing the objects known to be stored, so duplicate uploads skip the backend
+# after a restart (empty, the default, keeps the index in memory). Give an absolute path
+# outside LOCAL_STORAGE_DIR, which is served
+STORAGE_INDEX_FILE: str = os.getenv("STORAGE_INDEX_FILE", "")
+MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Lifetime of the presigned URLs (and local upload tokens) clients store their files with
+UPLOAD_URL_EXPIRE_SECONDS: int = int(os.getenv("UPLOAD_URL_EXPIRE_SECONDS", "900"))
+# Files larger than one part are sent to S3 as a multipart upload (parts must be at least 5 MB)
+UPLOAD_PART_BYTES: int = int(os.getenv("UPLOAD_PART_BYTES", str(8 * 1024 * 1024)))
+# Book cover variants rendered on upload: the widths of each size, the formats (best first,
+# the last one the fallback every browser decodes) and the process pool rendering them
+COVER_THUMBNAIL_WIDTH: int = int(os.getenv("COVER_THUMBNAIL_WIDTH", "320"))
+COVER_MEDIUM_WIDTH: int = int(os.getenv("COVER_MEDIUM_WIDTH", "960"))
+COVER_FORMATS: list = [fmt.strip() for fmt in os.getenv("COVER_FORMATS", "avif,webp,jpeg").split(",") if fmt.strip()]
+IMAGE_WORKERS: int = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_MAX_PENDING: int = int(os.getenv("IMAGE_MAX_PENDING", "16"))
+# Response cache of the book and review read endpoints
+RESPONSE_CACHE_MAX_BYTES: int = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS: float = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+# Optional read replicas, comma separated URLs, used by the read-only routes
+DATABASE_REPLICA_URLS: list = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# Replicas lagging more than this are skipped, and readers see the primary for this long after writing
+REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_HEALTH_CHECK_SECONDS: float = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", "5"))
+# Interval of the background sampling of host CPU, memory and disk usage
+SYSTEM_SAMPLE_SECONDS: float = float(os.getenv("SYSTEM_SAMPLE_SECONDS", "5"))
+# Opt-in SQL statement counting per request, reported in the X-DB-Queries and X-DB-Time-ms headers
+QUERY_STATS_ENABLED: bool = os.getenv("QUERY_STATS_ENABLED", "false").lower() in ("1", "true", "yes")
+# Requests running more statements than this, or one statement this many times, are logged
+QUERY_BUDGET: int = int(os.getenv("QUERY_BUDGET", "10"))
+QUERY_REPEAT_THRESHOLD: int = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+# Log every SQL statement to stdout, for local debugging only
+DATABASE_ECHO: bool = os.getenv("DATABASE_ECHO", "false").lower() in ("1", "true", "yes")
+# Statements slower than this are kept, with their query plan, in a ring buffer served by /admin/slow-queries
+SLOW_QUERY_THRESHOLD_MS: float = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_LOG_SIZE: int = int(os.getenv("SLOW_QUERY_LOG_SIZE", "200"))
+SLOW_QUERY_EXPLAIN: bool = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+# EXPLAIN ANALYZE runs slow SELECTs a second time to capture actual row counts and timings
+SLOW_QUERY_EXPLAIN_ANALYZE: bool = os.getenv("SLOW_QUERY_EXPLAIN_ANALYZE", "false").lower() in ("1", "true", "yes")
+# Similar books: neighbours kept per book, delay batching review writes before the index is
+# refreshed, interval of the full rebuild from the reviews (0 to only build at startup) and
+# the memory of one block of the similarity computation
+SIMILAR_BOOKS_K: int = int(os.getenv("SIMILAR_BOOKS_K", "20"))
+SIMILARITY_REFRESH_SECONDS: float = float(os.getenv("SIMILARITY_REFRESH_SECONDS", "1"))
+SIMILARITY_REBUILD_SECONDS: float = float(os.getenv("SIMILARITY_REBUILD_SECONDS", "3600"))
+SIMILARITY_BLOCK_MB: int = int(os.getenv("SIMILARITY_BLOCK_MB", "256"))
+SIMILARITY_MAX_USER_RATINGS: int = int(os.getenv("SIMILARITY_MAX_USER_RATINGS", "2000"))
+# Leaderboards: reviews of the prior mixed into every book's Bayesian average, half life of a
+# review's weight in the trending score and age past which it no longer counts, and interval of
+# the full rebuild from the database (0 to only build at startup)
+LEADERBOARD_PRIOR_REVIEWS: float = float(os.getenv("LEADERBOARD_PRIOR_REVIEWS", "10"))
+TRENDING_HALF_LIFE_HOURS: float = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "48"))
+TRENDING_WINDOW_DAYS: float = float(os.getenv("TRENDING_WINDOW_DAYS", "7"))
+LEADERBOARD_REBUILD_SECONDS: float = float(os.getenv("LEADERBOARD_REBUILD_SECONDS", "600"))
+# Most ids accepted by the batch lookups, GET /books/batch and GET /users/batch
+BATCH_MAX_IDS: int = int(os.getenv("BATCH_MAX_IDS", "500"))
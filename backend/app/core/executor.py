@@ -0,0 +1,95 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
+from functools import partial
+from time import perf_counter
+from fastapi import HTTPException
+
+
+class BoundedExecutor:
+    """
+    Runs blocking or CPU bound calls in a worker pool without blocking the event loop.
+
+    At most `max_pending` calls may be queued or running at a time; further calls are rejected
+    straight away with a 503 so a burst of expensive requests cannot pile up behind the pool.
+    """
+
+    def __init__(self, name: str, workers: int, max_pending: int, kind: str = "thread"):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.kind = kind
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._latencies = deque(maxlen=1024)
+        self._executor = None
+
+    def _get_executor(self) -> Executor:
+        # Created on first use so importing the module does not start workers
+        if self._executor is None:
+            pool = ProcessPoolExecutor if self.kind == "process" else ThreadPoolExecutor
+            self._executor = pool(max_workers=self.workers)
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Runs `fn(*args, **kwargs)` in the pool and returns its result.
+
+        Raises:
+            HTTPException: 503 if the pool already has `max_pending` calls queued or running, or if
+                a worker process died during the call, which breaks the pool; a new pool is then
+                started for the next calls.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server is busy, please retry",
+                                headers={"Retry-After": "1"})
+        executor = self._get_executor()
+        self.pending += 1
+        started = perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args, **kwargs))
+        except BrokenExecutor:
+            self.failed += 1
+            # The calls in flight on the broken pool all fail; only the first one replaces it
+            if self._executor is executor:
+                self.shutdown()
+            raise HTTPException(status_code=503, detail="Server is busy, please retry",
+                                headers={"Retry-After": "1"})
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+            self._latencies.append(perf_counter() - started)
+
+    def stats(self) -> dict:
+        """
+        Returns the queue depth, counters and latency percentiles (ms) over the recent calls.
+
+        `completed` counts the calls that returned, `failed` the calls that raised or were cancelled.
+        """
+        latencies = sorted(self._latencies)
+
+        def percentile(fraction):
+            return round(latencies[int(fraction * (len(latencies) - 1))] * 1000, 2) if latencies else 0.0
+
+        return {
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+    def shutdown(self):
+        """Stops the worker pool, if it was started."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
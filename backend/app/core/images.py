@@ -0,0 +1,117 @@
+import asyncio
+import io
+from PIL import Image, ImageOps
+from core.config import COVER_THUMBNAIL_WIDTH, COVER_MEDIUM_WIDTH, COVER_FORMATS, IMAGE_WORKERS, IMAGE_MAX_PENDING
+from core.executor import BoundedExecutor
+from core.storage import content_storage, iter_bytes
+
+# Decoding and encoding images is CPU bound and holds the GIL, so it runs in worker processes
+image_executor = BoundedExecutor("image_processing", IMAGE_WORKERS, IMAGE_MAX_PENDING, kind="process")
+
+# Widths of the cover variants; the height follows the aspect ratio, up to MAX_ASPECT times the width
+COVER_SIZES = {"thumbnail": COVER_THUMBNAIL_WIDTH, "medium": COVER_MEDIUM_WIDTH}
+MAX_ASPECT = 2
+
+# Pillow format, MIME type, file extension and encoder options of each variant format
+IMAGE_FORMATS = {
+    "avif": ("AVIF", "image/avif", "avif", {"quality": 50, "speed": 8}),
+    "webp": ("WEBP", "image/webp", "webp", {"quality": 75, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", "jpg", {"quality": 80, "optimize": True, "progressive": True}),
+}
+
+
+def supported_formats(formats: list) -> list:
+    """Returns the formats this Pillow build can encode, AVIF needing a recent one, in order."""
+    Image.init()
+    return [fmt for fmt in formats if fmt in IMAGE_FORMATS and IMAGE_FORMATS[fmt][0] in Image.SAVE]
+
+
+COVER_IMAGE_FORMATS = supported_formats(COVER_FORMATS)
+
+
+def variant_key(key: str, size: str, fmt: str) -> str:
+    """
+    Returns the storage key of a variant, next to the original: books/ab/ab12...ef.png gives
+    books/ab/ab12...ef.png.thumbnail-320.webp. The original's extension is kept so a.png and a.jpg
+    do not clash, and the width so variants rendered under another setting are not reused.
+    """
+    return f"{key}.{size}-{COVER_SIZES[size]}.{IMAGE_FORMATS[fmt][2]}"
+
+
+def render_variants(data: bytes, sizes: dict, formats: list):
+    """
+    Decodes an image and encodes it at every size and format, never enlarging it.
+
+    Runs in the worker processes of image_executor.
+
+    Returns:
+        dict: The encoded bytes by size and format, None when the data is not an image.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        largest = max(sizes.values())
+        # JPEGs are decoded straight at the smallest scale still larger than the largest size
+        image.draft("RGB", (largest, largest * MAX_ASPECT))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return None
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    variants = {}
+    # Each size is resized from the next larger one rather than from the original
+    for size, width in sorted(sizes.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((width, width * MAX_ASPECT), Image.LANCZOS, reducing_gap=3.0)
+        variants[size] = {}
+        for fmt in formats:
+            pil_format, _, _, options = IMAGE_FORMATS[fmt]
+            frame = image
+            if has_alpha and fmt == "jpeg":
+                # JPEG has no transparency, flatten on white
+                frame = Image.new("RGB", image.size, "white")
+                frame.paste(image, mask=image.getchannel("A"))
+            buffer = io.BytesIO()
+            frame.save(buffer, pil_format, **options)
+            variants[size][fmt] = buffer.getvalue()
+    return variants
+
+
+async def stored_cover_variants(key: str):
+    """Returns the URLs of the cover variants of an original by size and format, None unless all are stored."""
+    keys = {(size, fmt): variant_key(key, size, fmt) for size in COVER_SIZES for fmt in COVER_IMAGE_FORMATS}
+    if not all(await asyncio.gather(*(content_storage.has(variant) for variant in keys.values()))):
+        return None
+    variants = {}
+    for (size, fmt), variant in keys.items():
+        variants.setdefault(size, {})[fmt] = content_storage.url_for(variant)
+    return variants
+
+
+async def store_cover_variants(key: str, data: bytes, reuse: bool = False):
+    """
+    Renders the cover variants of an uploaded image in the process pool and stores them next
+    to the original.
+
+    With reuse, for an original that was already stored, the variants are not rendered again
+    when they are all stored already.
+
+    Returns:
+        dict: The variant URLs by size and format, as in BookResponse.cover_variants, None when
+        the upload is not an image.
+    """
+    if reuse:
+        variants = await stored_cover_variants(key)
+        if variants is not None:
+            return variants
+    rendered = await image_executor.run(render_variants, data, COVER_SIZES, COVER_IMAGE_FORMATS)
+    if rendered is None:
+        return None
+    saves = {(size, fmt): content_storage.save_key(variant_key(key, size, fmt), iter_bytes(content),
+                                                        IMAGE_FORMATS[fmt][1])
+             for size, encoded in rendered.items() for fmt, content in encoded.items()}
+    urls = await asyncio.gather(*saves.values())
+    variants = {}
+    for (size, fmt), url in zip(saves, urls):
+        variants.setdefault(size, {})[fmt] = url
+    return variants
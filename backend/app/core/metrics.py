@@ -0,0 +1,263 @@
+import asyncio
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from psutil import cpu_percent, virtual_memory, disk_usage
+from sqlalchemy import event
+from core.config import SYSTEM_SAMPLE_SECONDS
+
+# Latency buckets in seconds, the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"'.replace("\\", "\\\\").replace("\n", "\\n")
+                     for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Base of the metric types, holding one value per combination of label values."""
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def set(self, *label_values, value: float):
+        """Mirrors a counter kept elsewhere, from a collector."""
+        self.values[label_values] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, *label_values, value: float):
+        self.values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, *label_values, value: float):
+        # Per label values: the count of each bucket (not cumulative), then the sum
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        bucket_labels = self.labels + ("le",)
+        for label_values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(bucket_labels, label_values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics of the process, rendered in the Prometheus text exposition format.
+
+    Collectors are callbacks run at scrape time to refresh gauges that mirror state kept
+    elsewhere, such as cache counters or the connection pool.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status", ("method", "route", "status")))
+http_latency = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being handled"))
+db_queries = registry.register(Counter(
+    "db_queries_total", "SQL statements executed by route", ("method", "route")))
+db_query_time = registry.register(Counter(
+    "db_query_seconds_total", "Time spent executing SQL statements by route", ("method", "route")))
+db_pool = registry.register(Gauge(
+    "db_pool_connections", "Connections of the primary database pool by state", ("state",)))
+system_usage = registry.register(Gauge(
+    "system_usage_percent", "Host resource usage sampled in the background", ("resource",)))
+
+
+# Full path template of the routes of included routers, by route object
+route_templates = {}
+
+
+def register_routes(router, prefix: str):
+    """Records the full path templates of the routes of a router included under the prefix."""
+    for route in router.routes:
+        route_templates[id(route)] = prefix + route.path
+
+
+def route_label(scope: dict) -> str:
+    """
+    Returns the path template of the route that handled a request, e.g. "/books/{book_id}",
+    so that every book shares one series. Requests no route matched share "unmatched".
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    return route_templates.get(id(route), route.path)
+
+
+class RequestDBStats:
+    """The SQL statements executed on behalf of one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements = defaultdict(int)
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> list:
+        """Returns the (statement, count) pairs executed at least threshold times, most repeated first."""
+        repeated = [(statement, count) for statement, count in self.statements.items() if count >= threshold]
+        return sorted(repeated, key=lambda item: -item[1])
+
+
+# ASGI scope of the request being handled, set by the metrics middleware
+current_request_scope: ContextVar = ContextVar("current_request_scope", default=None)
+
+# Stats collecting the statements run in the current context, innermost last
+active_db_stats: ContextVar = ContextVar("active_db_stats", default=())
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the SQL statements executed within the block, in this task and the tasks it starts.
+
+    Yields:
+        RequestDBStats: The stats, updated as statements complete.
+
+    Example:
+        with count_queries() as stats:
+            await crud.get_books(db)
+        assert stats.queries <= 2
+    """
+    stats = RequestDBStats()
+    token = active_db_stats.set(active_db_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        active_db_stats.reset(token)
+
+
+def instrument_engine(engine):
+    """
+    Attributes the statements run on an async engine to the active `count_queries` blocks.
+
+    Args:
+        engine (AsyncEngine): The engine to instrument.
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info["query_started"].pop()
+        for stats in active_db_stats.get():
+            stats.record(statement, elapsed)
+
+
+def watch_pool(engine):
+    """Reports the connection pool of the engine in db_pool_connections at scrape time."""
+    pool = engine.pool
+
+    @registry.collector
+    def collect_pool():
+        # Pools without a fixed size (e.g. NullPool) only report what they have
+        if hasattr(pool, "checkedout"):
+            db_pool.set("checked_out", value=pool.checkedout())
+        if hasattr(pool, "size"):
+            db_pool.set("size", value=pool.size())
+        if hasattr(pool, "overflow"):
+            # overflow() counts down from -size while the pool is filling up
+            db_pool.set("overflow", value=max(pool.overflow(), 0))
+
+
+class SystemSampler:
+    """Samples the host CPU, memory and disk usage periodically, off the request path."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.usage = {"cpu": 0.0, "memory": 0.0, "disk": 0.0}
+
+    def sample(self):
+        self.usage = {"cpu": cpu_percent(), "memory": virtual_memory().percent, "disk": disk_usage('/').percent}
+        for resource, value in self.usage.items():
+            system_usage.set(resource, value=value)
+
+    async def run(self):
+        """Samples in a worker thread every interval, until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.sample)
+            await asyncio.sleep(self.interval)
+
+
+system_sampler = SystemSampler(SYSTEM_SAMPLE_SECONDS)
@@ -0,0 +1,74 @@
+import base64
+import json
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+# Response headers used by the cursor paginated list endpoints
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+
+def encode_cursor(sort: str, order: str, values: list) -> str:
+    """
+    Encodes the keyset position of the last row of a page into an opaque cursor.
+
+    Args:
+        sort (str): The sort key the page was ordered by.
+        order (str): The sort direction, "asc" or "desc".
+        values (list): The sort key values of the last row (the id always comes last).
+
+    Returns:
+        str: A url-safe cursor string.
+    """
+    payload = json.dumps([sort, order, values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> list:
+    """
+    Decodes a cursor produced by `encode_cursor` and checks it matches the requested ordering.
+
+    Args:
+        cursor (str): The cursor received from the client.
+        sort (str): The sort key of the current request.
+        order (str): The sort direction of the current request.
+
+    Returns:
+        list: The keyset values to continue after.
+
+    Raises:
+        HTTPException: If the cursor is malformed or was issued for a different ordering.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_order, values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort or cursor_order != order or not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort order")
+    return values
+
+
+def keyset_filter(columns: list, values: list, order: str):
+    """
+    Builds the row-value comparison that continues a keyset scan after the given position.
+
+    Args:
+        columns (list): The ordered sort columns, ending with the unique tie breaker.
+        values (list): The values of those columns on the last row returned.
+        order (str): The sort direction, "asc" or "desc".
+
+    Returns:
+        The SQLAlchemy boolean expression.
+    """
+    if len(columns) != len(values):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(columns) == 1:
+        return columns[0] > values[0] if order == "asc" else columns[0] < values[0]
+    key = tuple_(*columns)
+    return key > tuple_(*values) if order == "asc" else key < tuple_(*values)
+
+
+def order_by_clause(columns: list, order: str) -> list:
+    """Returns the ORDER BY terms for the given sort columns and direction."""
+    return [column.asc() if order == "asc" else column.desc() for column in columns]
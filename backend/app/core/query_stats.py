@@ -0,0 +1,50 @@
+import logging
+from core.metrics import count_queries, route_label
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "X-DB-Queries"
+QUERY_TIME_HEADER = "X-DB-Time-ms"
+
+
+class QueryStatsMiddleware:
+    """
+    Reports the SQL statements each request costs, for development and tests.
+
+    Adds the number of statements and the time spent in them to the response headers, warns
+    when a request runs more statements than the budget, and warns about statements executed
+    repeatedly with only their parameters changing, the usual sign of an N+1 query pattern.
+
+    Statements run after the response headers are sent, such as by streamed exports, are
+    not counted.
+    """
+
+    def __init__(self, app, budget: int, repeat_threshold: int):
+        self.app = app
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as stats:
+            async def send_with_stats(message):
+                if message["type"] == "http.response.start":
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (QUERY_COUNT_HEADER.lower().encode(), str(stats.queries).encode()),
+                        (QUERY_TIME_HEADER.lower().encode(), f"{stats.seconds * 1000:.2f}".encode()),
+                    ]
+                    self.check(scope, stats)
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
+
+    def check(self, scope, stats):
+        request = f"{scope['method']} {route_label(scope)}"
+        if stats.queries > self.budget:
+            logger.warning("%s ran %d SQL statements, over the budget of %d", request, stats.queries, self.budget)
+        for statement, count in stats.repeated(self.repeat_threshold):
+            logger.warning("%s ran the same statement %d times, a possible N+1 query: %s",
+                           request, count, " ".join(statement.split()))
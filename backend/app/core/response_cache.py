@@ -0,0 +1,171 @@
+import hashlib
+from collections import OrderedDict, defaultdict
+from time import monotonic
+from typing import NamedTuple, Iterable
+from fastapi import Request, Response
+from core.config import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL_SECONDS
+from core.serialization import dumps
+
+# Tags linking cached responses to the data they were built from
+BOOK_LIST_TAG = "books"
+
+def book_tag(book_id: int) -> str:
+    return f"book:{book_id}"
+
+def book_reviews_tag(book_id: int) -> str:
+    return f"book_reviews:{book_id}"
+
+def user_tag(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    headers: dict
+    expires: float
+
+
+class ResponseCache:
+    """
+    An in-process LRU cache of serialized JSON responses, bounded by the total size of the bodies.
+
+    Every entry carries tags naming the rows it was built from so write paths can invalidate
+    exactly the affected responses. Entries also expire after a TTL, which bounds how stale
+    the caches of other worker processes can get.
+
+    A read takes the `generation` before querying the database and passes it to `store`, which
+    drops the response when one of its tags was invalidated in the meantime, since it may
+    predate the write.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, max_tracked_tags: int = 100000):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._entry_tags = {}
+        self._tag_keys = defaultdict(set)
+        # Counts invalidations; the generation each tag was last invalidated at, oldest first,
+        # bounded by forgetting the oldest and refusing reads that started before them
+        self.generation = 0
+        self.max_tracked_tags = max_tracked_tags
+        self._invalidated = OrderedDict()
+        self._forgotten_generation = 0
+
+    def get(self, key: str) -> CachedResponse:
+        """Returns the cached response of the key, or None when it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires < monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, key: str, content, tags: Iterable[str], headers: dict = None,
+              since: int = None) -> CachedResponse:
+        """
+        Serializes the content, caches it under the key and returns the cached response.
+
+        Args:
+            key (str): The cache key, see `cache_key`.
+            content: The response content, JSON compatible values or pydantic models.
+            tags (Iterable[str]): The tags the entry is invalidated by.
+            headers (dict): Extra response headers to replay with the body.
+            since (int): The `generation` taken before the content was read. The response is
+                returned but not cached when one of its tags was invalidated after it.
+        """
+        tags = set(tags)
+        body = dumps(content)
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        entry = CachedResponse(body, etag, headers or {}, monotonic() + self.ttl)
+        if len(body) > self.max_bytes or (since is not None and self.changed_since(tags, since)):
+            return entry
+        self._remove(key)
+        self._entries[key] = entry
+        self._entry_tags[key] = tags
+        for tag in tags:
+            self._tag_keys[tag].add(key)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def changed_since(self, tags: Iterable[str], since: int) -> bool:
+        """Tells whether one of the tags may have been invalidated after the since generation."""
+        if since < self._forgotten_generation:
+            return True
+        return any(self._invalidated.get(tag, 0) > since for tag in tags)
+
+    def invalidate(self, *tags: str):
+        """Drops every entry carrying one of the tags."""
+        self.generation += 1
+        for tag in tags:
+            self._invalidated[tag] = self.generation
+            self._invalidated.move_to_end(tag)
+            for key in list(self._tag_keys.get(tag, ())):
+                self._remove(key)
+        while len(self._invalidated) > self.max_tracked_tags:
+            _, self._forgotten_generation = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        """Drops every entry, and the responses of the reads in progress."""
+        self.generation += 1
+        self._invalidated.clear()
+        self._forgotten_generation = self.generation
+        for key in list(self._entries):
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry.body)
+        for tag in self._entry_tags.pop(key):
+            keys = self._tag_keys[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tag_keys[tag]
+
+    def stats(self) -> dict:
+        """Returns the size and hit/miss counters of the cache."""
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL_SECONDS)
+
+
+def cache_key(request: Request) -> str:
+    """Returns the cache key of a GET request, its path and query string."""
+    return f"{request.url.path}?{request.url.query}"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Checks an If-None-Match header against an ETag, with the weak comparison RFC 9110 asks for."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate[2:] if candidate.startswith("W/") else candidate
+                                         for candidate in candidates]
+
+
+def conditional_response(request: Request, cached: CachedResponse) -> Response:
+    """
+    Answers a GET request from a cached response, with a 304 when the client already has it.
+
+    Args:
+        request (Request): The incoming request.
+        cached (CachedResponse): The cached response of the request.
+
+    Returns:
+        Response: A 304 without body or a 200 with the cached JSON body.
+    """
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache", **cached.headers}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
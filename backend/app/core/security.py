@@ -5,14 +5,34 @@ from sqlalchemy.future import select
 from user.models import User, UserRole
 import jwt
 from datetime import datetime, timedelta, timezone
-from core.config import SECRET_KEY,ALGORITHM,ACCESS_TOKEN_EXPIRE_SECONDS
-import boto3, os
+from typing import NamedTuple, FrozenSet
+from core.config import SECRET_KEY,ALGORITHM,ACCESS_TOKEN_EXPIRE_SECONDS, \
+                        PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS, \
+                        PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, \
+                        UPLOAD_URL_EXPIRE_SECONDS
+from core.cache import TTLCache
+from core.executor import BoundedExecutor
 
 # Defining global settings
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 _token_header = Header(alias="x-access-token",
                         description="The token associated with the user obtained from the login API.",
                         )
+# pbkdf2 takes tens of milliseconds per call, so the async helpers below run it in this pool
+password_executor = BoundedExecutor("password_hashing", PASSWORD_HASH_WORKERS,
+                                    PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_EXECUTOR)
+
+
+class Principal(NamedTuple):
+    """The authentication facts about a user id kept in the principal cache."""
+    exists: bool
+    account_status: bool
+    roles: FrozenSet[str]
+
+
+# Principals by user id. Entries are dropped by the user write paths of this process and
+# otherwise expire after the TTL, which bounds how stale other worker processes can be.
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
 
 def get_password_hash(password: str) -> str:
     """
@@ -39,6 +59,72 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     return pwd_context.verify(plain_password, hashed_password)
 
+async def get_password_hash_async(password: str) -> str:
+    """
+    Hashes the password in the password hashing pool, off the event loop.
+
+    Args:
+        password (str): The password to be hashed.
+
+    Returns:
+        str: The hashed password.
+
+    Raises:
+        HTTPException: 503 if the hashing pool is saturated.
+    """
+    return await password_executor.run(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verifies the password in the password hashing pool, off the event loop.
+
+    Args:
+        plain_password (str): The plain password to be verified.
+        hashed_password (str): The hashed password to be verified against.
+
+    Returns:
+        bool: True if the passwords match, False otherwise.
+
+    Raises:
+        HTTPException: 503 if the hashing pool is saturated.
+    """
+    return await password_executor.run(verify_password, plain_password, hashed_password)
+
+async def get_principal(db: AsyncSession, user_id: int) -> Principal:
+    """
+    Returns the existence, account status and roles of a user, from the principal cache when possible.
+
+    Args:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+
+    Returns:
+        Principal: The cached or freshly loaded principal.
+    """
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        result = await db.execute(
+            select(User.account_status, UserRole.role)
+            .outerjoin(UserRole, UserRole.user_id == User.id)
+            .filter(User.id == user_id)
+        )
+        rows = result.all()
+        if rows:
+            principal = Principal(True, bool(rows[0].account_status), frozenset(row.role for row in rows if row.role))
+        else:
+            principal = Principal(False, False, frozenset())
+        principal_cache.set(user_id, principal)
+    return principal
+
+def invalidate_principal(user_id: int):
+    """
+    Drops the cached principal of a user after a change to the user, its status or its roles.
+
+    Args:
+        user_id (int): The ID of the user.
+    """
+    principal_cache.invalidate(user_id)
+
 async def is_admin(db: AsyncSession, user_id: int) -> bool:
     """
     Checks if the user with the given ID is an admin.
@@ -50,10 +136,8 @@ async def is_admin(db: AsyncSession, user_id: int) -> bool:
     Returns:
         bool: True if the user is an admin, False otherwise.
     """
-    result = await db.execute(
-        select(UserRole).filter(UserRole.user_id == user_id, UserRole.role == "admin")
-    )
-    return result.scalar_one_or_none() is not None
+    principal = await get_principal(db, user_id)
+    return "admin" in principal.roles
 
 def create_jwt_token(user_id: int) -> str:
     """
@@ -92,6 +176,48 @@ def decode_jwt_token(token: str) -> dict:
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def create_upload_token(key: str, size: int, sha256: str, content_type: str = None) -> str:
+    """
+    Creates the token of a direct upload, naming the object its holder may store and the size
+    and hash the content must have. It has no user_id, so it is not accepted as an access token.
+
+    Args:
+        key (str): The storage key of the object.
+        size (int): The size of the content, in bytes.
+        sha256 (str): The hex SHA-256 hash of the content.
+        content_type (str): The MIME type of the content, if known.
+
+    Returns:
+        str: The upload token, valid for UPLOAD_URL_EXPIRE_SECONDS.
+    """
+    payload = {
+        "purpose": "upload",
+        "key": key,
+        "size": size,
+        "sha256": sha256,
+        "content_type": content_type,
+        "exp": datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_URL_EXPIRE_SECONDS)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_upload_token(token: str) -> dict:
+    """
+    Decodes an upload token created by create_upload_token.
+
+    Args:
+        token (str): The upload token.
+
+    Returns:
+        dict: The payload of the token.
+
+    Raises:
+        HTTPException: If the token is invalid, expired or not an upload token.
+    """
+    payload = decode_jwt_token(token)
+    if payload.get("purpose") != "upload":
+        raise HTTPException(status_code=401, detail="Invalid upload token")
+    return payload
+
 async def get_current_user_id(token: str, db: AsyncSession) -> int:
     """
     Gets the ID of the current user from the JWT token.
@@ -111,23 +237,8 @@ async def get_current_user_id(token: str, db: AsyncSession) -> int:
     if user_id is None:
         raise HTTPException(status_code=401, detail="Invalid token")
     # Verify that the user exists in the database
-    user = await db.execute(select(User).filter(User.id == user_id))
-    user = user.scalar_one_or_none()
-    if user is None:
+    principal = await get_principal(db, user_id)
+    if not principal.exists:
         raise HTTPException(status_code=404, detail="User not found")
     return user_id
 
-
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name="us-east-1"
-)
-
-async def upload_file_to_s3(file_obj, bucket_name, key):
-    try:
-        s3_client.upload_fileobj(file_obj, bucket_name, key)
-        return f"https://{bucket_name}.s3.amazonaws.com/{key}"
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
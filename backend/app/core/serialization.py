@@ -0,0 +1,38 @@
+from decimal import Decimal
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def json_default(value):
+    """Serializes the values orjson does not handle natively."""
+    if isinstance(value, BaseModel):
+        # Pydantic 2 renamed dict() to model_dump()
+        return value.model_dump() if hasattr(value, "model_dump") else value.dict()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serializes content to compact JSON bytes with orjson.
+
+    Dicts, lists and the usual scalar, date and UUID values are encoded natively in a single
+    pass; pydantic models are converted to dicts first, so prefer plain dicts on hot paths.
+    """
+    return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSON response rendered with orjson, the default response class of the app.
+
+    Routes returning it directly skip the `response_model` validation, which is how list
+    endpoints opt in to serializing their projected rows once: their dicts must already
+    have the shape of the response model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,127 @@
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from time import perf_counter
+from sqlalchemy import event
+from core.config import SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_SIZE, SLOW_QUERY_EXPLAIN, SLOW_QUERY_EXPLAIN_ANALYZE
+from core.metrics import current_request_scope, route_label
+
+logger = logging.getLogger(__name__)
+
+# Statements EXPLAIN accepts; only SELECTs are re-run by EXPLAIN ANALYZE since it executes them
+EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+def redact_parameters(parameters):
+    """Replaces bound parameter values by their type names, so no user data is kept."""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+class SlowQueryLog:
+    """
+    Records the SQL statements slower than a threshold in a bounded ring buffer, with their
+    redacted parameters, the route that issued them and their query plan.
+    """
+
+    def __init__(self, threshold_ms: float, size: int, explain: bool = True, analyze: bool = False):
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.analyze = analyze
+        self.entries = deque(maxlen=size)
+
+    def instrument(self, engine):
+        """
+        Times the statements run on an async engine and records the slow ones.
+
+        Args:
+            engine (AsyncEngine): The engine to instrument.
+        """
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("slow_query_started", []).append(perf_counter())
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = perf_counter() - conn.info["slow_query_started"].pop()
+            if elapsed >= self.threshold:
+                self.record(conn, statement, parameters, context, executemany, elapsed)
+
+    def record(self, conn, statement: str, parameters, context, executemany: bool, elapsed: float):
+        scope = current_request_scope.get()
+        entry = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": " ".join(statement.split()),
+            "parameters": None if executemany else redact_parameters(parameters),
+            "executemany": executemany,
+            "route": f"{scope['method']} {route_label(scope)}" if scope is not None else None,
+            "plan": None,
+        }
+        streaming = context is not None and context.execution_options.get("stream_results")
+        if self.explain and not executemany and not streaming:
+            entry["plan"] = self.capture_plan(conn, statement, parameters)
+        self.entries.append(entry)
+        logger.warning("Slow query (%.2f ms) on %s: %s", entry["duration_ms"], entry["route"] or "-", entry["statement"])
+
+    def capture_plan(self, conn, statement: str, parameters) -> str:
+        """
+        Runs EXPLAIN for the statement on a separate cursor of the same connection, which
+        does not go through the engine events.
+
+        On Postgres the EXPLAIN runs in a savepoint that is always rolled back, so a failed
+        EXPLAIN does not abort the request's transaction and nothing EXPLAIN ANALYZE executed
+        stays in it.
+
+        Returns:
+            str: The plan, one node per line, or None when the statement cannot be explained.
+        """
+        keyword = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+        if keyword not in EXPLAINABLE:
+            return None
+        dialect = conn.dialect.name
+        if dialect == "postgresql":
+            analyze = self.analyze and keyword == "select"
+            prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+        elif dialect == "sqlite":
+            prefix = "EXPLAIN QUERY PLAN "
+        else:
+            return None
+        savepoint = dialect == "postgresql"
+        cursor = conn.connection.cursor()
+        try:
+            if savepoint:
+                try:
+                    cursor.execute("SAVEPOINT slow_query_explain")
+                except Exception as e:
+                    return f"EXPLAIN skipped: {e}"
+            try:
+                cursor.execute(prefix + statement, parameters)
+                rows = cursor.fetchall()
+            except Exception as e:
+                return f"EXPLAIN failed: {e}"
+            finally:
+                if savepoint:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                    cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        finally:
+            cursor.close()
+        # Postgres returns one text column, SQLite (id, parent, notused, detail) rows
+        return "\n".join(str(row[-1]) for row in rows) or None
+
+    def recent(self, limit: int = None) -> list:
+        """Returns the recorded slow queries, newest first."""
+        entries = list(reversed(self.entries))
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        self.entries.clear()
+
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_SIZE,
+                              SLOW_QUERY_EXPLAIN, SLOW_QUERY_EXPLAIN_ANALYZE)
@@ -0,0 +1,432 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+from typing import NamedTuple, Optional
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, UploadFile
+from core.config import STORAGE_BACKEND, STORAGE_BUCKET, LOCAL_STORAGE_DIR, LOCAL_STORAGE_BASE_URL, \
+                        STORAGE_IO_WORKERS, STORAGE_IO_MAX_PENDING, UPLOAD_PART_BYTES, STORAGE_INDEX_FILE, \
+                        UPLOAD_URL_EXPIRE_SECONDS
+from core.executor import BoundedExecutor
+
+# Blocking storage calls (boto3, file writes) run in this pool instead of on the event loop
+storage_executor = BoundedExecutor("storage_io", STORAGE_IO_WORKERS, STORAGE_IO_MAX_PENDING)
+
+READ_CHUNK_BYTES = 1024 * 1024
+# Uploads are spooled in memory up to this size while they are hashed, on disk past it
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# Allowance for the multipart boundaries and part headers around a file of the largest accepted size
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+async def iter_upload(file: UploadFile, max_bytes: int):
+    """
+    Yields the content of an uploaded file in chunks, enforcing the size limit as it goes.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        max_bytes (int): The maximum accepted size of the file.
+
+    Raises:
+        HTTPException: 413 as soon as the file exceeds the size limit.
+    """
+    received = 0
+    while True:
+        chunk = await file.read(READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(status_code=413, detail="File is too large")
+        yield chunk
+
+
+async def iter_bytes(data: bytes):
+    """Yields content already in memory as the chunks `StorageBackend.save` expects."""
+    yield data
+
+
+async def tee_chunks(chunks, buffer: bytearray):
+    """Yields the chunks unchanged while appending them to buffer, to process the content once stored."""
+    async for chunk in chunks:
+        buffer += chunk
+        yield chunk
+
+
+async def verify_chunks(chunks, size: int, sha256: str):
+    """
+    Yields the chunks while checking them against the size and hash announced for the upload,
+    raising before the end of the content, so the backend discards it, when they do not match.
+    """
+    digest = hashlib.sha256()
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > size:
+            raise HTTPException(status_code=413, detail="File is larger than announced")
+        await storage_executor.run(digest.update, chunk)
+        yield chunk
+    if received != size or digest.hexdigest() != sha256:
+        raise HTTPException(status_code=422, detail="File does not match its announced size and hash")
+
+
+def file_extension(filename: str) -> str:
+    """Returns the lowercase extension of a file name with its dot, or "" when it is not a plain one."""
+    extension = os.path.splitext(os.path.basename(filename or ""))[1].lower()
+    return extension if re.fullmatch(r"\.[a-z0-9]{1,10}", extension) else ""
+
+
+async def iter_file(file_obj):
+    """Yields the content of an open file in chunks, reading it in the storage pool."""
+    while True:
+        chunk = await storage_executor.run(file_obj.read, READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+class StorageBackend:
+    """Interface of the places uploaded files are stored in."""
+
+    def url_for(self, key: str) -> str:
+        """Returns the public URL of the object stored under the key."""
+        raise NotImplementedError
+
+    async def save(self, key: str, chunks, content_type: str = None) -> str:
+        """
+        Stores the streamed content under the key and returns its public URL.
+
+        Args:
+            key (str): The object key, a relative path such as "books/1_cover.png".
+            chunks: An async iterator of the bytes of the content.
+            content_type (str): The MIME type of the content, if known.
+
+        Returns:
+            str: The URL of the stored object.
+        """
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        """Tells whether an object is stored under the key."""
+        raise NotImplementedError
+
+    async def read(self, key: str) -> bytes:
+        """Returns the content of the object stored under the key."""
+        raise NotImplementedError
+
+    def presign_upload(self, key: str, size: int, sha256: str, content_type: str = None) -> Optional[dict]:
+        """
+        Returns the request a client sends to store the content under the key itself, without
+        it going through the API, or None when the backend cannot take such uploads.
+
+        Args:
+            key (str): The object key.
+            size (int): The size of the content, in bytes.
+            sha256 (str): The hex SHA-256 hash of the content.
+            content_type (str): The MIME type of the content, if known.
+
+        Returns:
+            dict: The "method", "url" and "headers" of the request, the content being its body.
+        """
+        return None
+
+
+class S3Storage(StorageBackend):
+    """Stores files in an S3 bucket, with a multipart upload for files larger than one part."""
+
+    def __init__(self, bucket: str, part_size: int = UPLOAD_PART_BYTES):
+        self.bucket = bucket
+        self.part_size = part_size
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client(
+                "s3",
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                region_name="us-east-1",
+                # Presigned URLs need SigV4 to sign the length and checksum headers
+                config=Config(signature_version="s3v4")
+            )
+        return self._client
+
+    def url_for(self, key: str) -> str:
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+    async def save(self, key: str, chunks, content_type: str = None) -> str:
+        extra = {"ContentType": content_type} if content_type else {}
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        response = await storage_executor.run(
+                            self.client.create_multipart_upload, Bucket=self.bucket, Key=key, **extra)
+                        upload_id = response["UploadId"]
+                    part = bytes(buffer[:self.part_size])
+                    del buffer[:self.part_size]
+                    parts.append(await self._upload_part(key, upload_id, len(parts) + 1, part))
+            if upload_id is None:
+                await storage_executor.run(self.client.put_object, Bucket=self.bucket, Key=key,
+                                           Body=bytes(buffer), **extra)
+            else:
+                if buffer:
+                    parts.append(await self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+                await storage_executor.run(self.client.complete_multipart_upload, Bucket=self.bucket, Key=key,
+                                           UploadId=upload_id, MultipartUpload={"Parts": parts})
+        except HTTPException:
+            await self._abort(key, upload_id)
+            raise
+        except Exception as e:
+            await self._abort(key, upload_id)
+            raise HTTPException(status_code=500, detail=str(e))
+        return self.url_for(key)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await storage_executor.run(self.client.head_object, Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise HTTPException(status_code=500, detail=str(e))
+        return True
+
+    async def read(self, key: str) -> bytes:
+        try:
+            response = await storage_executor.run(self.client.get_object, Bucket=self.bucket, Key=key)
+            return await storage_executor.run(response["Body"].read)
+        except ClientError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    def presign_upload(self, key: str, size: int, sha256: str, content_type: str = None) -> Optional[dict]:
+        # The length and checksum are signed, so S3 refuses content other than the announced one
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        params = {"Bucket": self.bucket, "Key": key, "ContentLength": size, "ChecksumSHA256": checksum}
+        headers = {"x-amz-checksum-sha256": checksum}
+        if content_type:
+            params["ContentType"] = content_type
+            headers["Content-Type"] = content_type
+        url = self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=UPLOAD_URL_EXPIRE_SECONDS)
+        return {"method": "PUT", "url": url, "headers": headers}
+
+    async def _upload_part(self, key: str, upload_id: str, number: int, body: bytes) -> dict:
+        response = await storage_executor.run(self.client.upload_part, Bucket=self.bucket, Key=key,
+                                              UploadId=upload_id, PartNumber=number, Body=body)
+        return {"ETag": response["ETag"], "PartNumber": number}
+
+    async def _abort(self, key: str, upload_id: str):
+        # Discard the parts of an unfinished multipart upload so they are not billed
+        if upload_id is None:
+            return
+        try:
+            await storage_executor.run(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key,
+                                       UploadId=upload_id)
+        except Exception as e:
+            print(f"Error aborting multipart upload of {key}: {e}")
+
+
+class LocalStorage(StorageBackend):
+    """Stores files in a local directory, for development, tests and benchmarks."""
+
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+
+    def url_for(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    def path_for(self, key: str) -> str:
+        """Returns the file path of the key, refusing keys that escape the storage directory."""
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise HTTPException(status_code=400, detail="Invalid file name")
+        return path
+
+    async def save(self, key: str, chunks, content_type: str = None) -> str:
+        path = self.path_for(key)
+        # Write to a temporary file and move it in place once complete
+        partial_path = f"{path}.part"
+        await storage_executor.run(os.makedirs, os.path.dirname(path), exist_ok=True)
+        file_obj = await storage_executor.run(open, partial_path, "wb")
+        try:
+            async for chunk in chunks:
+                await storage_executor.run(file_obj.write, chunk)
+        except BaseException:
+            file_obj.close()
+            os.remove(partial_path)
+            raise
+        await storage_executor.run(file_obj.close)
+        await storage_executor.run(os.replace, partial_path, path)
+        return self.url_for(key)
+
+    async def exists(self, key: str) -> bool:
+        return await storage_executor.run(os.path.isfile, self.path_for(key))
+
+    async def read(self, key: str) -> bytes:
+        def read_file(path):
+            with open(path, "rb") as file_obj:
+                return file_obj.read()
+        return await storage_executor.run(read_file, self.path_for(key))
+
+
+class ObjectIndex:
+    """
+    The keys of the objects known to be stored, held in memory and, with a path, appended to a
+    local file so they survive restarts.
+
+    Worker processes sharing the file learn of each other's objects at their next start, and
+    ask the backend in the meantime. Keys found missing from the backend are discarded with a
+    `-key` line, so the file stays append-only.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.keys = None
+
+    async def load(self):
+        # Read on first use so importing the module does no I/O
+        if self.keys is None:
+            self.keys = await storage_executor.run(self._read) if self.path else set()
+
+    def _read(self) -> set:
+        keys = set()
+        try:
+            with open(self.path) as index_file:
+                for line in index_file:
+                    line = line.strip()
+                    if line.startswith("-"):
+                        keys.discard(line[1:])
+                    elif line:
+                        keys.add(line)
+        except FileNotFoundError:
+            pass
+        return keys
+
+    def _append(self, line: str):
+        with open(self.path, "a") as index_file:
+            index_file.write(line + "\n")
+
+    async def contains(self, key: str) -> bool:
+        await self.load()
+        return key in self.keys
+
+    async def add(self, key: str):
+        await self.load()
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        if self.path:
+            await storage_executor.run(self._append, key)
+
+    async def discard(self, key: str):
+        await self.load()
+        if key not in self.keys:
+            return
+        self.keys.discard(key)
+        if self.path:
+            await storage_executor.run(self._append, "-" + key)
+
+
+class StoredObject(NamedTuple):
+    key: str
+    url: str
+    sha256: str
+    # False when identical content was already stored and nothing was written
+    created: bool
+
+
+def content_key(prefix: str, sha256: str, extension: str = "") -> str:
+    """Returns the key of content by its hash, fanned out over 256 directories: books/ab/ab12...ef.png."""
+    return f"{prefix}/{sha256[:2]}/{sha256}{extension}"
+
+
+def write_hashed(file_obj, digest, chunk: bytes):
+    digest.update(chunk)
+    file_obj.write(chunk)
+
+
+class ContentAddressedStorage:
+    """
+    Stores uploads under the SHA-256 hash of their content, so identical files are stored once.
+
+    The content is hashed as it is received and spooled; once the hash is known, content already
+    in the index or in the backend is not written again, saving the storage and the upload to it.
+    """
+
+    def __init__(self, backend: StorageBackend, index: ObjectIndex):
+        self.backend = backend
+        self.index = index
+
+    def url_for(self, key: str) -> str:
+        return self.backend.url_for(key)
+
+    async def has(self, key: str, verify: bool = False) -> bool:
+        """
+        Tells whether an object is stored under the key, asking the backend when the index does not know it.
+
+        With verify, an index hit is confirmed with the backend too and discarded when the object was
+        removed since; callers about to skip storing the object or to report it stored pass it.
+        """
+        if await self.index.contains(key):
+            if not verify or await self.backend.exists(key):
+                return True
+            await self.index.discard(key)
+            return False
+        if await self.backend.exists(key):
+            await self.index.add(key)
+            return True
+        return False
+
+    async def save_key(self, key: str, chunks, content_type: str = None) -> str:
+        """Stores content under a key chosen by the caller, such as one derived from a content key."""
+        url = await self.backend.save(key, chunks, content_type)
+        await self.index.add(key)
+        return url
+
+    async def save(self, prefix: str, chunks, content_type: str = None, extension: str = "") -> StoredObject:
+        """
+        Stores the streamed content under its hash, unless it is already stored.
+
+        Args:
+            prefix (str): The folder of the object, such as "books".
+            chunks: An async iterator of the bytes of the content.
+            content_type (str): The MIME type of the content, if known.
+            extension (str): The file extension of the key, with its dot, or "".
+
+        Returns:
+            StoredObject: The key, URL and hash of the object and whether it was written.
+        """
+        digest = hashlib.sha256()
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        try:
+            async for chunk in chunks:
+                await storage_executor.run(write_hashed, spool, digest, chunk)
+            sha256 = digest.hexdigest()
+            key = content_key(prefix, sha256, extension)
+            if await self.has(key, verify=True):
+                return StoredObject(key, self.url_for(key), sha256, False)
+            await storage_executor.run(spool.seek, 0)
+            url = await self.save_key(key, iter_file(spool), content_type)
+            return StoredObject(key, url, sha256, True)
+        finally:
+            spool.close()
+
+
+def build_storage() -> StorageBackend:
+    """Returns the storage backend selected by the STORAGE_BACKEND setting."""
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_BASE_URL)
+    return S3Storage(STORAGE_BUCKET)
+
+
+storage = build_storage()
+content_storage = ContentAddressedStorage(storage, ObjectIndex(STORAGE_INDEX_FILE))
@@ -1,13 +1,19 @@
+import asyncio
+from itertools import cycle
+from time import monotonic
+from fastapi import Request
+from sqlalchemy import text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from databases import Database
-from core.config import DATABASE_URL
+from core.config import DATABASE_URL, DATABASE_ECHO, DATABASE_REPLICA_URLS, REPLICA_MAX_LAG_SECONDS, REPLICA_HEALTH_CHECK_SECONDS
+from core.cache import TTLCache
 
 
 DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, echo=DATABASE_ECHO)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
 Base = declarative_base()
 
@@ -27,3 +33,111 @@ async def get_db():
     """
     async with SessionLocal() as session:
         yield session
+
+
+# Replay lag of a Postgres standby, 0 when it has replayed everything it received
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReplicaRouter:
+    """
+    Picks the engine read-only sessions are bound to.
+
+    Healthy replicas are used round robin. A replica is healthy when it answered the last
+    health check with a replay lag under REPLICA_MAX_LAG_SECONDS. Reads fall back to the
+    primary when no replica is healthy, and for users who wrote within that lag window so
+    they read their own writes.
+    """
+
+    def __init__(self, urls: list, max_lag: float):
+        self.max_lag = max_lag
+        self.engines = [create_async_engine(url.replace("postgresql://", "postgresql+asyncpg://")) for url in urls]
+        self.healthy = {replica: False for replica in self.engines}
+        self.last_write = float("-inf")
+        self._recent_writers = TTLCache(100000, max_lag)
+        self._order = cycle(self.engines)
+
+    def record_write(self, user_id: int = None):
+        """Notes a successful write, by the given user if known."""
+        self.last_write = monotonic()
+        if user_id is not None:
+            self._recent_writers.set(user_id, True)
+
+    def pick(self, user_id: int = None, shared: bool = False):
+        """
+        Returns the engine to read from.
+
+        Args:
+            user_id (int): The user making the request, if known.
+            shared (bool): Whether the result is shared between users (e.g. response cached), in
+                which case any write handled by this process within the lag window keeps it on the primary.
+        """
+        if not self.engines:
+            return engine
+        if user_id is not None and self._recent_writers.get(user_id):
+            return engine
+        if shared and monotonic() - self.last_write < self.max_lag:
+            return engine
+        for _ in range(len(self.engines)):
+            replica = next(self._order)
+            if self.healthy[replica]:
+                return replica
+        return engine
+
+    async def check(self):
+        """Refreshes the health of every replica."""
+        for replica in self.engines:
+            try:
+                async with replica.connect() as conn:
+                    if replica.dialect.name == "postgresql":
+                        lag = (await asyncio.wait_for(conn.execute(REPLICA_LAG_QUERY), self.max_lag)).scalar()
+                    else:
+                        await conn.execute(text("SELECT 1"))
+                        lag = 0
+                self.healthy[replica] = lag is not None and float(lag) <= self.max_lag
+            except Exception as e:
+                if self.healthy[replica]:
+                    print(f"Replica {replica.url.host} is unavailable: {e}")
+                self.healthy[replica] = False
+
+    async def run_health_checks(self):
+        """Checks the replicas periodically, until cancelled."""
+        while True:
+            await asyncio.sleep(REPLICA_HEALTH_CHECK_SECONDS)
+            await self.check()
+
+    async def dispose(self):
+        for replica in self.engines:
+            await replica.dispose()
+
+    def stats(self) -> dict:
+        return {"replicas": len(self.engines), "healthy": sum(self.healthy.values())}
+
+
+replica_router = ReplicaRouter(DATABASE_REPLICA_URLS, REPLICA_MAX_LAG_SECONDS)
+
+def read_session(user_id: int = None, shared: bool = False) -> AsyncSession:
+    """Creates a session for read-only work, bound to a replica when one can be used."""
+    return SessionLocal(bind=replica_router.pick(user_id, shared))
+
+async def get_read_db(request: Request):
+    """
+    Yields a session for read-only routes, on a replica unless the caller has just written.
+
+    The caller is the user of the request's access token, identified by the middleware in main.
+    """
+    async with read_session(getattr(request.state, "user_id", None)) as session:
+        yield session
+
+async def get_shared_read_db(request: Request):
+    """
+    Yields a session for read-only routes whose responses are cached and shared between users.
+
+    Right after a write the replicas may not have it yet, so such reads stay on the primary
+    rather than caching stale data.
+    """
+    async with read_session(getattr(request.state, "user_id", None), shared=True) as session:
+        yield session
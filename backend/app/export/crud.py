@@ -0,0 +1,40 @@
+from sqlalchemy.future import select
+from book import models as book_models
+from book_review import models as review_models
+from database import read_session
+
+# Rows fetched from the server-side cursor at a time
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_QUERIES = {
+    "books": select(
+        book_models.Book.id, book_models.Book.title, book_models.Book.author, book_models.Book.genre,
+        book_models.Book.year_published, book_models.Book.summary, book_models.Book.book_url
+    ).order_by(book_models.Book.id),
+    "reviews": select(
+        review_models.Review.id, review_models.Review.book_id, review_models.Review.user_id,
+        review_models.Review.rating, review_models.Review.review_text
+    ).order_by(review_models.Review.id),
+}
+
+
+async def stream_rows(table: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Streams the rows of an exported table through a server-side cursor.
+
+    The generator opens its own session, on a read replica when available, so it can
+    outlive the request handler when used by a streaming response.
+
+    Args:
+        table (str): "books" or "reviews".
+        batch_size (int): The number of rows fetched from the cursor at a time.
+
+    Yields:
+        tuple: The column names first, then lists of at most `batch_size` rows.
+    """
+    query = EXPORT_QUERIES[table].execution_options(yield_per=batch_size)
+    async with read_session() as db:
+        result = await db.stream(query)
+        yield tuple(result.keys())
+        async for partition in result.partitions():
+            yield partition
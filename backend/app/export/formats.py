@@ -0,0 +1,41 @@
+import csv
+import io
+import json
+import zlib
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+async def encode_rows(batches, fmt: str, compress: bool = False):
+    """
+    Encodes streamed row batches as NDJSON or CSV, optionally gzip compressed.
+
+    Args:
+        batches: An async iterator yielding the column names, then lists of rows, see `stream_rows`.
+        fmt (str): "ndjson" or "csv".
+        compress (bool): Whether to gzip the output.
+
+    Yields:
+        bytes: The encoded output, one chunk per batch.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    columns = None
+    async for batch in batches:
+        buffer = io.StringIO()
+        if columns is None:
+            columns = batch
+            if fmt == "csv":
+                csv.writer(buffer).writerow(columns)
+        elif fmt == "csv":
+            csv.writer(buffer).writerows(batch)
+        else:
+            for row in batch:
+                buffer.write(json.dumps(dict(zip(columns, row)), separators=(",", ":")))
+                buffer.write("\n")
+        chunk = buffer.getvalue().encode()
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor is not None:
+        yield compressor.flush()
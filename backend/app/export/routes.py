@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal
+from export import crud, formats
+from core.security import get_current_user_id, is_admin, _token_header
+from database import get_db
+
+router = APIRouter()
+
+async def export_table(table: str, format: str, gzip: bool, db: AsyncSession, token: str) -> StreamingResponse:
+    current_user_id = await get_current_user_id(token, db)
+    if not await is_admin(db, current_user_id):
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    filename = f"{table}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        formats.encode_rows(crud.stream_rows(table), format, gzip),
+        media_type="application/gzip" if gzip else formats.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/books")
+async def export_books(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    db: AsyncSession = Depends(get_db),
+    token: str = _token_header
+):
+    return await export_table("books", format, gzip, db, token)
+
+@router.get("/reviews")
+async def export_reviews(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    db: AsyncSession = Depends(get_db),
+    token: str = _token_header
+):
+    return await export_table("reviews", format, gzip, db, token)
@@ -0,0 +1,49 @@
+import requests
+import gzip
+import json
+
+BASE_URL = "http://localhost:8001"
+
+def test_export_a_preprocessing():
+    #Get admin ntoken
+    global admin_token
+    response = requests.post(f"{BASE_URL}/users/login", json={
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    assert response.status_code == 200
+    admin_token = response.json()["access_token"]
+
+    global book_id
+    response = requests.post(f"{BASE_URL}/books/", json={
+        "title": "Exported Book",
+        "author": "Exported Author",
+        "genre": "Exported Genre",
+        "year_published": 2024,
+        "summary": "Exported, with a comma",
+        "book_url": "http://example.com/exported_book"
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    book_id = response.json()["id"]
+
+def test_export_b_books_ndjson():
+    response = requests.get(f"{BASE_URL}/export/books", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    books = [json.loads(line) for line in response.text.splitlines()]
+    assert book_id in [book["id"] for book in books]
+
+def test_export_c_books_csv_gzip():
+    response = requests.get(f"{BASE_URL}/export/books", params={"format": "csv", "gzip": "true"},
+                            headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert lines[0] == "id,title,author,genre,year_published,summary,book_url"
+    assert any('"Exported, with a comma"' in line for line in lines)
+
+def test_export_d_reviews_requires_token():
+    response = requests.get(f"{BASE_URL}/export/reviews")
+    assert response.status_code == 422
+
+def test_export_e_delete_book():
+    response = requests.delete(f"{BASE_URL}/books/{book_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
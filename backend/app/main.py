@@ -1,12 +1,33 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base, database
+from database import engine, Base, database, replica_router
 from user.routes import router as user_router
 from book.routes import router as book_router
+from book import crud as book_crud
+from book.similarity import similarity_index
+from book.leaderboards import leaderboards
 from book_review.routes import router as book_review_router
-from psutil import cpu_percent, virtual_memory, disk_usage
+from export.routes import router as export_router
+from admin.routes import router as admin_router
 from contextlib import asynccontextmanager
 from fastapi.responses import JSONResponse
+from core.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+from core.security import principal_cache, password_executor, decode_jwt_token
+from core.storage import storage, storage_executor, LocalStorage
+from core.images import image_executor
+from core.response_cache import response_cache
+from core.serialization import FastJSONResponse
+from core.metrics import registry, system_sampler, instrument_engine, watch_pool, count_queries, \
+                         current_request_scope, register_routes, route_label, Counter, Gauge, http_requests, http_latency, http_in_flight, \
+                         db_queries, db_query_time
+from core.slow_queries import slow_query_log
+from core.query_stats import QueryStatsMiddleware, QUERY_COUNT_HEADER, QUERY_TIME_HEADER
+from core.config import QUERY_STATS_ENABLED, QUERY_BUDGET, QUERY_REPEAT_THRESHOLD
+from fastapi.responses import Response
+from time import perf_counter
+from fastapi.staticfiles import StaticFiles
+import os
+import asyncio
 
 
 @asynccontextmanager
@@ -30,9 +51,26 @@ async def lifespan(app: FastAPI):
         await database.connect()
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await book_crud.ensure_facet_counts(conn)
     except Exception as e:
         print(f"Error during startup: {e}")
+    sampler = asyncio.create_task(system_sampler.run())
+    similarity = asyncio.create_task(similarity_index.run())
+    leaderboard_rebuilds = asyncio.create_task(leaderboards.run())
+    health_checks = None
+    if replica_router.engines:
+        await replica_router.check()
+        health_checks = asyncio.create_task(replica_router.run_health_checks())
     yield
+    sampler.cancel()
+    similarity.cancel()
+    leaderboard_rebuilds.cancel()
+    if health_checks is not None:
+        health_checks.cancel()
+        await replica_router.dispose()
+    password_executor.shutdown()
+    storage_executor.shutdown()
+    image_executor.shutdown()
     try:
         await database.disconnect()
     except Exception as e:
@@ -40,23 +78,108 @@ async def lifespan(app: FastAPI):
 
 
 #Initialise the app
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 #Add route to the app
 app.include_router(user_router, prefix="/users", tags=["users"])
 app.include_router(book_router, prefix="/books", tags=["books"])
 app.include_router(book_review_router, prefix="/reviews", tags=["reviews"])
+app.include_router(export_router, prefix="/export", tags=["export"])
+app.include_router(admin_router, prefix="/admin", tags=["admin"])
+register_routes(user_router, "/users")
+register_routes(book_router, "/books")
+register_routes(book_review_router, "/reviews")
+register_routes(export_router, "/export")
+register_routes(admin_router, "/admin")
+# Serve uploaded files when they are stored on the local filesystem
+if isinstance(storage, LocalStorage):
+    os.makedirs(storage.root, exist_ok=True)
+    app.mount("/media", StaticFiles(directory=storage.root), name="media")
 
 origins = [
     "http://localhost:3000",
 ]
 
+@app.middleware("http")
+async def track_writes(request: Request, call_next):
+    """
+    Identifies the user of the access token, if any, for read replica routing and records
+    successful writes so that user's next reads see them.
+    """
+    request.state.user_id = None
+    token = request.headers.get("x-access-token")
+    if token and replica_router.engines:
+        try:
+            request.state.user_id = decode_jwt_token(token).get("user_id")
+        except HTTPException:
+            pass
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        replica_router.record_write(request.state.user_id)
+    return response
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    """
+    Records the count, latency and SQL statements of every request by route template, so
+    that paths like /books/1 and /books/2 share one series.
+    """
+    http_in_flight.inc()
+    scope_token = current_request_scope.set(request.scope)
+    started = perf_counter()
+    status = 500
+    try:
+        with count_queries() as stats:
+            response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = perf_counter() - started
+        http_in_flight.dec()
+        current_request_scope.reset(scope_token)
+        route = route_label(request.scope)
+        http_requests.inc(request.method, route, status)
+        http_latency.observe(request.method, route, value=elapsed)
+        if stats.queries:
+            db_queries.inc(request.method, route, amount=stats.queries)
+            db_query_time.inc(request.method, route, amount=stats.seconds)
+
+for db_engine in [engine] + replica_router.engines:
+    instrument_engine(db_engine)
+    slow_query_log.instrument(db_engine)
+watch_pool(engine)
+
+cache_lookups = registry.register(Counter(
+    "cache_lookups_total", "Lookups of the in-process caches by result", ("cache", "result")))
+cache_size = registry.register(Gauge(
+    "cache_entries", "Entries held by the in-process caches", ("cache",)))
+worker_tasks = registry.register(Counter(
+    "worker_tasks_total", "Tasks of the blocking work pools by outcome", ("pool", "outcome")))
+worker_pending = registry.register(Gauge(
+    "worker_tasks_pending", "Tasks queued or running in the blocking work pools", ("pool",)))
+
+@registry.collector
+def collect_process_stats():
+    for name, stats in (("principal", principal_cache.stats()), ("responses", response_cache.stats())):
+        cache_lookups.set(name, "hit", value=stats["hits"])
+        cache_lookups.set(name, "miss", value=stats["misses"])
+        cache_size.set(name, value=stats.get("entries", stats.get("size")))
+    for executor in (password_executor, storage_executor, image_executor):
+        stats = executor.stats()
+        worker_tasks.set(executor.name, "completed", value=stats["completed"])
+        worker_tasks.set(executor.name, "failed", value=stats["failed"])
+        worker_tasks.set(executor.name, "rejected", value=stats["rejected"])
+        worker_pending.set(executor.name, value=stats["pending"])
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER, QUERY_COUNT_HEADER, QUERY_TIME_HEADER],
 )
+if QUERY_STATS_ENABLED:
+    app.add_middleware(QueryStatsMiddleware, budget=QUERY_BUDGET, repeat_threshold=QUERY_REPEAT_THRESHOLD)
 
 @app.get("/")
 def read_root():
@@ -71,23 +194,48 @@ def read_root():
                 "cpu": str,
                 "memory": str,
                 "disk": str
+            },
+            "caches": {
+                "principal": {"size": int, "hits": int, "misses": int},
+                "responses": {"entries": int, "bytes": int, "hits": int, "misses": int}
+            },
+            "database": {"replicas": int, "healthy": int},
+            "workers": {
+                "password_hashing": {"pending": int, "max_pending": int, "completed": int, "failed": int,
+                                     "rejected": int, "latency_ms": {"p50": float, "p95": float, "p99": float}}
             }
         }
     Notes:
-        - The `cpu`, `memory`, and `disk` values are percentages.
+        - The `cpu`, `memory`, and `disk` values are percentages, sampled in the background every
+          SYSTEM_SAMPLE_SECONDS rather than measured on each request.
+        - The cache and worker pool counters are local to the worker process that served the request.
     """
-    # Get system resource usage
-    cpu_usage = cpu_percent()
-    memory_usage = virtual_memory().percent
-    disk_usage_p = disk_usage('/').percent
+    # Get the latest system resource usage sample
+    usage = system_sampler.usage
 
     # Get server response
     response = {"message": "Welcome to the Book Review System"}
 
     # Add resource usage to the response
     response["resource_usage"] = {
-        "cpu": f"{cpu_usage:.2f}%",
-        "memory": f"{memory_usage:.2f}%",
-        "disk": f"{disk_usage_p:.2f}%"
+        "cpu": f"{usage['cpu']:.2f}%",
+        "memory": f"{usage['memory']:.2f}%",
+        "disk": f"{usage['disk']:.2f}%"
     }
+    response["caches"] = {"principal": principal_cache.stats(), "responses": response_cache.stats()}
+    response["database"] = replica_router.stats()
+    response["workers"] = {"password_hashing": password_executor.stats()}
     return JSONResponse(content=response, media_type="application/json")
+
+@app.get("/metrics")
+def metrics():
+    """
+    Returns the metrics of this worker process in the Prometheus text exposition format.
+
+    Exported series:
+        - http_requests_total, http_request_duration_seconds and http_requests_in_flight, by route template.
+        - db_queries_total and db_query_seconds_total, the SQL statements run while serving each route.
+        - db_pool_connections, the size and usage of the primary connection pool.
+        - cache_*, worker_* and system_usage_percent, mirroring the counters reported by `/`.
+    """
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
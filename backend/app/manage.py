@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from database import engine, Base, SessionLocal
+# The model modules are imported so every table is registered on Base.metadata
+from book import models as book_models, bulk as book_bulk, crud as book_crud
+from book_review import models as book_review_models, crud as book_review_crud
+from user import models as user_models
+from export import crud as export_crud, formats as export_formats
+from benchmark import runner as benchmark_runner, scenarios as benchmark_scenarios, dataset as benchmark_dataset
+
+
+async def recompute_rating_stats(args):
+    """
+    Rebuilds the per book rating aggregates from the reviews table.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    async with SessionLocal() as db:
+        rebuilt = await book_review_crud.recompute_rating_stats(db, args.book_id)
+        await db.commit()
+    print(f"Rebuilt rating stats for {rebuilt} book(s)")
+
+
+async def recompute_facet_counts(args):
+    """Rebuilds the genre and year, and the author, facet rollups from the books table."""
+    async with SessionLocal() as db:
+        rebuilt = await book_crud.recompute_facet_counts(db)
+        await db.commit()
+    print(f"Rebuilt facet counts for {rebuilt} key(s)")
+
+
+async def backfill_search_vectors(args):
+    """Fills the full-text search vector of the books that have none, or of every book with --all."""
+    async with SessionLocal() as db:
+        updated = await book_crud.backfill_search_vectors(db, args.batch_size, only_missing=not args.all)
+    print(f"Filled the search vector of {updated} book(s)")
+
+
+async def read_file(path: str, chunk_size: int = 1024 * 1024):
+    """Yields the content of a file in chunks."""
+    with open(path, "rb") as file_obj:
+        while True:
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def import_books(args):
+    """
+    Streams a CSV or NDJSON file of books into the database.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    fmt = args.format or ("csv" if os.path.splitext(args.path)[1].lower() == ".csv" else "ndjson")
+    records = book_bulk.iter_records(book_bulk.iter_lines(read_file(args.path)), fmt)
+    async with SessionLocal() as db:
+        summary = await book_bulk.import_books(db, records, args.batch_size)
+    for error in summary["errors"]:
+        print(f"line {error['line']}: {error['error']}")
+    print(json.dumps({"imported": summary["imported"], "failed": summary["failed"]}))
+
+
+async def export_table(args):
+    """
+    Streams a table to a file or stdout as NDJSON or CSV, optionally gzip compressed.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in export_formats.encode_rows(export_crud.stream_rows(args.table), args.format, args.gzip):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+async def benchmark(args):
+    """
+    Runs a load test of the API in process and compares it with a baseline run.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+
+    Returns:
+        int: 1 when the run regressed against the baseline, 0 otherwise.
+    """
+    # Imported here so the other commands do not set up the web app
+    from main import app
+    summary = await benchmark_runner.run_benchmark(app, args.scenario, args.concurrency, args.duration,
+                                                   args.books, args.seed)
+    baseline = benchmark_runner.load_baseline(args.baseline) if args.baseline else None
+    print(benchmark_runner.format_report(summary, baseline))
+    if args.output:
+        benchmark_runner.save_summary(summary, args.output)
+    if baseline is None:
+        return 0
+    regressions = benchmark_runner.compare(summary, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+async def generate_dataset(args):
+    """
+    Generates and bulk loads synthetic users, books and reviews for capacity testing.
+
+    Args:
+        args (argparse.Namespace): The parsed command line arguments.
+    """
+    async with engine.begin() as conn:
+        counts = await benchmark_dataset.generate_dataset(
+            conn, args.users, args.books, args.reviews, args.seed, args.admins,
+            args.book_exponent, args.user_exponent, args.batch_size)
+    print(json.dumps(counts))
+
+
+async def main(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        return await args.handler(args)
+    finally:
+        await engine.dispose()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Maintenance commands for the Book Review System")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recompute = commands.add_parser("recompute-rating-stats", help="Rebuild the rating aggregates from the reviews")
+    recompute.add_argument("--book-id", type=int, default=None, help="Only rebuild the aggregate of this book")
+    recompute.set_defaults(handler=recompute_rating_stats)
+
+    facets = commands.add_parser("recompute-facet-counts", help="Rebuild the catalog facet counts from the books")
+    facets.set_defaults(handler=recompute_facet_counts)
+
+    search = commands.add_parser("backfill-search-vectors",
+                                 help="Fill the full-text search vector of the books (Postgres only)")
+    search.add_argument("--all", action="store_true", help="Rebuild every book's vector, not only the missing ones")
+    search.add_argument("--batch-size", type=int, default=10000, help="Books updated per transaction")
+    search.set_defaults(handler=backfill_search_vectors)
+
+    importer = commands.add_parser("import-books", help="Import books from a CSV or NDJSON file")
+    importer.add_argument("path", help="The file to import, CSV with a header row or one JSON object per line")
+    importer.add_argument("--format", choices=["csv", "ndjson"], default=None,
+                          help="The file format, guessed from the extension by default")
+    importer.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT and transaction")
+    importer.set_defaults(handler=import_books)
+
+    exporter = commands.add_parser("export", help="Export the books or reviews as NDJSON or CSV")
+    exporter.add_argument("table", choices=["books", "reviews"], help="The table to export")
+    exporter.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="The output format")
+    exporter.add_argument("--gzip", action="store_true", help="Compress the output with gzip")
+    exporter.add_argument("--output", default=None, help="The output file, stdout by default")
+    exporter.set_defaults(handler=export_table)
+
+    bench = commands.add_parser("benchmark", help="Load test the API in process against DATABASE_URL (use a scratch database)")
+    bench.add_argument("--scenario", choices=["mix"] + list(benchmark_scenarios.SCENARIOS), default="mix",
+                       help="The user flow to run, or the weighted mix of all of them")
+    bench.add_argument("--concurrency", type=int, default=16, help="Virtual users sending requests at the same time")
+    bench.add_argument("--duration", type=float, default=30, help="Length of the run in seconds")
+    bench.add_argument("--books", type=int, default=500, help="Books to seed the catalog with, if it has fewer")
+    bench.add_argument("--seed", type=int, default=0, help="Seed of the scenario choices")
+    bench.add_argument("--output", default=None, help="Write the results as JSON, e.g. to store a baseline")
+    bench.add_argument("--baseline", default=None, help="A stored results file to compare the run with")
+    bench.add_argument("--tolerance", type=float, default=0.2,
+                       help="Relative p95 latency or throughput change counted as a regression")
+    bench.set_defaults(handler=benchmark)
+
+    generator = commands.add_parser("generate-dataset",
+                                    help="Generate synthetic users, books and Zipf distributed reviews")
+    generator.add_argument("--users", type=int, default=10000, help="Users to generate, password 'password'")
+    generator.add_argument("--books", type=int, default=10000, help="Books to generate")
+    generator.add_argument("--reviews", type=int, default=100000, help="Reviews to generate, at most one per user and book")
+    generator.add_argument("--seed", type=int, default=0, help="Seed of the generator, the same seed gives the same data")
+    generator.add_argument("--admins", type=int, default=1, help="Generated users given the admin role")
+    generator.add_argument("--book-exponent", type=float, default=1.1,
+                           help="Zipf exponent of the reviews per book, higher concentrates them on fewer books")
+    generator.add_argument("--user-exponent", type=float, default=1.0, help="Zipf exponent of the reviews per user")
+    generator.add_argument("--batch-size", type=int, default=100000, help="Rows per COPY or INSERT")
+    generator.set_defaults(handler=generate_dataset)
+
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(build_parser().parse_args())))
@@ -1,3 +1,6 @@
 from user.tests import *
 from book.tests import *
-from book_review.tests import *
\ No newline at end of file
+from book_review.tests import *
+from export.tests import *
+from admin.tests import *
+from benchmark.tests import *
\ No newline at end of file
@@ -4,31 +4,69 @@ from sqlalchemy.future import select
 from sqlalchemy import update, func
 from user.models import User, UserRole
 from user.schemas import UserCreate, UserUpdate, CurrentUser
-from core.security import get_password_hash
+from core.security import get_password_hash_async, invalidate_principal
+from core.response_cache import response_cache, user_tag
+from core.batch import id_in
 
 async def create_user(db: AsyncSession, user: UserCreate) -> User:
     db_user = User(
         full_name=user.full_name,
         display_name=user.display_name,
-        password=get_password_hash(user.password),
+        password=await get_password_hash_async(user.password),
         email=user.email
     )
     db.add(db_user)
     await db.commit()
     await db.refresh(db_user)
+    # The id may be cached as missing, by the principal cache if it belonged to a deleted user
+    # and by batch lookups made before it existed
+    invalidate_principal(db_user.id)
+    response_cache.invalidate(user_tag(db_user.id))
     return db_user
 
-async def update_user(db: AsyncSession, user_id: int, user_data: UserUpdate) -> User:
-    user_data.password = get_password_hash(user_data.password)
-    stmt = update(User).where(User.id == user_id).values(user_data.dict(exclude_unset=True))
-    await db.execute(stmt)
+async def update_user(db: AsyncSession, user_id: int, user_data: UserUpdate) -> dict:
+    user_data.password = await get_password_hash_async(user_data.password)
+    updated_user = await update_user_returning(db, user_id, user_data.dict(exclude_unset=True))
     await db.commit()
-    return await get_user(db, user_id)
+    # Cached review lists show the user's display name
+    response_cache.invalidate(user_tag(user_id))
+    return updated_user
+
+async def update_user_returning(db: AsyncSession, user_id: int, values: dict) -> dict:
+    """
+    Updates a user and returns the updated row, in one UPDATE ... RETURNING statement.
+
+    Raises:
+        HTTPException: 404 if the user does not exist.
+    """
+    stmt = update(User).where(User.id == user_id).values(values).returning(*User.__table__.c)
+    updated_user = (await db.execute(stmt)).mappings().first()
+    if updated_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return dict(updated_user)
 
 async def get_user(db: AsyncSession, user_id: int) -> User:
     result = await db.execute(select(User).filter(User.id == user_id))
     return result.scalar_one_or_none()
 
+async def get_users_by_ids(db: AsyncSession, ids: list) -> dict:
+    """
+    Looks up the public fields of users by id in one query. Deactivated users are shown as
+    "Unknown user", as in the review lists.
+
+    Returns:
+        dict: The found users in the order of ids and the ids without a user, as a UserBatchResponse.
+    """
+    result = await db.execute(
+        select(User.id, User.display_name, User.account_status).filter(id_in(User.id, ids, db.bind.dialect.name))
+    )
+    users = {row.id: {"id": row.id,
+                      "display_name": row.display_name if row.account_status else "Unknown user",
+                      "account_status": row.account_status}
+             for row in result}
+    return {"users": [users[user_id] for user_id in ids if user_id in users],
+            "missing": [user_id for user_id in ids if user_id not in users]}
+
 async def get_Current_user_details(db: AsyncSession, user_id: int) -> CurrentUser:
     # Query to join User with UserRole
     query = (
@@ -54,22 +92,25 @@ async def get_user_from_email(db: AsyncSession, user_email: str) -> User:
     result = await db.execute(select(User).filter(User.email == user_email))
     return result.scalar_one_or_none()
 
-async def activate_user(db: AsyncSession, user_id: int) -> User:
-    stmt = update(User).where(User.id == user_id).values(account_status=True)
-    await db.execute(stmt)
+async def activate_user(db: AsyncSession, user_id: int) -> dict:
+    updated_user = await update_user_returning(db, user_id, {"account_status": True})
     await db.commit()
-    return await get_user(db, user_id)
+    invalidate_principal(user_id)
+    response_cache.invalidate(user_tag(user_id))
+    return updated_user
 
-async def deactivate_user(db: AsyncSession, user_id: int) -> User:
-    stmt = update(User).where(User.id == user_id).values(account_status=False)
-    await db.execute(stmt)
+async def deactivate_user(db: AsyncSession, user_id: int) -> dict:
+    updated_user = await update_user_returning(db, user_id, {"account_status": False})
     await db.commit()
-    return await get_user(db, user_id)
+    invalidate_principal(user_id)
+    response_cache.invalidate(user_tag(user_id))
+    return updated_user
 
 async def add_user_role(db: AsyncSession, user_id: int, role: str) -> UserRole:
     user_role = UserRole(user_id=user_id, role=role)
     db.add(user_role)
     await db.commit()
+    invalidate_principal(user_id)
     await db.refresh(user_role)
     return user_role
 
@@ -86,4 +127,6 @@ async def delete_user(db: AsyncSession, user_id: int):
     # Delete the user
     await db.delete(user)
     await db.commit()
+    invalidate_principal(user_id)
+    response_cache.invalidate(user_tag(user_id))
     return {"message": "User deleted successfully"}
\ No newline at end of file
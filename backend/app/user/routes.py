@@ -1,17 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.datastructures import UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from user import schemas, crud
-from core.security import get_current_user_id, is_admin, create_jwt_token, verify_password, \
-                        _token_header, upload_file_to_s3
-from database import get_db
-from typing import Literal
+from core.security import get_current_user_id, is_admin, create_jwt_token, verify_password_async, \
+                        create_upload_token, decode_upload_token, _token_header
+from core.storage import content_storage, iter_upload, tee_chunks, verify_chunks, content_key, file_extension, \
+                        LocalStorage, MULTIPART_OVERHEAD_BYTES
+from core.images import store_cover_variants, stored_cover_variants
+from core.config import MAX_UPLOAD_BYTES
+from core.batch import batch_ids
+from core.response_cache import response_cache, cache_key, conditional_response, user_tag
+from database import get_db, get_read_db, get_shared_read_db
+from typing import List, Literal
 
 router = APIRouter()
 
-@router.post("/upload_file")
+# The form is parsed by the handler rather than declared as a File parameter, which FastAPI would
+# read to the end before the handler runs, so oversized or unauthorized bodies are never spooled
+UPLOAD_FILE_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}}}}}}
+
+@router.post("/upload_file", openapi_extra=UPLOAD_FILE_BODY)
 async def upload_file(
     upload_reason: Literal["books", "profile"],
-    file: UploadFile = File(...),
+    request: Request,
     db: AsyncSession = Depends(get_db),
     token: str = _token_header
 ):
@@ -19,11 +31,101 @@ async def upload_file(
     if not await is_admin(db, current_user_id):
         raise HTTPException(status_code=403, detail="Not authorized to perform this action")
     
-    # Generate a unique S3 key (filename) and
-    s3_key = f"{upload_reason}/{current_user_id}_{file.filename}"
-    file_url = await upload_file_to_s3(file.file, "bookreviewapp", s3_key)
+    # Reject bodies over the limit on their announced length, before reading any of it
+    content_length = request.headers.get("content-length")
+    if content_length is None:
+        raise HTTPException(status_code=411, detail="Content-Length is required")
+    if not content_length.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+    async with request.form(max_files=1) as form:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=422, detail="A file is required")
+        # The file is stored under the hash of its content, keeping only a plain extension of its name
+        extension = file_extension(file.filename)
+        chunks = iter_upload(file, MAX_UPLOAD_BYTES)
+        # Book covers are kept in memory as they are stored, to render their variants afterwards
+        content = bytearray() if upload_reason == "books" else None
+        if content is not None:
+            chunks = tee_chunks(chunks, content)
+        stored = await content_storage.save(upload_reason, chunks, file.content_type, extension)
+    variants = None
+    if content is not None:
+        variants = await store_cover_variants(stored.key, bytes(content), reuse=not stored.created)
+    return {"msg": "file uploaded successfully",
+            "file_url": stored.url,
+            "sha256": stored.sha256,
+            "deduplicated": not stored.created,
+            "variants": variants}
+
+@router.post("/upload_url")
+async def create_upload_url(
+    upload: schemas.UploadRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    token: str = _token_header
+):
+    current_user_id = await get_current_user_id(token, db)
+    if not await is_admin(db, current_user_id):
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File is too large")
+
+    # The client sends the file straight to the storage, under the hash it announced
+    sha256 = upload.sha256.lower()
+    key = content_key(upload.upload_reason, sha256, file_extension(upload.filename))
+    upload_token = create_upload_token(key, upload.size, sha256, upload.content_type)
+    deduplicated = await content_storage.has(key, verify=True)
+    target = None
+    if not deduplicated:
+        target = content_storage.backend.presign_upload(key, upload.size, sha256, upload.content_type)
+        if target is None:
+            # The local storage receives the file itself, on a URL authorized by the upload token
+            headers = {"Content-Type": upload.content_type} if upload.content_type else {}
+            target = {"method": "PUT",
+                      "url": str(request.url_for("receive_upload", upload_token=upload_token)),
+                      "headers": headers}
+    return {"upload_token": upload_token,
+            "file_url": content_storage.url_for(key),
+            "deduplicated": deduplicated,
+            "upload": target}
+
+@router.put("/uploads/{upload_token}", name="receive_upload")
+async def receive_upload(upload_token: str, request: Request):
+    if not isinstance(content_storage.backend, LocalStorage):
+        raise HTTPException(status_code=404, detail="Upload the file to its presigned URL")
+    upload = decode_upload_token(upload_token)
+    # The body is checked against the announced size and hash as it is written
+    chunks = verify_chunks(request.stream(), upload["size"], upload["sha256"])
+    await content_storage.save_key(upload["key"], chunks, upload["content_type"])
+    return {"msg": "file uploaded successfully"}
+
+@router.post("/upload_complete")
+async def complete_upload(
+    upload: schemas.UploadComplete,
+    db: AsyncSession = Depends(get_db),
+    token: str = _token_header
+):
+    current_user_id = await get_current_user_id(token, db)
+    if not await is_admin(db, current_user_id):
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    payload = decode_upload_token(upload.upload_token)
+    key = payload["key"]
+    # S3 only stores content matching the signed length and checksum, and the local storage
+    # checks it on receipt, so a stored object is the announced one
+    if not await content_storage.has(key, verify=True):
+        raise HTTPException(status_code=409, detail="File has not been uploaded")
+    variants = None
+    if key.startswith("books/"):
+        variants = await stored_cover_variants(key)
+        if variants is None:
+            variants = await store_cover_variants(key, await content_storage.backend.read(key))
     return {"msg": "file uploaded successfully",
-            "file_url": file_url}
+            "file_url": content_storage.url_for(key),
+            "sha256": payload["sha256"],
+            "variants": variants}
 
 @router.post("/", response_model=schemas.UserResponse)
 async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
@@ -33,8 +135,23 @@ async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_d
 async def update_user(user_id: int, user: schemas.UserUpdate, db: AsyncSession = Depends(get_db)):
     return await crud.update_user(db, user_id, user)
 
+@router.get("/batch", response_model=schemas.UserBatchResponse)
+async def get_users_by_ids(
+    request: Request,
+    ids: List[int] = Depends(batch_ids),
+    db: AsyncSession = Depends(get_shared_read_db)
+):
+    cached = response_cache.get(cache_key(request))
+    if cached is None:
+        since = response_cache.generation
+        users = await crud.get_users_by_ids(db, ids)
+        # Every write of a user, its creation included, drops the lookups of its id
+        cached = response_cache.store(cache_key(request), users, [user_tag(user_id) for user_id in ids],
+                                      since=since)
+    return conditional_response(request, cached)
+
 @router.get("/{user_id}", response_model=schemas.UserResponse)
-async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_read_db)):
     user = await crud.get_user(db, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -50,7 +167,7 @@ async def add_user_role(user_id: int, role: str, db: AsyncSession = Depends(get_
 @router.post("/login")
 async def login(user: schemas.UserLogin, db: AsyncSession = Depends(get_db)):
     db_user = await crud.get_user_from_email(db, user.email)
-    if db_user is None or not verify_password(user.password, db_user.password):
+    if db_user is None or not await verify_password_async(user.password, db_user.password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     if not db_user.account_status:
         raise HTTPException(status_code=401, detail="Account is deactivated")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Literal, Optional
 
 class UserCreate(BaseModel):
     full_name: str
@@ -23,6 +23,15 @@ class UserResponse(BaseModel):
     class Config:
         orm_mode = True
     
+class PublicUserResponse(BaseModel):
+    id: int
+    display_name: str
+    account_status: bool
+
+class UserBatchResponse(BaseModel):
+    users: List[PublicUserResponse]
+    missing: List[int]
+
 class CurrentUser(UserResponse):
     role: str
 
@@ -41,4 +50,15 @@ class UserRoleInDB(UserRoleBase):
     id: int
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class UploadRequest(BaseModel):
+    upload_reason: Literal["books", "profile"]
+    filename: str
+    content_type: Optional[str] = None
+    size: int = Field(gt=0)
+    # Hex SHA-256 hash of the content, computed by the client
+    sha256: str = Field(pattern="^[0-9a-fA-F]{64}$")
+
+class UploadComplete(BaseModel):
+    upload_token: str
@@ -1,4 +1,8 @@
+import hashlib
+import io
+import os
 import requests
+from PIL import Image
 
 BASE_URL = "http://localhost:8001"
 
@@ -90,3 +94,187 @@ def test_user_j_delete_users():
 
     response = requests.delete(f"{BASE_URL}/users/{user_a_id}", headers={"x-access-token": user_a_token})
     assert response.status_code == 200
+
+def test_user_k_deleted_user_token_rejected():
+    # The deleted user must not be served from the principal cache
+    response = requests.get(f"{BASE_URL}/users/me/", headers={"x-access-token": user_a_token})
+    assert response.status_code == 404
+
+def test_user_l_upload_file_not_admin():
+    response = requests.post(f"{BASE_URL}/users/", json={
+        "full_name": "User U",
+        "display_name": "userU",
+        "password": "passwordU",
+        "email": "userU@example.com"
+    })
+    assert response.status_code == 200
+    user_u_id = response.json()["id"]
+    response = requests.post(f"{BASE_URL}/users/login", json={
+        "email": "userU@example.com",
+        "password": "passwordU"
+    })
+    user_u_token = response.json()["access_token"]
+    response = requests.post(f"{BASE_URL}/users/upload_file", params={"upload_reason": "books"},
+                             files={"file": ("cover.png", b"not really a png", "image/png")},
+                             headers={"x-access-token": user_u_token})
+    assert response.status_code == 403
+    response = requests.delete(f"{BASE_URL}/users/{user_u_id}", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+
+def test_user_m_upload_file_too_large():
+    response = requests.post(f"{BASE_URL}/users/upload_file", params={"upload_reason": "books"},
+                             files={"file": ("cover.png", b"0" * (10 * 1024 * 1024 + 1), "image/png")},
+                             headers={"x-access-token": admin_token})
+    assert response.status_code == 413
+
+def test_user_n_batch_lookup():
+    user_ids = []
+    for name in ("BatchA", "BatchB"):
+        response = requests.post(f"{BASE_URL}/users/", json={
+            "full_name": f"User {name}",
+            "display_name": f"user{name}",
+            "password": f"password{name}",
+            "email": f"user{name}@example.com"
+        })
+        assert response.status_code == 200
+        user_ids.append(response.json()["id"])
+    response = requests.post(f"{BASE_URL}/users/{user_ids[1]}/deactivate", headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+
+    # Request order is kept, repeats dropped and unknown ids reported
+    ids = [user_ids[1], 999999999, user_ids[0], user_ids[1]]
+    response = requests.get(f"{BASE_URL}/users/batch", params={"ids": ",".join(map(str, ids))})
+    assert response.status_code == 200
+    body = response.json()
+    assert [user["id"] for user in body["users"]] == [user_ids[1], user_ids[0]]
+    assert body["users"][0]["display_name"] == "Unknown user"
+    assert body["users"][1] == {"id": user_ids[0], "display_name": "userBatchA", "account_status": True}
+    assert body["missing"] == [999999999]
+
+    assert requests.get(f"{BASE_URL}/users/batch", params={"ids": "1,x"}).status_code == 422
+    assert requests.get(f"{BASE_URL}/users/batch", params={"ids": ""}).status_code == 422
+    assert requests.get(f"{BASE_URL}/users/batch",
+                        params={"ids": ",".join(map(str, range(1, 1000)))}).status_code == 422
+
+    for user_id in user_ids:
+        response = requests.delete(f"{BASE_URL}/users/{user_id}", headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+    response = requests.get(f"{BASE_URL}/users/batch", params={"ids": str(user_ids[0])})
+    assert response.json() == {"users": [], "missing": [user_ids[0]]}
+
+def test_user_o_upload_url_too_large():
+    response = requests.post(f"{BASE_URL}/users/upload_url", json={
+        "upload_reason": "books",
+        "filename": "cover.png",
+        "content_type": "image/png",
+        "size": 10 * 1024 * 1024 + 1,
+        "sha256": "0" * 64
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 413
+
+def test_user_p_upload_complete_invalid_token():
+    # An access token does not authorize an upload
+    response = requests.post(f"{BASE_URL}/users/upload_complete", json={"upload_token": admin_token},
+                             headers={"x-access-token": admin_token})
+    assert response.status_code == 401
+    response = requests.put(f"{BASE_URL}/users/uploads/{admin_token}", data=b"not really a png")
+    assert response.status_code in (401, 404)
+
+def cover_image(fmt: str, size: tuple, mode: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 40, 40, 128)[:len(mode)]).save(buffer, fmt)
+    return buffer.getvalue()
+
+def test_user_q_upload_cover_variants(local_storage):
+    # A portrait JPEG and a landscape PNG with transparency
+    for filename, data, size in (("cover.jpg", cover_image("JPEG", (1200, 1600), "RGB"), (1200, 1600)),
+                                 ("cover.png", cover_image("PNG", (1500, 1000), "RGBA"), (1500, 1000))):
+        response = requests.post(f"{BASE_URL}/users/upload_file", params={"upload_reason": "books"},
+                                 files={"file": (filename, data, "image/" + filename.split(".")[1])},
+                                 headers={"x-access-token": admin_token})
+        assert response.status_code == 200
+        variants = response.json()["variants"]
+        assert set(variants) == {"thumbnail", "medium"}
+        for variant_size, width in (("thumbnail", 320), ("medium", 960)):
+            assert set(variants[variant_size]) <= {"avif", "webp", "jpeg"}
+            assert {"webp", "jpeg"} <= set(variants[variant_size])
+            for fmt, url in variants[variant_size].items():
+                response = requests.get(local_storage(url))
+                assert response.status_code == 200
+                image = Image.open(io.BytesIO(response.content))
+                assert image.format == fmt.upper()
+                # Resized to the width, keeping the aspect ratio
+                assert image.width == width
+                assert abs(image.height - width * size[1] / size[0]) <= 1
+                # Transparency is kept, except in JPEG which is flattened
+                assert (image.mode == "RGBA") == (filename.endswith(".png") and fmt != "jpeg")
+
+def test_user_r_upload_file_deduplicated(local_storage):
+    data = cover_image("JPEG", (640, 480), "RGB")
+    responses = [requests.post(f"{BASE_URL}/users/upload_file", params={"upload_reason": "books"},
+                               files={"file": ("same.jpg", data, "image/jpeg")},
+                               headers={"x-access-token": admin_token}) for _ in range(2)]
+    assert [response.status_code for response in responses] == [200, 200]
+    first, second = [response.json() for response in responses]
+    # The second upload of identical bytes writes nothing and returns the stored file and covers
+    assert second["deduplicated"] is True
+    assert second["sha256"] == first["sha256"]
+    assert second["file_url"] == first["file_url"]
+    assert second["variants"] == first["variants"]
+    assert requests.get(local_storage(second["file_url"])).content == data
+
+def announce_upload(data: bytes, upload_reason: str, filename: str, content_type: str = None):
+    response = requests.post(f"{BASE_URL}/users/upload_url", json={
+        "upload_reason": upload_reason,
+        "filename": filename,
+        "content_type": content_type,
+        "size": len(data),
+        "sha256": hashlib.sha256(data).hexdigest()
+    }, headers={"x-access-token": admin_token})
+    assert response.status_code == 200
+    return response.json()
+
+def complete_upload(upload_token: str):
+    return requests.post(f"{BASE_URL}/users/upload_complete", json={"upload_token": upload_token},
+                         headers={"x-access-token": admin_token})
+
+def test_user_s_direct_upload(local_storage):
+    # Random pixels, so the cover is new on every run
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (400, 300), os.urandom(400 * 300 * 3)).save(buffer, "PNG")
+    data = buffer.getvalue()
+    created = announce_upload(data, "books", "direct.png", "image/png")
+    assert created["deduplicated"] is False
+    # Completing before the file is sent is refused
+    assert complete_upload(created["upload_token"]).status_code == 409
+
+    upload = created["upload"]
+    response = requests.request(upload["method"], upload["url"], data=data, headers=upload["headers"])
+    assert response.status_code == 200
+    response = complete_upload(created["upload_token"])
+    assert response.status_code == 200
+    completed = response.json()
+    assert completed["file_url"] == created["file_url"]
+    assert completed["sha256"] == hashlib.sha256(data).hexdigest()
+    assert set(completed["variants"]) == {"thumbnail", "medium"}
+    assert requests.get(local_storage(completed["file_url"])).content == data
+
+    # Announcing the same file again needs no upload and returns the stored covers
+    again = announce_upload(data, "books", "direct.png", "image/png")
+    assert again["deduplicated"] is True
+    assert again["upload"] is None
+    assert again["file_url"] == created["file_url"]
+    response = complete_upload(again["upload_token"])
+    assert response.status_code == 200
+    assert response.json()["variants"] == completed["variants"]
+
+def test_user_t_direct_upload_mismatch(local_storage):
+    data = os.urandom(1024)
+    created = announce_upload(data, "profile", "notes.txt")
+    upload = created["upload"]
+    # Other bytes than announced, or fewer of them, are not stored
+    tampered = bytes([data[0] ^ 1]) + data[1:]
+    for body in (tampered, data[:-1]):
+        response = requests.request(upload["method"], upload["url"], data=body, headers=upload["headers"])
+        assert response.status_code == 422
+    assert complete_upload(created["upload_token"]).status_code == 409
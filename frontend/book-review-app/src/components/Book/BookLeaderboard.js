@@ -0,0 +1,41 @@
+import React, { useEffect, useState } from "react";
+import { ListGroup } from "react-bootstrap";
+import { Link } from "react-router-dom";
+import { getLeaderboard } from "../../services/bookService";
+import "../common.css";
+
+function BookLeaderboard({ board, title, genre = null }) {
+  const [books, setBooks] = useState([]);
+
+  useEffect(() => {
+    const fetchLeaderboard = async () => {
+      try {
+        setBooks(await getLeaderboard(board, 5, genre));
+      } catch (error) {
+        console.error(`Failed to fetch the ${board} books:`, error);
+      }
+    };
+
+    fetchLeaderboard();
+  }, [board, genre]);
+
+  if (books.length === 0) {
+    return null;
+  }
+
+  return (
+    <>
+      <h5>{title}</h5>
+      <ListGroup as="ol" numbered className="mb-4">
+        {books.map((book) => (
+          <ListGroup.Item as="li" key={book.id}>
+            <Link to={`/books/${book.id}`}>{book.title}</Link>
+            <small className="text-muted"> by {book.author}</small>
+          </ListGroup.Item>
+        ))}
+      </ListGroup>
+    </>
+  );
+}
+
+export default BookLeaderboard;
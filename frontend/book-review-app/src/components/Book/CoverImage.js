@@ -0,0 +1,36 @@
+import React from "react";
+import { Card } from "react-bootstrap";
+
+// Formats of the cover variants, best compressed first, the last one decoded by every browser
+const SOURCE_TYPES = { avif: "image/avif", webp: "image/webp" };
+
+/**
+ * Returns the URL of a book's cover at a size, the JPEG variant or else the original upload
+ *
+ * @param {object} book - The book, with its book_url and cover_variants
+ * @param {string} size - "thumbnail" or "medium"
+ * @returns {string} - The URL of the image
+ */
+export const coverUrl = (book, size) => book.cover_variants?.[size]?.jpeg || book.book_url;
+
+function CoverImage({ book, size, className }) {
+  const variants = book.cover_variants?.[size] || {};
+  return (
+    <picture>
+      {Object.entries(SOURCE_TYPES)
+        .filter(([format]) => variants[format])
+        .map(([format, type]) => (
+          <source key={format} srcSet={variants[format]} type={type} />
+        ))}
+      <Card.Img
+        variant="top"
+        src={coverUrl(book, size)}
+        alt={book.title}
+        loading="lazy"
+        className={className}
+      />
+    </picture>
+  );
+}
+
+export default CoverImage;
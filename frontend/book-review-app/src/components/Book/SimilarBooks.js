@@ -0,0 +1,42 @@
+import React, { useEffect, useState } from "react";
+import { ListGroup } from "react-bootstrap";
+import { Link } from "react-router-dom";
+import { getSimilarBooks } from "../../services/bookService";
+import "../common.css";
+
+function SimilarBooks({ book_id }) {
+  const [books, setBooks] = useState([]);
+
+  useEffect(() => {
+    const fetchSimilarBooks = async () => {
+      try {
+        setBooks(await getSimilarBooks(book_id));
+      } catch (error) {
+        console.error("Failed to fetch similar books:", error);
+      }
+    };
+
+    fetchSimilarBooks();
+  }, [book_id]);
+
+  if (books.length === 0) {
+    return null;
+  }
+
+  return (
+    <>
+      <hr />
+      <p>Readers who liked this also liked:</p>
+      <ListGroup>
+        {books.map((book) => (
+          <ListGroup.Item key={book.id}>
+            <Link to={`/books/${book.id}`}>{book.title}</Link>
+            <small className="text-muted"> by {book.author}</small>
+          </ListGroup.Item>
+        ))}
+      </ListGroup>
+    </>
+  );
+}
+
+export default SimilarBooks;
@@ -13,6 +13,7 @@ import {
 
 const RatingList = ({ book_id, setAlert }) => {
   const [reviews, setReviews] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const loggedInUserId = localStorage.getItem("user_id");
   const [userReviewed, setUserReviewed] = useState(false);
   const [showAddReview, setShowAddReview] = useState(false);
@@ -24,16 +25,19 @@ const RatingList = ({ book_id, setAlert }) => {
   });
   const [admin, setAdmin] = useState(false);
 
-  useEffect(() => {
-    const fetchReviews = async () => {
-      try {
-        const reviewsData = await getReviews(book_id);
-        setReviews(reviewsData);
-      } catch (error) {
-        console.error("Failed to fetch reviews:", error);
-      }
-    };
+  const fetchReviews = async (cursor = null) => {
+    try {
+      const page = await getReviews(book_id, cursor);
+      setReviews((previous) =>
+        cursor ? [...previous, ...page.reviews] : page.reviews
+      );
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Failed to fetch reviews:", error);
+    }
+  };
 
+  useEffect(() => {
     const checkUserReview = async () => {
       try {
         const review = await getUserReview(book_id);
@@ -148,6 +152,13 @@ const RatingList = ({ book_id, setAlert }) => {
       ) : (
         <p>No reviews yet. Be the first to add a review!</p>
       )}
+      {nextCursor && (
+        <div className="text-center mt-2">
+          <Button variant="outline-dark" onClick={() => fetchReviews(nextCursor)}>
+            Load More Reviews
+          </Button>
+        </div>
+      )}
 
       <UpdateReview
         book_id={book_id}
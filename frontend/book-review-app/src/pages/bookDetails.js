@@ -5,6 +5,8 @@ import { getBookDetails, deleteBook } from "../services/bookService";
 import AlertMessage from "../components/AlertMessage";
 import { isAdmin } from "../services/userService";
 import RatingList from "../components/Rating/RatingList";
+import SimilarBooks from "../components/Book/SimilarBooks";
+import CoverImage, { coverUrl } from "../components/Book/CoverImage";
 import "../components/common.css";
 
 function BookDetails() {
@@ -74,13 +76,9 @@ function BookDetails() {
             <Card>
               <div
                 className="image-container"
-                style={{ backgroundImage: `url(${book.book_url})` }}
+                style={{ backgroundImage: `url(${coverUrl(book, "medium")})` }}
               >
-                <Card.Img
-                  variant="top"
-                  src={book.book_url}
-                  className="img-overlay"
-                />
+                <CoverImage book={book} size="medium" className="img-overlay" />
               </div>
               <Card.Body>
                 <Card.Title className="ms-2">{book.title}</Card.Title>
@@ -120,6 +118,7 @@ function BookDetails() {
                 <div>
                   <RatingList book_id={book.id} setAlert={setAlert} />
                 </div>
+                <SimilarBooks book_id={book.id} />
               </Card.Body>
             </Card>
           ) : (
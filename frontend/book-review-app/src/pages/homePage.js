@@ -1,5 +1,7 @@
 import React, { useEffect, useState } from "react";
+import { Row, Col } from "react-bootstrap";
 import BookGrid from "../components/Book/BookGrid";
+import BookLeaderboard from "../components/Book/BookLeaderboard";
 import { useNavigate } from "react-router-dom";
 import { getUser } from "../services/userService";
 
@@ -24,6 +26,14 @@ function HomePage() {
   }
   return (
     <div className="container mt-4">
+      <Row>
+        <Col md={6}>
+          <BookLeaderboard board="top" title="Top rated" />
+        </Col>
+        <Col md={6}>
+          <BookLeaderboard board="trending" title="Trending this week" />
+        </Col>
+      </Row>
       <BookGrid />
     </div>
   );
@@ -35,7 +35,9 @@ function UpdateBook() {
     const { name, value } = e.target;
     setBook((prevBook) => ({
       ...prevBook,
-      [name]: value
+      [name]: value,
+      // The resized covers belong to the previous image
+      ...(name === 'book_url' ? { cover_variants: null } : {})
     }));
   };
 
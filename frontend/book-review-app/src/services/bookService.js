@@ -5,6 +5,61 @@ import axios from "axios";
  */
 const API_URL = process.env.REACT_APP_API_URL;
 
+/**
+ * Returns the hex SHA-256 hash of a file, under which the API stores it
+ *
+ * @param {File} file - The file to hash
+ * @returns {Promise<string>} - A promise that resolves with the hash
+ */
+const sha256Hex = async (file) => {
+  const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, "0"))
+    .join("");
+};
+
+/**
+ * Uploads a book cover straight to the storage: the API hands out a presigned URL, the file
+ * is sent to it, then the API is told the upload is complete and renders the resized covers.
+ * Files the API already stores are not sent again.
+ *
+ * @param {File} file - The cover to upload
+ * @param {string} token - The access token of the admin
+ * @returns {Promise} - A promise that resolves with the file URL and the cover variants
+ */
+const uploadCover = async (file, token) => {
+  const config = {
+    headers: { "x-access-token": token },
+  };
+  const { data: target } = await axios.post(
+    `${API_URL}/users/upload_url`,
+    {
+      upload_reason: "books",
+      filename: file.name,
+      content_type: file.type || null,
+      size: file.size,
+      sha256: await sha256Hex(file),
+    },
+    config
+  );
+  if (target.upload) {
+    // Sent with the headers the URL was signed for, without the access token
+    await axios({
+      method: target.upload.method,
+      url: target.upload.url,
+      data: file,
+      headers: target.upload.headers,
+    });
+  }
+  const { data: uploaded } = await axios.post(
+    `${API_URL}/users/upload_complete`,
+    { upload_token: target.upload_token },
+    config
+  );
+  // Resized covers in modern formats, null when the file is not an image
+  return { fileUrl: uploaded.file_url, coverVariants: uploaded.variants };
+};
+
 /**
  * Adds a new book to the database
  *
@@ -14,25 +69,8 @@ const API_URL = process.env.REACT_APP_API_URL;
 export const addBook = async (bookDetails) => {
   const token = localStorage.getItem("token");
 
-  // Upload the file and get the URL
-  const formData = new FormData();
-  formData.append("file", bookDetails.file);
-
   try {
-    const uploadResponse = await axios.post(
-      `${API_URL}/users/upload_file?upload_reason=books`,
-      formData,
-      {
-        headers: {
-          "Content-Type": "multipart/form-data",
-          "x-access-token": token,
-        },
-      }
-    );
-    if (uploadResponse.status !== 200) {
-      throw new Error("File upload failed. Please try again.");
-    }
-    const fileUrl = uploadResponse.data.file_url;
+    const { fileUrl, coverVariants } = await uploadCover(bookDetails.file, token);
 
     // Create the book with the details and file URL
     const bookData = {
@@ -42,6 +80,7 @@ export const addBook = async (bookDetails) => {
       year_published: bookDetails.year_published,
       summary: bookDetails.summary,
       book_url: fileUrl,
+      cover_variants: coverVariants,
     };
 
     const config = {
@@ -75,19 +114,76 @@ export const getBookDetails = async (bookId) => {
 };
 
 /**
- * Retrieves a list of all books
+ * Retrieves many books in one request
  *
- * @returns {Promise} - A promise that resolves with the list of books
+ * @param {Array<number>} ids - The IDs of the books
+ * @returns {Promise} - A promise that resolves with the found books in the order of ids and the missing ids
  */
-export const getBooks = async () => {
+export const getBooksByIds = async (ids) => {
   const token = localStorage.getItem("token");
   const config = {
     headers: { "x-access-token": token },
+    params: { ids: ids.join(",") },
   };
-  const response = await axios.get(`${API_URL}/books`, config);
+  const response = await axios.get(`${API_URL}/books/batch`, config);
+  return response.data;
+};
+
+/**
+ * Retrieves the books most liked by the readers who liked a book
+ *
+ * @param {string} bookId - The ID of the book
+ * @param {number} limit - The number of books to retrieve
+ * @returns {Promise} - A promise that resolves with the similar books, most similar first
+ */
+export const getSimilarBooks = async (bookId, limit = 5) => {
+  const token = localStorage.getItem("token");
+  const config = {
+    headers: { "x-access-token": token },
+    params: { limit },
+  };
+  const response = await axios.get(`${API_URL}/books/${bookId}/similar`, config);
+  return response.data;
+};
+
+/**
+ * Retrieves a leaderboard of books
+ *
+ * @param {string} board - "top" for the top rated books, "trending" for the most reviewed lately
+ * @param {number} limit - The number of books to retrieve
+ * @param {string} genre - Restricts the leaderboard to a genre when given
+ * @returns {Promise} - A promise that resolves with the books and their scores, best first
+ */
+export const getLeaderboard = async (board, limit = 5, genre = null) => {
+  const token = localStorage.getItem("token");
+  const config = {
+    headers: { "x-access-token": token },
+    params: genre ? { limit, genre } : { limit },
+  };
+  const response = await axios.get(`${API_URL}/books/${board}`, config);
   return response.data;
 };
 
+/**
+ * Retrieves one page of books
+ *
+ * @param {string} cursor - The cursor returned with the previous page, if any
+ * @param {number} limit - The number of books to retrieve
+ * @returns {Promise} - A promise that resolves with the books and the cursor of the next page
+ */
+export const getBooks = async (cursor = null, limit = 24) => {
+  const token = localStorage.getItem("token");
+  const config = {
+    headers: { "x-access-token": token },
+    params: cursor ? { limit, cursor } : { limit },
+  };
+  const response = await axios.get(`${API_URL}/books`, config);
+  return {
+    books: response.data,
+    nextCursor: response.headers["x-next-cursor"] || null,
+  };
+};
+
 /**
  * Deletes a book by its ID
  *
@@ -21,18 +21,24 @@ export const addReview = async (reviewData) => {
 };
 
 /**
- * Retrieves a list of reviews for a specific book
+ * Retrieves one page of reviews for a specific book, newest first
  *
  * @param {string} bookId - The ID of the book to retrieve reviews for
- * @returns {Promise} - A promise that resolves with the list of reviews
+ * @param {string} cursor - The cursor returned with the previous page, if any
+ * @param {number} limit - The number of reviews to retrieve
+ * @returns {Promise} - A promise that resolves with the reviews and the cursor of the next page
  */
-export const getReviews = async (bookId) => {
+export const getReviews = async (bookId, cursor = null, limit = 20) => {
   const token = localStorage.getItem("token");
   const config = {
     headers: { "x-access-token": token },
+    params: cursor ? { limit, cursor } : { limit },
   };
   const response = await axios.get(`${API_URL}/reviews/book/${bookId}`, config);
-  return response.data;
+  return {
+    reviews: response.data,
+    nextCursor: response.headers["x-next-cursor"] || null,
+  };
 };
 
 /**
@@ -43,8 +49,10 @@ export const getReviews = async (bookId) => {
  */
 export const getUserReview = async (bookId) => {
   const token = localStorage.getItem("token");
+  const userId = localStorage.getItem("user_id");
   const config = {
     headers: { "x-access-token": token },
+    params: { user_id: userId, limit: 1 },
   };
 
   try {
@@ -52,14 +60,8 @@ export const getUserReview = async (bookId) => {
       `${API_URL}/reviews/book/${bookId}`,
       config
     );
-    const reviews = response.data;
-    const userId = localStorage.getItem("user_id");
-    console.log(userId);
-    // Check if the user has already reviewed this book
-    const userReviewExists = reviews.some(
-      (review) => review.user_id === parseInt(userId, 10)
-    );
-    return userReviewExists;
+    // Only the user's own review can match
+    return response.data.length > 0;
   } catch (error) {
     console.error("Failed to fetch user review:", error);
     return false;
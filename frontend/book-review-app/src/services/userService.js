@@ -73,6 +73,16 @@ export const getUserDetails = async () => {
   return userDetails;
 };
 
+/**
+ * Retrieves the public details of many users in one request
+ *
+ * @param {Array<number>} ids - The IDs of the users
+ * @returns {Promise} - A promise that resolves with the found users in the order of ids and the missing ids
+ */
+export const getUsersByIds = async (ids) => {
+  return fetchData(`/users/batch?ids=${ids.join(",")}`);
+};
+
 /**
  * Updates a user's details
  *